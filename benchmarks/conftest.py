@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+
+import json
+import os
+import platform
+import random
+import sys
+import time
+
+import pytest
+from paramiko.sftp import SFTP_FAILURE, SFTP_OK
+from pytest_sftpserver.sftp.interface import VirtualSFTPHandle
+
+from ftp_loader import loader
+
+
+PATTERN = b'ftp-loader benchmark data: 0123456789 abcdefghijklmnopqrstuvwxyz\n'
+BLOCK = 64 * 1024
+
+
+def pytest_addoption(parser):
+    group = parser.getgroup('benchmarks')
+    group.addoption(
+        '--bench-sizes', default='64K,4M',
+        help='Comma separated sizes of codec benchmark files, e.g. 64K,4M,64M.'
+    )
+    group.addoption(
+        '--bench-transfer-size', default='1M',
+        help='Size of every file in transfer benchmarks.'
+    )
+    group.addoption(
+        '--bench-files', default=8, type=int,
+        help='Number of files in transfer benchmarks.'
+    )
+    group.addoption(
+        '--bench-output', default='benchmark-results.json',
+        help='File to save machine-readable results.'
+    )
+
+
+def pytest_generate_tests(metafunc):
+    if 'size' in metafunc.fixturenames:
+        sizes = metafunc.config.getoption('bench_sizes').split(',')
+        metafunc.parametrize('size', [loader.parse_size(s) for s in sizes], ids=sizes)
+
+
+def generate_data(size, compressibility=0.5, seed=0):
+    """Generates synthetic data.
+
+    Parameters
+    ----------
+    size : int
+        Size of data in bytes.
+    compressibility : float
+        Fraction of every block filled with repeated text. The rest is random.
+        0 - incompressible data, 1 - highly compressible.
+    seed : int
+        Seed of random generator.
+
+    Returns
+    -------
+    data : bytes
+        Generated data.
+    """
+    rnd = random.Random(seed)
+    text = PATTERN * (BLOCK // len(PATTERN) + 1)
+    blocks = []
+    for start in range(0, size, BLOCK):
+        length = min(BLOCK, size - start)
+        n_text = int(length * compressibility)
+        n_rand = length - n_text
+        noise = rnd.getrandbits(8 * n_rand).to_bytes(n_rand, 'little') if n_rand else b''
+        blocks.append(text[:n_text] + noise)
+    return b''.join(blocks)
+
+
+class Timer:
+    """Measures wall time of the block."""
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.seconds = time.perf_counter() - self.start
+
+
+@pytest.fixture(scope='session')
+def bench_results(request):
+    results = []
+    yield results
+    report = {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': sys.version.split()[0],
+            'platform': platform.platform(),
+            'machine': platform.machine(),
+            'cpu_count': os.cpu_count(),
+        },
+        'results': results
+    }
+    filename = request.config.getoption('bench_output')
+    with open(filename, 'w') as f:
+        json.dump(report, f, indent=2)
+
+
+@pytest.fixture
+def record(bench_results):
+    def record(benchmark, size, seconds, **params):
+        entry = {
+            'benchmark': benchmark, 'size': size, 'seconds': seconds,
+            'mb_per_s': size / seconds / 1024 ** 2 if seconds else None
+        }
+        entry.update(params)
+        bench_results.append(entry)
+        print('  * {0} {1}: {2:.1f} MB/s'.format(benchmark, params, entry['mb_per_s'] or 0))
+        return entry
+    return record
+
+
+def _write(self, offset, data):
+    content = self.content_provider.get(self.path)
+    if content is None:
+        return SFTP_OK if self.content_provider.put(self.path, data) else SFTP_FAILURE
+    if isinstance(content, str):
+        content = content.encode()
+    if not isinstance(content, bytes):
+        return SFTP_FAILURE
+    if offset > len(content):
+        content = content + b'\x00' * (offset - len(content))
+    content = content[:offset] + data + content[offset + len(data):]
+    return SFTP_OK if self.content_provider.put(self.path, content) else SFTP_FAILURE
+
+
+@pytest.fixture
+def sftp_standin(sftpserver, monkeypatch):
+    """In-process SFTP server. The virtual handle of pytest-sftpserver
+    refuses to append to bytes content, so files larger than one SFTP
+    request could not be uploaded without this patch.
+    """
+    monkeypatch.setattr(VirtualSFTPHandle, 'write', _write)
+    return sftpserver
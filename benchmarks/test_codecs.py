@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+
+from ftp_loader import loader
+from benchmarks.conftest import generate_data, Timer
+
+
+@pytest.mark.parametrize('threads', [1, 4])
+@pytest.mark.parametrize('compressibility', [0.0, 0.5, 0.9])
+@pytest.mark.parametrize('arch', sorted(loader.ARCHIVATORS.keys()))
+def test_codec(tmp_path, record, arch, size, compressibility, threads):
+    try:
+        loader.get_archivator(arch)
+    except loader.LoaderException:
+        pytest.skip('{0} archivator is not installed'.format(arch))
+    if threads > 1 and arch not in loader.PARALLEL_ARCHIVES + ('zst',):
+        pytest.skip('{0} archives are compressed in one thread'.format(arch))
+    ft = loader.FileTransfer('data.bin', tmp_path, 'remote', arch=arch)
+    data_file = tmp_path / ft.name
+    data = generate_data(size, compressibility)
+    data_file.write_bytes(data)
+
+    with Timer() as t:
+        ft.compress(False, threads=threads)
+    arch_size = (tmp_path / ft.arch_name).stat().st_size
+    params = {
+        'arch': arch, 'compressibility': compressibility, 'threads': threads,
+        'ratio': size / arch_size
+    }
+    record('compress', size, t.seconds, **params)
+
+    data_file.unlink()
+    with Timer() as t:
+        ft.decompress(False, False)
+    record('decompress', size, t.seconds, **params)
+    assert data_file.read_bytes() == data
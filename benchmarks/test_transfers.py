@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+from pysftp import CnOpts
+
+from ftp_loader import loader
+from ftp_loader.main import download_data, upload_data
+from benchmarks.conftest import generate_data, Timer
+
+
+def _engine(engine):
+    if engine == 'sync':
+        return download_data, upload_data, {'cnopts': _cnopts()}
+    aio = pytest.importorskip('ftp_loader.aio')
+    if aio.asyncssh is None:
+        pytest.skip('asyncssh is not installed')
+    return aio.download_data, aio.upload_data, {'known_hosts': None}
+
+
+def _cnopts():
+    cnopts = CnOpts()
+    cnopts.hostkeys = None
+    return cnopts
+
+
+def _file_transfers(path, n_files):
+    return [
+        loader.FileTransfer('file{0}.bin'.format(i), path, 'bench/data')
+        for i in range(n_files)
+    ]
+
+
+@pytest.fixture
+def transfer_params(request):
+    size = loader.parse_size(request.config.getoption('bench_transfer_size'))
+    return size, request.config.getoption('bench_files')
+
+
+@pytest.mark.parametrize('engine, jobs', [('sync', 1), ('sync', 4), ('async', 4), ('async', 16)])
+def test_download(sftp_standin, tmp_path, record, transfer_params, engine, jobs):
+    download, _, options = _engine(engine)
+    size, n_files = transfer_params
+    data = generate_data(size, 0.0)
+    file_trans = _file_transfers(tmp_path, n_files)
+    content = {'bench': {'data': {ft.name: data for ft in file_trans}}}
+    with sftp_standin.serve_content(content):
+        with Timer() as t:
+            done = download(
+                'localhost', 'user', 'passwd', file_trans, False, jobs,
+                port=sftp_standin.port, **options
+            )
+    assert len(done) == n_files
+    record(
+        'download', size * n_files, t.seconds, engine=engine, jobs=jobs,
+        files=n_files, latency=t.seconds / n_files
+    )
+
+
+@pytest.mark.parametrize('engine, jobs', [('sync', 1), ('sync', 4), ('async', 4), ('async', 16)])
+def test_upload(sftp_standin, tmp_path, record, transfer_params, engine, jobs):
+    _, upload, options = _engine(engine)
+    size, n_files = transfer_params
+    data = generate_data(size, 0.0)
+    file_trans = _file_transfers(tmp_path, n_files)
+    for ft in file_trans:
+        (tmp_path / ft.name).write_bytes(data)
+    with sftp_standin.serve_content({'bench': {}}):
+        with Timer() as t:
+            upload(
+                'localhost', 'user', 'passwd', file_trans, False, jobs,
+                port=sftp_standin.port, **options
+            )
+        assert sftp_standin.content_provider.get('bench/data/file0.bin') == data
+    record(
+        'upload', size * n_files, t.seconds, engine=engine, jobs=jobs,
+        files=n_files, latency=t.seconds / n_files
+    )
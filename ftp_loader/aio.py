@@ -0,0 +1,292 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+import time
+
+try:
+    import asyncssh
+except ImportError:
+    asyncssh = None
+
+from . import loader, stats
+from .loader import LoaderException, ErrorCode, CHUNK_SIZE, PART_SUFFIX, STAMP_SUFFIX
+from .loader import hash_stream, source_stamp
+
+
+ASYNC_JOBS = 64
+COMPRESSION_ALGS = ['zlib@openssh.com', 'zlib']
+
+
+def connect_options(transport):
+    """Converts transport options to arguments of asyncssh.connect."""
+    options = {}
+    if transport.get('window_size'):
+        options['window'] = transport['window_size']
+    if transport.get('max_packet_size'):
+        options['max_pktsize'] = transport['max_packet_size']
+    if transport.get('ciphers'):
+        options['encryption_algs'] = transport['ciphers']
+    if 'compression' in transport:
+        options['compression_algs'] = COMPRESSION_ALGS if transport['compression'] else ['none']
+    return options
+
+
+def file_options(transport):
+    """Converts transport options to arguments of SFTPClient.open.
+
+    Reads of a chunk are split into requests of request_size, and
+    prefetch_requests of them are sent in parallel. Without prefetch the
+    requests are sent one by one.
+    """
+    options = {}
+    if transport.get('request_size'):
+        options['block_size'] = transport['request_size']
+    if not transport.get('prefetch', True):
+        options['max_requests'] = 1
+    elif transport.get('prefetch_requests'):
+        options['max_requests'] = transport['prefetch_requests']
+    return options
+
+
+async def _throttle(limiter, size):
+    if limiter:
+        await asyncio.sleep(limiter.reserve(size))
+
+
+async def _remote_digest(sftp, ft):
+    if not ft.checksum or ft.digest:
+        return ft.digest
+    sidecar = str(ft.remote_path / ft.sidecar_name)
+    if not await sftp.exists(sidecar):
+        return None
+    async with sftp.open(sidecar, 'rb') as f:
+        text = (await f.read()).decode()
+    return text.split()[0] if text.strip() else None
+
+
+async def _save_digest(sftp, ft):
+    if not ft.checksum or not ft.digest:
+        return
+    sidecar = str(ft.remote_path / ft.sidecar_name)
+    if await sftp.exists(sidecar):
+        await sftp.remove(sidecar)
+    async with sftp.open(sidecar, 'wb') as f:
+        await f.write('{0}  {1}\n'.format(ft.digest, ft.arch_name).encode())
+
+
+async def _resume_offset(fsrc, part_file, src_size):
+    # Async version of loader.resume_offset.
+    part_size = part_file.stat().st_size
+    if part_size > src_size:
+        return 0
+    start = max(0, part_size - loader.RESUME_CHECK_SIZE)
+    with open(part_file, 'rb') as fpart:
+        fpart.seek(start)
+        tail = fpart.read(part_size - start)
+    if await fsrc.read(part_size - start, start) != tail:
+        return 0
+    return part_size
+
+
+async def download_file(sftp, ft, skip_existing=True, chunk_size=CHUNK_SIZE, limiter=None,
+                        transport=None):
+    """Downloads file from the FTP. Async version of FileTransfer.download.
+
+    Partial files are resumed like by the sync engine.
+
+    Parameters
+    ----------
+    sftp : asyncssh.SFTPClient
+        SFTP client.
+    ft : FileTransfer
+        File to be downloaded.
+    skip_existing : bool
+        To skip already existing files. Default: True.
+    chunk_size : int
+        Size of data chunk. Default: CHUNK_SIZE.
+    limiter : RateLimiter
+        Limiter of transfer rate. Default: None.
+    transport : dict
+        Transport options. Default: None.
+    """
+    dst_file = ft.local_path / ft.arch_name
+    src_file = str(ft.remote_path / ft.arch_name)
+    part_file = dst_file.with_name(dst_file.name + PART_SUFFIX)
+    stamp_file = dst_file.with_name(dst_file.name + STAMP_SUFFIX)
+    if not await sftp.exists(src_file):
+        message = "  ! Remote file {0} does not exist. {1}".format(src_file, 'Nothing to download...')
+        raise LoaderException(ErrorCode.REMOTE_FILE_NOT_EXISTS, message)
+    ft.check_local_or_remove(dst_file, skip_existing, "Skipping...")
+    ft.check_local_or_remove(ft.local_path / ft.name, skip_existing, "Skipping...")
+    ft.create_local_folder()
+    src_attr = await sftp.stat(src_file)
+    src_size = src_attr.size
+    stamp = source_stamp(src_size, src_attr.mtime)
+    hasher = ft.new_hasher()
+    async with sftp.open(src_file, 'rb', **file_options(transport or {})) as fsrc:
+        offset = 0
+        if part_file.exists() and stamp_file.exists() and stamp_file.read_text() == stamp:
+            offset = await _resume_offset(fsrc, part_file, src_size)
+        if not offset:
+            stamp_file.write_text(stamp)
+        ft.print_transfer('Downloading', src_file, offset)
+        if hasher and offset:
+            with open(part_file, 'rb') as fpart:
+                hash_stream(fpart, hasher, chunk_size)
+        fsrc.seek(offset)
+        with open(part_file, 'ab' if offset else 'wb') as fdst:
+            size = offset
+            while True:
+                chunk = await fsrc.read(chunk_size)
+                if not chunk:
+                    break
+                fdst.write(chunk)
+                size += len(chunk)
+                stats.progress(src_file, 'download', len(chunk), size)
+                if hasher:
+                    hasher.update(chunk)
+                await _throttle(limiter, len(chunk))
+    ft.check_size(part_file, part_file.stat().st_size, src_size)
+    stamp_file.unlink()
+    ft.verify(hasher, await _remote_digest(sftp, ft), src_file, part_file)
+    part_file.replace(dst_file)
+
+
+async def upload_file(sftp, ft, skip_existing=True, chunk_size=CHUNK_SIZE, limiter=None,
+                      transport=None):
+    """Uploads file to FTP. Async version of FileTransfer.upload.
+
+    Parameters
+    ----------
+    sftp : asyncssh.SFTPClient
+        SFTP client.
+    ft : FileTransfer
+        File to be uploaded.
+    skip_existing : bool
+        To skip already uploaded files. Default: True.
+    chunk_size : int
+        Size of data chunk. Default: CHUNK_SIZE.
+    limiter : RateLimiter
+        Limiter of transfer rate. Default: None.
+    transport : dict
+        Transport options. Default: None.
+    """
+    dst_file = str(ft.remote_path / ft.arch_name)
+    src_file = ft.local_path / ft.arch_name
+    part_file = dst_file + PART_SUFFIX
+    ft.check_local_file_exists(src_file, 'Nothing to upload...')
+    if await sftp.exists(dst_file):
+        if skip_existing:
+            message = "  * Remote file {0} already exists. {1}".format(dst_file, "Skipping...")
+            raise LoaderException(ErrorCode.REMOTE_ALREADY_EXISTS, message)
+        await sftp.remove(dst_file)
+    try:
+        await sftp.makedirs(str(ft.remote_path), exist_ok=True)
+    except asyncssh.SFTPError:
+        message = "Remote file {0} exists but folder is expected".format(ft.remote_path)
+        raise LoaderException(ErrorCode.REMOTE_NOT_A_FOLDER, message)
+    if await sftp.exists(part_file):
+        await sftp.remove(part_file)
+    ft.print_transfer('Uploading', src_file, 0)
+    hasher = ft.new_hasher()
+    with open(src_file, 'rb') as fsrc:
+        async with sftp.open(part_file, 'wb', **file_options(transport or {})) as fdst:
+            size = 0
+            for chunk in iter(lambda: fsrc.read(chunk_size), b''):
+                if hasher:
+                    hasher.update(chunk)
+                await _throttle(limiter, len(chunk))
+                await fdst.write(chunk)
+                size += len(chunk)
+                stats.progress(dst_file, 'upload', len(chunk), size)
+    ft.check_size(part_file, (await sftp.stat(part_file)).size, src_file.stat().st_size)
+    try:
+        ft.verify(hasher, ft.digest, src_file)
+    except LoaderException:
+        await sftp.remove(part_file)
+        raise
+    await sftp.rename(part_file, dst_file)
+    await _save_digest(sftp, ft)
+
+
+async def run_transfers(url, user, passwd, file_trans, action, jobs=ASYNC_JOBS, **kwargs):
+    """Runs transfer action for every file over a single SSH connection.
+
+    Parameters
+    ----------
+    url : str
+        Server's URL.
+    user, passwd : str
+        User's credentials.
+    file_trans : iterable[FileTransfer]
+        Files to be transferred.
+    action : coroutine function
+        Function action(sftp, ft) that performs the transfer.
+    jobs : int
+        The number of files transferred simultaneously. Default: ASYNC_JOBS.
+    kwargs : dict
+        Extra arguments for asyncssh.connect.
+
+    Returns
+    -------
+    done : list[FileTransfer]
+        Successfully transferred files in the order of file_trans.
+    """
+    if asyncssh is None:
+        raise ImportError('Async engine requires asyncssh package.')
+    # Workers take files from the shared iterator, so lazy file_trans is
+    # consumed as the transfers go and there is no task for every file.
+    items = enumerate(file_trans)
+    done = {}
+
+    async def worker(sftp):
+        for index, ft in items:
+            try:
+                await action(sftp, ft)
+                done[index] = ft
+            except LoaderException as e:
+                print(e.message)
+
+    async with asyncssh.connect(url, username=user, password=passwd, **kwargs) as conn:
+        async with conn.start_sftp_client() as sftp:
+            await asyncio.gather(*(worker(sftp) for _ in range(jobs)))
+    return [done[i] for i in sorted(done.keys())]
+
+
+def download_data(url, user, passwd, file_trans, skip_existing, jobs=ASYNC_JOBS,
+                  limiter=None, transport=None, **kwargs):
+    """Downloads files using asyncio engine.
+
+    Transport options are converted to arguments of asyncssh. Explicit
+    kwargs take precedence.
+
+    Returns
+    -------
+    downloaded : list[FileTransfer]
+        Successfully downloaded files.
+    """
+    async def action(sftp, ft):
+        start = time.time()
+        await download_file(sftp, ft, skip_existing, limiter=limiter, transport=transport)
+        stats.record(ft, 'download', start, time.time())
+
+    kwargs = dict(connect_options(transport or {}), **kwargs)
+    return asyncio.run(run_transfers(url, user, passwd, file_trans, action, jobs, **kwargs))
+
+
+def upload_data(url, user, passwd, file_trans, skip_existing, jobs=ASYNC_JOBS,
+                limiter=None, transport=None, **kwargs):
+    """Uploads files using asyncio engine.
+
+    Returns
+    -------
+    uploaded : list[FileTransfer]
+        Successfully uploaded files.
+    """
+    async def action(sftp, ft):
+        start = time.time()
+        await upload_file(sftp, ft, skip_existing, limiter=limiter, transport=transport)
+        stats.record(ft, 'upload', start, time.time())
+
+    kwargs = dict(connect_options(transport or {}), **kwargs)
+    return asyncio.run(run_transfers(url, user, passwd, file_trans, action, jobs, **kwargs))
@@ -0,0 +1,210 @@
+# -*- coding: utf-8 -*-
+
+import hashlib
+import os
+from pathlib import Path
+import shutil
+
+from .loader import PART_SUFFIX
+
+
+FICLONE = 0x40049409
+LINK_MODES = ('auto', 'reflink', 'hardlink', 'copy')
+DATA_NAME = 'data'
+EVICT_FRACTION = 0.9
+
+
+def cache_key(url, remote_file, attr):
+    """Calculates key of remote file in the cache.
+
+    Parameters
+    ----------
+    url : str
+        Server's URL.
+    remote_file : str
+        Path to the remote file.
+    attr : paramiko.SFTPAttributes
+        Attributes of the remote file.
+
+    Returns
+    -------
+    key : str
+        Hex digest of URL, path, size and modification time of the file.
+    """
+    source = '{0}:{1}:{2}:{3}'.format(url, remote_file, attr.st_size, attr.st_mtime)
+    return hashlib.sha256(source.encode()).hexdigest()
+
+
+def reflink(src, dst):
+    """Creates copy-on-write clone of the file (Linux only)."""
+    import fcntl
+    with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+        fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+
+
+def link_file(src, dst, mode='auto'):
+    """Creates dst file with the content of src.
+
+    Parameters
+    ----------
+    src, dst : Path
+        Source and destination files.
+    mode : str
+        reflink - copy-on-write clone, hardlink - hard link, copy - copy of
+        the data, auto - reflink or copy if the file system doesn't support
+        clones. Hard links share the data, so they are never chosen
+        automatically. Default: auto.
+    """
+    dst = Path(dst)
+    tmp_file = dst.with_name(dst.name + PART_SUFFIX)
+    modes = ['reflink', 'copy'] if mode == 'auto' else [mode]
+    for m in modes:
+        if tmp_file.exists():
+            tmp_file.unlink()
+        try:
+            if m == 'reflink':
+                reflink(src, tmp_file)
+            elif m == 'hardlink':
+                os.link(src, tmp_file)
+            else:
+                shutil.copyfile(src, tmp_file)
+            break
+        except (OSError, ImportError):
+            if m == modes[-1]:
+                if tmp_file.exists():
+                    tmp_file.unlink()
+                raise
+    tmp_file.replace(dst)
+
+
+class LocalCache:
+    """Content cache of downloaded and decompressed files.
+
+    The cache can be shared by several working copies. Every file is kept
+    in its own folder named by the key. Modification time of the folder
+    is the time of the last use, and the least recently used files are
+    evicted when the total size exceeds the limit. The total size is
+    counted once and then kept up to date by stored files, and the cache is
+    evicted to EVICT_FRACTION of the limit, so the folder is not scanned
+    for every stored file.
+
+    Parameters
+    ----------
+    path : str
+        Cache folder.
+    max_size : int
+        Size limit in bytes. Default: None - unlimited.
+    mode : str
+        How files are taken from and put to the cache: auto, reflink,
+        hardlink or copy. Default: auto. Hard links share the data with
+        the cache, so files must not be modified in place.
+    """
+    def __init__(self, path, max_size=None, mode='auto'):
+        self._path = Path(path)
+        self._max_size = max_size
+        self._mode = mode
+        self._size = None
+
+    @property
+    def path(self):
+        """Cache folder."""
+        return self._path
+
+    def _folder(self, key):
+        return self._path / 'objects' / key[:2] / key
+
+    def contains(self, key):
+        """Checks whether the file is in the cache."""
+        return (self._folder(key) / DATA_NAME).exists()
+
+    def restore(self, key, dst):
+        """Creates dst file from the cache.
+
+        Returns
+        -------
+        found : bool
+            Whether the file is in the cache.
+        """
+        folder = self._folder(key)
+        try:
+            link_file(folder / DATA_NAME, dst, self._mode)
+            os.utime(folder)
+        except OSError:
+            return False
+        return True
+
+    def store(self, key, src):
+        """Puts src file into the cache and evicts old files."""
+        folder = self._folder(key)
+        if (folder / DATA_NAME).exists():
+            os.utime(folder)
+            return
+        tmp_folder = folder.with_name('{0}.{1}{2}'.format(key, os.getpid(), PART_SUFFIX))
+        tmp_folder.mkdir(parents=True, exist_ok=True)
+        try:
+            link_file(src, tmp_folder / DATA_NAME, self._mode)
+            tmp_folder.replace(folder)
+        except OSError:
+            # The same file was stored by another process meanwhile.
+            shutil.rmtree(tmp_folder, ignore_errors=True)
+            return
+        if self._max_size is None:
+            return
+        if self._size is None:
+            self._size = sum(e[1] for e in self.entries())
+        else:
+            self._size += (folder / DATA_NAME).stat().st_size
+        if self._size > self._max_size:
+            self.evict(int(self._max_size * EVICT_FRACTION))
+
+    def entries(self):
+        """Gets cached files.
+
+        Returns
+        -------
+        entries : list[tuple]
+            (last use time, size, folder) of every cached file.
+        """
+        entries = []
+        objects = self._path / 'objects'
+        if not objects.is_dir():
+            return entries
+        for prefix in objects.iterdir():
+            for folder in prefix.iterdir():
+                if folder.name.endswith(PART_SUFFIX):
+                    continue
+                try:
+                    size = (folder / DATA_NAME).stat().st_size
+                    used = folder.stat().st_mtime
+                except OSError:
+                    continue
+                entries.append((used, size, folder))
+        return entries
+
+    def evict(self, max_size=None):
+        """Removes least recently used files until the cache fits the limit.
+
+        Parameters
+        ----------
+        max_size : int
+            Size limit. Default: None - the limit of the cache.
+
+        Returns
+        -------
+        removed : int
+            The number of removed files.
+        """
+        max_size = max_size if max_size is not None else self._max_size
+        if max_size is None:
+            return 0
+        entries = sorted(self.entries(), key=lambda e: e[0])
+        total = sum(e[1] for e in entries)
+        removed = 0
+        for used, size, folder in entries:
+            if total <= max_size:
+                break
+            shutil.rmtree(folder, ignore_errors=True)
+            total -= size
+            removed += 1
+        self._size = total
+        return removed
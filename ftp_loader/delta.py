@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+
+from contextlib import contextmanager
+import hashlib
+import json
+import mmap
+import os
+import zlib
+
+
+DELTA_BLOCK_SIZE = 64 * 1024
+SIGNATURE_SUFFIX = '.sig'
+SIGNATURE_VERSION = 1
+ADLER_MOD = 65521
+MAX_ROLLED_BYTES = 4 * 1024 * 1024
+
+
+def weak_checksum(data):
+    """Calculates Adler-32 checksum of the block. It can be rolled."""
+    return zlib.adler32(data)
+
+
+def roll_checksum(checksum, out_byte, in_byte, block_size):
+    """Moves Adler-32 checksum of a block by one byte.
+
+    Parameters
+    ----------
+    checksum : int
+        Checksum of the block.
+    out_byte : int
+        The first byte of the block which is dropped.
+    in_byte : int
+        The byte which follows the block and is appended.
+    block_size : int
+        Size of the block.
+
+    Returns
+    -------
+    checksum : int
+        Checksum of the block shifted by one byte.
+    """
+    a = checksum & 0xffff
+    b = checksum >> 16
+    a = (a - out_byte + in_byte) % ADLER_MOD
+    b = (b - block_size * out_byte + a - 1) % ADLER_MOD
+    return (b << 16) | a
+
+
+def strong_checksum(data):
+    """Calculates strong checksum of the block."""
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def block_signature(block):
+    """Gets (weak, strong) checksums of the block."""
+    return weak_checksum(block), strong_checksum(block)
+
+
+class Signature:
+    """Checksums of fixed size blocks of a file.
+
+    Signature of remote file is kept in the sidecar file with
+    SIGNATURE_SUFFIX. It lets to find blocks which are already present in
+    the local file and to transfer only changed blocks.
+
+    Parameters
+    ----------
+    block_size : int
+        Size of blocks. The last block can be shorter.
+    size : int
+        File size.
+    digest : str
+        SHA-256 hex digest of the whole file.
+    blocks : list[tuple]
+        (weak, strong) checksums of every block.
+    """
+    def __init__(self, block_size, size, digest, blocks):
+        self.block_size = block_size
+        self.size = size
+        self.digest = digest
+        self.blocks = [tuple(b) for b in blocks]
+
+    @classmethod
+    def from_file(cls, f, block_size=None):
+        """Calculates signature of file opened for reading in binary mode.
+
+        Parameters
+        ----------
+        f : file
+            File object.
+        block_size : int
+            Size of blocks. Default: None - DELTA_BLOCK_SIZE.
+        """
+        block_size = block_size or DELTA_BLOCK_SIZE
+        digest = hashlib.sha256()
+        blocks = []
+        size = 0
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+            blocks.append(block_signature(block))
+            size += len(block)
+        return cls(block_size, size, digest.hexdigest(), blocks)
+
+    @classmethod
+    def loads(cls, text):
+        """Creates signature from JSON text. None if the format is unknown."""
+        data = json.loads(text)
+        if data.get('version', None) != SIGNATURE_VERSION:
+            return None
+        return cls(data['block_size'], data['size'], data['digest'], data['blocks'])
+
+    def dumps(self):
+        """Gets JSON text of the signature."""
+        return json.dumps({
+            'version': SIGNATURE_VERSION, 'block_size': self.block_size,
+            'size': self.size, 'digest': self.digest, 'blocks': self.blocks
+        })
+
+    def block_range(self, index):
+        """Gets (offset, length) of the block."""
+        offset = index * self.block_size
+        return offset, min(self.block_size, self.size - offset)
+
+    def match(self, data, max_rolled=None):
+        """Finds blocks of the signature in other data.
+
+        Adler-32 checksum is rolled over the data byte by byte, and strong
+        checksum is calculated only if the weak one is known. After a match
+        the search continues from the end of the matched block, so
+        unchanged data costs a single checksum per block. Rolling is slow,
+        so when max_rolled bytes are passed without a match, the rest of
+        data is checked at block boundaries only.
+
+        Parameters
+        ----------
+        data : bytes-like
+            Data to search in, e.g. memory map of the old version of file.
+        max_rolled : int
+            The number of bytes to roll the checksum over.
+            Default: None - MAX_ROLLED_BYTES.
+
+        Returns
+        -------
+        found : dict
+            Offsets in data of found blocks keyed by block index.
+        """
+        found = {}
+        if not self.blocks:
+            return found
+        weak_index = {}
+        for index, (weak, _) in enumerate(self.blocks):
+            weak_index.setdefault(weak, []).append(index)
+        self._match_tail(data, found)
+        block_size = self.block_size
+        size = len(data)
+        max_rolled = MAX_ROLLED_BYTES if max_rolled is None else max_rolled
+        rolled = 0
+        offset = 0
+        weak = None
+        while offset + block_size <= size:
+            if weak is None:
+                weak = weak_checksum(data[offset:offset + block_size])
+            indices = weak_index.get(weak, None)
+            if indices:
+                strong = strong_checksum(data[offset:offset + block_size])
+                matched = [i for i in indices if self.blocks[i][1] == strong]
+                if matched:
+                    for index in matched:
+                        found.setdefault(index, offset)
+                    offset += block_size
+                    weak = None
+                    continue
+            if offset + block_size == size:
+                break
+            if rolled >= max_rolled:
+                offset += block_size - offset % block_size
+                weak = None
+                continue
+            weak = roll_checksum(weak, data[offset], data[offset + block_size], block_size)
+            offset += 1
+            rolled += 1
+        return found
+
+    def _match_tail(self, data, found):
+        # The last short block is looked for at the same offset and at the
+        # end of data only.
+        offset, length = self.block_range(len(self.blocks) - 1)
+        if length == self.block_size:
+            return
+        for start in (offset, len(data) - length):
+            if 0 <= start and start + length <= len(data):
+                block = data[start:start + length]
+                if block_signature(block) == self.blocks[-1]:
+                    found[len(self.blocks) - 1] = start
+                    return
+
+
+@contextmanager
+def map_file(filename):
+    """Maps file into memory for reading. Empty file gives empty bytes."""
+    with open(filename, 'rb') as f:
+        if not os.fstat(f.fileno()).st_size:
+            yield b''
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            yield data
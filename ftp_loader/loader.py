@@ -1,11 +1,57 @@
 # -*- coding: utf-8 -*-
 
+from bisect import bisect_right
+from collections import deque
+from collections.abc import Mapping, Sequence
+from concurrent.futures import ThreadPoolExecutor
+import errno
+from functools import partial
+import hashlib
+from importlib import import_module
+import json
+import os
 from pathlib import Path, PurePosixPath
-import bz2, gzip
 from enum import Enum
+from fnmatch import fnmatchcase
 
 from tomlkit import parse
 
+from .delta import SIGNATURE_SUFFIX, Signature, map_file
+
+try:
+    import tomllib
+except ImportError:
+    try:
+        import tomli as tomllib
+    except ImportError:
+        tomllib = None
+
+
+CHUNK_SIZE = 1024 * 1024
+BLOCK_SIZE = 8 * 1024 * 1024
+SIZE_SUFFIXES = {'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
+PARALLEL_ARCHIVES = ('bz2', 'gz', 'xz')
+ARCHIVATORS = {
+    'bz2': 'bz2', 'gz': 'gzip', 'xz': 'lzma', 'zst': 'zstandard', 'lz4': 'lz4.frame'
+}
+LEVEL_KEYWORDS = {
+    'bz2': 'compresslevel', 'gz': 'compresslevel', 'xz': 'preset',
+    'lz4': 'compression_level'
+}
+HASHERS = {
+    'xxh64': ('xxhash', 'xxh64'), 'xxh3_64': ('xxhash', 'xxh3_64'),
+    'xxh128': ('xxhash', 'xxh3_128'), 'blake3': ('blake3', 'blake3')
+}
+RESUME_CHECK_SIZE = 64 * 1024
+MIN_SEGMENT_SIZE = 64 * 1024 * 1024
+GLOB_CHARS = '*?['
+INDEX_CACHE_DIR = Path.home() / '.cache' / 'ftp-loader'
+INDEX_CACHE_VERSION = 2
+PART_SUFFIX = '.part'
+STAMP_SUFFIX = PART_SUFFIX + '.src'
+SEGMENT_SUFFIX = '.seg'
+PATCHED_SUFFIX = '.delta'
+
 
 class ErrorCode(Enum):
     REMOTE_NOT_A_FOLDER = 1
@@ -16,6 +62,11 @@ class ErrorCode(Enum):
     NOT_COMPRESSED = 6
     LOCAL_ALREADY_EXISTS = 7
     REMOTE_ALREADY_EXISTS = 8
+    TRANSFER_INCOMPLETE = 9
+    CHECKSUM_MISMATCH = 10
+    UNSUPPORTED_CHECKSUM = 11
+    UNSUPPORTED_TRANSPORT = 12
+    CODEC_FAILED = 13
 
 
 class LoaderException(Exception):
@@ -24,13 +75,275 @@ class LoaderException(Exception):
         self.message = message
 
 
-def load_config(filename="ftp-config.toml"):
+def copy_stream(fsrc, fdst, chunk_size=CHUNK_SIZE):
+    """Copies data from one file object to another chunk by chunk.
+
+    Parameters
+    ----------
+    fsrc : file
+        Source file object opened for reading in binary mode.
+    fdst : file
+        Destination file object opened for writing in binary mode.
+    chunk_size : int
+        Size of chunk in bytes. Default: CHUNK_SIZE.
+
+    Returns
+    -------
+    size : int
+        The number of bytes copied.
+    """
+    size = 0
+    while True:
+        chunk = fsrc.read(chunk_size)
+        if not chunk:
+            break
+        fdst.write(chunk)
+        size += len(chunk)
+    return size
+
+
+def hash_stream(fsrc, hasher, chunk_size=CHUNK_SIZE, size=None):
+    """Updates hash object with the data of the stream.
+
+    Parameters
+    ----------
+    fsrc : file
+        Source file object opened for reading in binary mode.
+    hasher : object
+        Hash object.
+    chunk_size : int
+        Size of data chunk kept in memory. Default: CHUNK_SIZE.
+    size : int
+        The number of bytes to read. Default: None - up to the end.
+    """
+    while size is None or size > 0:
+        chunk = fsrc.read(chunk_size if size is None else min(chunk_size, size))
+        if not chunk:
+            break
+        hasher.update(chunk)
+        if size is not None:
+            size -= len(chunk)
+
+
+class HashingFile:
+    """File which updates hash object with all data read or written.
+
+    All other attributes are taken from the wrapped file.
+
+    Parameters
+    ----------
+    file : file
+        File object opened in binary mode.
+    hasher : object
+        Hash object.
+    """
+    def __init__(self, file, hasher):
+        self._file = file
+        self._hasher = hasher
+
+    def __getattr__(self, name):
+        return getattr(self._file, name)
+
+    def read(self, size=-1):
+        data = self._file.read(size)
+        self._hasher.update(data)
+        return data
+
+    def write(self, data):
+        self._hasher.update(data)
+        return self._file.write(data)
+
+
+def parallel_compress(fsrc, fdst, compress, threads, block_size=None):
+    """Compresses data in independent blocks on a pool of threads.
+
+    Every block is compressed into a complete archive member, and the members
+    are written in order. gzip, bzip2 and xz formats allow concatenated
+    members, so the result is read as a single stream by decompressors.
+
+    Parameters
+    ----------
+    fsrc : file
+        Source file object opened for reading in binary mode.
+    fdst : file
+        Destination file object opened for writing in binary mode.
+    compress : callable
+        Function which compresses a block into a complete archive member.
+    threads : int
+        The number of threads.
+    block_size : int
+        Size of block. Default: BLOCK_SIZE.
+
+    Returns
+    -------
+    size : int
+        The number of bytes compressed.
+    """
+    block_size = block_size or BLOCK_SIZE
+    size = 0
+    pending = deque()
+    with ThreadPoolExecutor(threads) as pool:
+        for block in iter(lambda: fsrc.read(block_size), b''):
+            size += len(block)
+            pending.append(pool.submit(compress, block))
+            if len(pending) >= 2 * threads:
+                fdst.write(pending.popleft().result())
+        while pending:
+            fdst.write(pending.popleft().result())
+    if size == 0:
+        fdst.write(compress(b''))
+    return size
+
+
+def parse_size(text):
+    """Parses size with optional K, M, G suffix (powers of 1024).
+
+    Parameters
+    ----------
+    text : str
+        Size, for example: 512, 64K, 50M, 1.5G.
+
+    Returns
+    -------
+    size : int
+        Size in bytes.
+    """
+    text = str(text).strip().upper().rstrip('B')
+    factor = 1
+    if text and text[-1] in SIZE_SUFFIXES:
+        factor = SIZE_SUFFIXES[text[-1]]
+        text = text[:-1]
+    return int(float(text) * factor)
+
+
+def is_active(connection):
+    """Checks whether SSH transport of the connection is alive.
+
+    Wrappers like CachedConnection are unwrapped.
+    """
+    while hasattr(connection, '_connection'):
+        connection = connection._connection
+    transport = getattr(connection, '_transport', None)
+    return transport is not None and transport.is_active()
+
+
+def _plain(value):
+    # Converts tomlkit items to plain python objects.
+    if isinstance(value, Mapping):
+        return {str(k): _plain(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_plain(v) for v in value]
+    if isinstance(value, str):
+        return str(value)
+    if isinstance(value, bool):
+        return bool(value)
+    if isinstance(value, int):
+        return int(value)
+    if isinstance(value, float):
+        return float(value)
+    return value
+
+
+def parse_config(text):
+    """Parses ftp configuration.
+
+    Read-only parser tomllib (tomli for python < 3.11) is used if it is
+    available. It is much faster than style-preserving tomlkit.
+
+    Parameters
+    ----------
+    text : str
+        Content of configuration file.
+
+    Returns
+    -------
+    server_url : str
+        URL of FTP server.
+    path : str
+        Project's path
+    transfer_cases : list
+        List of files to be transfered.
+    """
+    return parse_index(text)[:3]
+
+
+def parse_index(text):
+    """Parses ftp configuration with optional [transport] section.
+
+    Returns
+    -------
+    server_url, path, transfer_cases
+        The same as of parse_config.
+    transport : dict
+        Raw transport options. Empty if there is no [transport] section.
+    """
+    if tomllib is not None:
+        result = tomllib.loads(text)
+    else:
+        result = _plain(parse(text))
+    return result['url'], result['path'], result['files'], result.get('transport', {})
+
+
+def _index_cache_file(filename, cache_dir):
+    key = hashlib.sha256(str(Path(filename).resolve()).encode()).hexdigest()
+    return Path(cache_dir) / 'index-{0}.json'.format(key[:32])
+
+
+def _read_index_cache(cache_file):
+    try:
+        with open(cache_file) as f:
+            entry = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(entry, dict) or entry.get('version') != INDEX_CACHE_VERSION:
+        return None
+    return entry
+
+
+def _write_index_cache(cache_file, entry):
+    tmp_file = cache_file.with_name('{0}.{1}{2}'.format(cache_file.name, os.getpid(), PART_SUFFIX))
+    try:
+        cache_file.parent.mkdir(parents=True, exist_ok=True)
+        with open(tmp_file, 'w') as f:
+            json.dump(entry, f)
+        tmp_file.replace(cache_file)
+    except (OSError, TypeError, ValueError):
+        # The cache is only an optimization.
+        if tmp_file.exists():
+            tmp_file.unlink()
+
+
+def load_config(filename="ftp-config.toml", cache_dir=None):
     """Loads ftp configuration.
 
+    See load_index for parameters.
+
+    Returns
+    -------
+    server_url : str
+        URL of FTP server.
+    path : str
+        Project's path
+    transfer_cases : list
+        List of files to be transfered.
+    """
+    return load_index(filename, cache_dir)[:3]
+
+
+def load_index(filename="ftp-config.toml", cache_dir=None):
+    """Loads ftp configuration with transport options.
+
+    If cache directory is given, parsed configuration is stored there.
+    The cache is used while modification time and size of the file are
+    the same. If they differ, but the content hash is the same, the cache
+    is used too.
+
     Parameters
     ----------
     filename : str
         FTP configuration filename. Default: ftp-config.toml.
+    cache_dir : str
+        Directory of parsed configuration cache. Default: None - no cache.
 
     Returns
     -------
@@ -40,16 +353,37 @@ def load_config(filename="ftp-config.toml"):
         Project's path
     transfer_cases : list
         List of files to be transfered.
+    transport : dict
+        Raw options of [transport] section.
     """
-    with open(filename) as f:
-        text = f.read()
-    result = parse(text)
-    path = result['path']
-    server_url = result['url']
-    return server_url, path, result['files']
+    if cache_dir is None:
+        with open(filename) as f:
+            text = f.read()
+        return parse_index(text)
+    st = os.stat(filename)
+    cache_file = _index_cache_file(filename, cache_dir)
+    entry = _read_index_cache(cache_file)
+    if entry and entry['mtime'] == st.st_mtime_ns and entry['size'] == st.st_size:
+        return entry['url'], entry['path'], entry['files'], entry['transport']
+    with open(filename, 'rb') as f:
+        data = f.read()
+    digest = hashlib.sha256(data).hexdigest()
+    if entry and entry['hash'] == digest:
+        entry['mtime'] = st.st_mtime_ns
+        entry['size'] = st.st_size
+    else:
+        server_url, path, files, transport = parse_index(data.decode())
+        entry = {
+            'version': INDEX_CACHE_VERSION, 'mtime': st.st_mtime_ns,
+            'size': st.st_size, 'hash': digest,
+            'url': server_url, 'path': path, 'files': files,
+            'transport': transport
+        }
+    _write_index_cache(cache_file, entry)
+    return entry['url'], entry['path'], entry['files'], entry['transport']
 
 
-def create_file_transfers(path, files):
+def create_file_transfers(path, files, checksum=None, delta=False):
     """Creates a list of FileTransfer objects.
 
     Paramteters
@@ -58,22 +392,289 @@ def create_file_transfers(path, files):
         Project base path at FTP.
     files : list[dict]
 
+    checksum : str
+        Checksum algorithm for groups which do not specify it.
+        Default: None - no verification.
+    delta : bool
+        To transfer only changed blocks of files for groups which do not
+        specify it. Default: False.
+
 
     Returns
     -------
-    file_transfers : list[FileTransfer]
-        List of FileTransfer instances.
+    file_transfers : FileTransferSet
+        Sequence of FileTransfer instances. They are created on access.
     """
-    file_transfers = []
+    file_transfers = FileTransferSet()
     for case in files:
-        dst_path = Path(case['dst'])
-        src_path = PurePosixPath(path, case['src'])
-        arch = case.get('arch', None)
-        for name in case['names']:
-            file_transfers.append(FileTransfer(name, dst_path, src_path, arch))
+        group = FileGroup(
+            case['dst'], PurePosixPath(path, case['src']), case.get('arch', None),
+            case.get('level', None), case.get('threads', None),
+            case.get('checksum', checksum), case.get('digests', None),
+            case.get('delta', delta), case.get('priority', 0)
+        )
+        names = [name for name in case['names'] if not is_pattern(name)]
+        patterns = [name for name in case['names'] if is_pattern(name)]
+        file_transfers.add(group, names)
+        file_transfers.add_patterns(group, patterns, case.get('recursive', False))
     return file_transfers
 
 
+def is_pattern(name):
+    """Checks if the name is a glob pattern."""
+    return any(c in name for c in GLOB_CHARS)
+
+
+def local_listdir(path):
+    """Lists local directory.
+
+    Parameters
+    ----------
+    path : Path
+        Local directory.
+
+    Returns
+    -------
+    dirs, files : list[str]
+        Names of subdirectories and files. Both are empty if the directory
+        does not exist.
+    """
+    dirs, files = [], []
+    try:
+        with os.scandir(path) as entries:
+            for entry in entries:
+                (dirs if entry.is_dir() else files).append(entry.name)
+    except OSError:
+        pass
+    return dirs, files
+
+
+def expand_patterns(group, patterns, recursive, listdir, remote):
+    """Yields files of the group which match glob patterns.
+
+    Directories are listed one by one while the files are consumed.
+    Hidden files and directories match only patterns starting with a dot.
+    Partial files, checksum and signature sidecar files never match.
+
+    Parameters
+    ----------
+    group : FileGroup
+        Group options.
+    patterns : list[str]
+        Glob patterns of file names.
+    recursive : bool
+        To look for the files in all subdirectories too.
+    listdir : callable
+        Function listdir(path) which returns names of subdirectories and
+        files.
+    remote : bool
+        Whether remote (archive) files or local (original) files are listed.
+
+    Yields
+    ------
+    ft : FileTransfer
+        File transfer. Files from subdirectories get their own group with
+        subdirectory paths.
+    """
+    suffix = '.' + group.arch if group.arch else None
+    excluded = [PART_SUFFIX, STAMP_SUFFIX, SEGMENT_SUFFIX]
+    if group.checksum:
+        excluded.append('.' + group.checksum)
+    if group.delta:
+        excluded.extend([SIGNATURE_SUFFIX, PATCHED_SUFFIX])
+    if suffix and not remote:
+        excluded.append(suffix)
+    stack = [group]
+    while stack:
+        current = stack.pop()
+        path = current.remote_path if remote else current.local_path
+        dirs, files = listdir(path)
+        for filename in sorted(files):
+            name = filename
+            if remote and suffix:
+                if not filename.endswith(suffix):
+                    continue
+                name = filename[:-len(suffix)]
+            if any(filename.endswith(e) for e in excluded):
+                continue
+            if any(_match(name, pattern) for pattern in patterns):
+                yield FileTransfer.from_group(name, current)
+        if recursive:
+            for dirname in sorted(dirs, reverse=True):
+                if not dirname.startswith('.'):
+                    stack.append(current.subgroup(dirname))
+
+
+def _match(name, pattern):
+    if name.startswith('.') and not pattern.startswith('.'):
+        return False
+    return fnmatchcase(name, pattern)
+
+
+class FileGroup:
+    """Options shared by files of a [[files]] group.
+
+    Parameters are the same as of FileTransfer, but digests is a dictionary
+    of expected digests keyed by file name.
+    """
+    __slots__ = (
+        'local_path', 'remote_path', 'arch', 'level', 'threads', 'checksum',
+        'digests', 'delta', 'priority'
+    )
+
+    def __init__(self, local_path, remote_path, arch=None, level=None,
+                 threads=None, checksum=None, digests=None, delta=False,
+                 priority=0):
+        if not isinstance(local_path, Path):
+            local_path = Path(local_path)
+        if not isinstance(remote_path, PurePosixPath):
+            remote_path = PurePosixPath(remote_path)
+        self.local_path = local_path
+        self.remote_path = remote_path
+        self.arch = arch
+        self.level = level
+        self.threads = threads
+        self.checksum = checksum
+        self.digests = digests
+        self.delta = delta
+        self.priority = priority
+
+    def subgroup(self, dirname):
+        """Creates group with the same options for the subdirectory."""
+        return FileGroup(
+            self.local_path / dirname, self.remote_path / dirname, self.arch,
+            self.level, self.threads, self.checksum, delta=self.delta,
+            priority=self.priority
+        )
+
+    def __getstate__(self):
+        return tuple(getattr(self, name) for name in self.__slots__)
+
+    def __setstate__(self, state):
+        for name, value in zip(self.__slots__, state):
+            setattr(self, name, value)
+
+
+class FileTransferSet(Sequence):
+    """Sequence of files stored as groups of names.
+
+    Only file names are stored for every group. FileTransfer objects are
+    created on access and share the group's paths and options.
+
+    Groups can also have glob patterns instead of names. They are not
+    included in the sequence, but are expanded lazily by expand method.
+    """
+    def __init__(self):
+        self._groups = []
+        self._names = []
+        self._offsets = []
+        self._size = 0
+        self._patterns = []
+
+    def add(self, group, names):
+        """Adds names of the files of the group.
+
+        Parameters
+        ----------
+        group : FileGroup
+            Group options.
+        names : list[str]
+            File names.
+        """
+        names = list(names)
+        if not names:
+            return
+        self._groups.append(group)
+        self._names.append(names)
+        self._offsets.append(self._size)
+        self._size += len(names)
+
+    def add_patterns(self, group, patterns, recursive=False):
+        """Adds glob patterns of the files of the group.
+
+        Parameters
+        ----------
+        group : FileGroup
+            Group options.
+        patterns : list[str]
+            Glob patterns of file names.
+        recursive : bool
+            To look for the files in all subdirectories. Default: False.
+        """
+        if patterns:
+            self._patterns.append((group, list(patterns), recursive))
+
+    def expand(self, listdir, remote):
+        """Yields all files including the ones matching glob patterns.
+
+        Parameters
+        ----------
+        listdir : callable
+            Function listdir(path) which returns names of subdirectories and
+            files, e.g. local_listdir.
+        remote : bool
+            Whether remote (archive) files or local (original) files are
+            listed.
+
+        Yields
+        ------
+        ft : FileTransfer
+            File transfer.
+        """
+        yield from self
+        for group, patterns, recursive in self._patterns:
+            yield from expand_patterns(group, patterns, recursive, listdir, remote)
+
+    def extend(self, other):
+        """Appends files of another set or any iterable of FileTransfer."""
+        if isinstance(other, FileTransferSet):
+            for group, names in other.groups:
+                self.add(group, names)
+            self._patterns.extend(other.patterns)
+            return
+        for ft in other:
+            self.add(ft._group, [ft.name])
+
+    @property
+    def groups(self):
+        """List of (group, names) pairs."""
+        return list(zip(self._groups, self._names))
+
+    @property
+    def patterns(self):
+        """List of (group, patterns, recursive) tuples."""
+        return list(self._patterns)
+
+    @property
+    def prioritized(self):
+        """Whether any group has non-default priority."""
+        groups = self._groups + [group for group, _, _ in self._patterns]
+        return any(group.priority for group in groups)
+
+    def __len__(self):
+        return self._size
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(self._size))]
+        if index < 0:
+            index += self._size
+        if not 0 <= index < self._size:
+            raise IndexError('FileTransferSet index out of range')
+        i = bisect_right(self._offsets, index) - 1
+        return FileTransfer.from_group(self._names[i][index - self._offsets[i]], self._groups[i])
+
+    def __iter__(self):
+        for group, names in zip(self._groups, self._names):
+            for name in names:
+                yield FileTransfer.from_group(name, group)
+
+    def __eq__(self, other):
+        if not isinstance(other, Sequence):
+            return NotImplemented
+        return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+
+
 class FileTransfer:
     """Represents file to be transferred.
     
@@ -87,12 +688,159 @@ class FileTransfer:
         Path to the file in remote folder.
     arch : str
         Archive specifier. Default - None.
+    level : int
+        Compression level. Default - None (archive's default level).
+    threads : int
+        The number of threads to compress the file. Default - None.
+    checksum : str
+        Checksum algorithm to verify transferred file. Default - None
+        (no verification).
+    digest : str
+        Expected hex digest of transferred file (archive for compressed
+        files). Default - None (it is taken from the remote sidecar file).
+    delta : bool
+        To transfer only changed blocks if the file exists at the
+        destination. It is used for uncompressed files and for
+        PARALLEL_ARCHIVES compressed in more than one thread only.
+        Default - False.
+    priority : int
+        Files with higher priority are transferred first. Default - 0.
     """
-    def __init__(self, name, local_path, remote_path, arch=None):
+    __slots__ = ('_name', '_group', '_digest')
+
+    def __init__(self, name, local_path, remote_path, arch=None, level=None,
+                 threads=None, checksum=None, digest=None, delta=False,
+                 priority=0):
         self._name = name
-        self._local_path = Path(local_path)
-        self._remote_path = PurePosixPath(remote_path)
-        self._arch = arch
+        self._group = FileGroup(
+            local_path, remote_path, arch, level, threads, checksum,
+            delta=delta, priority=priority
+        )
+        self._digest = digest
+
+    @classmethod
+    def from_group(cls, name, group):
+        """Creates file transfer sharing options of the group.
+
+        Parameters
+        ----------
+        name : str
+            File name.
+        group : FileGroup
+            Group options.
+        """
+        ft = cls.__new__(cls)
+        ft._name = name
+        ft._group = group
+        ft._digest = group.digests.get(name, None) if group.digests else None
+        return ft
+
+    def __getstate__(self):
+        return self._name, self._group, self._digest
+
+    def __setstate__(self, state):
+        self._name, self._group, self._digest = state
+
+    def __eq__(self, other):
+        if not isinstance(other, FileTransfer):
+            return NotImplemented
+        return self._key() == other._key()
+
+    def __hash__(self):
+        return hash(self._key())
+
+    def _key(self):
+        group = self._group
+        return self._name, group.local_path, group.remote_path, group.arch
+
+    @property
+    def _local_path(self):
+        return self._group.local_path
+
+    @property
+    def _remote_path(self):
+        return self._group.remote_path
+
+    @property
+    def _arch(self):
+        return self._group.arch
+
+    @property
+    def _level(self):
+        return self._group.level
+
+    @property
+    def _threads(self):
+        return self._group.threads
+
+    @property
+    def _checksum(self):
+        return self._group.checksum
+
+    @property
+    def _delta(self):
+        # Ordinary archives differ entirely after any change. Blocks can be
+        # reused only in uncompressed files and archives compressed in
+        # independent blocks.
+        group = self._group
+        if not group.delta or group.arch is None:
+            return group.delta
+        return group.arch in PARALLEL_ARCHIVES and (group.threads or 1) > 1
+
+    @property
+    def name(self):
+        """File name."""
+        return self._name
+
+    @property
+    def local_path(self):
+        """Path to the local folder."""
+        return self._local_path
+
+    @property
+    def remote_path(self):
+        """Path to the remote folder."""
+        return self._remote_path
+
+    @property
+    def arch(self):
+        """Archive specifier."""
+        return self._arch
+
+    @property
+    def checksum(self):
+        """Checksum algorithm."""
+        return self._checksum
+
+    @property
+    def digest(self):
+        """Expected or the last computed digest of transferred file."""
+        return self._digest
+
+    @property
+    def sidecar_name(self):
+        """Name of the file with the digest of transferred file."""
+        return '{0}.{1}'.format(self._arch_name, self._checksum)
+
+    @property
+    def delta(self):
+        """Whether only changed blocks are transferred."""
+        return self._delta
+
+    @property
+    def priority(self):
+        """Priority of the file. Files with higher priority go first."""
+        return self._group.priority
+
+    @property
+    def signature_name(self):
+        """Name of the file with block signature of transferred file."""
+        return self._arch_name + SIGNATURE_SUFFIX
+
+    @property
+    def arch_name(self):
+        """Name of transferred file (archive name for compressed files)."""
+        return self._arch_name
 
     def create_local_folder(self):
         """Creates local folder to store files."""
@@ -116,11 +864,18 @@ class FileTransfer:
         connection : pysftp.Connection
             Connection object.
         """
-        try:
-            connection.makedirs(str(self._remote_path))
-        except OSError:
-            message = "Remote file {0} exists but folder is expected".format(self._remote_path)
-            raise LoaderException(ErrorCode.REMOTE_NOT_A_FOLDER, message)
+        path = str(self._remote_path)
+        # Folders could be created by another connection meanwhile. In this
+        # case makedirs fails and is repeated for the rest of the path.
+        for _ in range(max(1, len(self._remote_path.parts))):
+            try:
+                connection.makedirs(path)
+                return
+            except OSError:
+                if connection.isdir(path):
+                    return
+        message = "Remote file {0} exists but folder is expected".format(self._remote_path)
+        raise LoaderException(ErrorCode.REMOTE_NOT_A_FOLDER, message)
 
     @staticmethod
     def check_local_file_exists(local_file, opt_message=''):
@@ -150,7 +905,7 @@ class FileTransfer:
                 raise LoaderException(ErrorCode.REMOTE_ALREADY_EXISTS, message)
             connection.remove(remote_file)
 
-    def decompress(self, skip_existing=True, remove_archive=True):
+    def decompress(self, skip_existing=True, remove_archive=True, chunk_size=CHUNK_SIZE):
         """Decompress loaded archive.
 
         Paramters
@@ -159,6 +914,8 @@ class FileTransfer:
             To skip already existing files. Default: True.
         remove_archive : bool
             To remove archive file after extraction. Default: True
+        chunk_size : int
+            Size of data chunk kept in memory. Default: CHUNK_SIZE.
         """
         if not self._arch:
             return
@@ -166,23 +923,39 @@ class FileTransfer:
         src_file = self._local_path / self._arch_name
         self.check_local_file_exists(src_file, 'Nothing to decompress...')
         self.check_local_or_remove(dst_file, skip_existing, "Skipping...")
+        part_file = dst_file.with_name(dst_file.name + PART_SUFFIX)
         dcmp = get_archivator(self._arch)
-        with open(dst_file, 'wb') as fdst:
-            with dcmp.open(src_file, 'rb') as fsrc:
-                message = '   * Extracting: {0} ...'.format(src_file)
-                print(message)
-                fdst.write(fsrc.read())
+        hasher = self.new_hasher() if self._digest else None
+        try:
+            with open(part_file, 'wb') as fdst, open(src_file, 'rb') as fraw:
+                if hasher:
+                    fraw = HashingFile(fraw, hasher)
+                with dcmp.open(fraw, 'rb') as fsrc:
+                    message = '   * Extracting: {0} ...'.format(src_file)
+                    print(message)
+                    copy_stream(fsrc, fdst, chunk_size)
+            self.verify(hasher, self._digest, src_file, part_file)
+        except Exception as e:
+            raise self.codec_failed('decompress', src_file, part_file, e)
+        part_file.replace(dst_file)
         if remove_archive:
             message = "  * Removing archive file: {0} ...".format(src_file)
             print(message)
 
-    def compress(self, skip_existing=True):
+    def compress(self, skip_existing=True, chunk_size=CHUNK_SIZE, threads=1):
         """Compress data file.
 
         Parameters
         ----------
         skip_existing : bool
             To skip already archived files. Default: True.
+        chunk_size : int
+            Size of data chunk kept in memory. Default: CHUNK_SIZE.
+        threads : int
+            The number of threads if it is not specified for the file.
+            For archive types from PARALLEL_ARCHIVES the file is compressed
+            in independent blocks. zst archives use multithreaded
+            compressor. Default: 1.
         """
         if not self._arch:
             return
@@ -190,12 +963,73 @@ class FileTransfer:
         src_file = self._local_path / self._name
         self.check_local_file_exists(src_file, 'Nothing to compress...')
         self.check_local_or_remove(dst_file, skip_existing, "Skipping...")
+        get_archivator(self._arch)
+        threads = self._threads or threads
+        part_file = dst_file.with_name(dst_file.name + PART_SUFFIX)
+        try:
+            with open(part_file, 'wb') as fdst:
+                with open(src_file, 'rb') as fsrc:
+                    message = '  * Compressing: {0} ...'.format(src_file)
+                    print(message)
+                    self.write_archive(fsrc, fdst, chunk_size, threads)
+        except Exception as e:
+            raise self.codec_failed('compress', src_file, part_file, e)
+        part_file.replace(dst_file)
+
+    @staticmethod
+    def codec_failed(action, filename, part_file, error):
+        """Removes partial output of failed compression or decompression.
+
+        Corrupted archives make codecs raise errors of various types
+        (OSError, EOFError, zstd and lz4 errors, etc.), they are reported
+        as LoaderException, so other files are processed. It is used by
+        streaming transfers as well.
+
+        Parameters
+        ----------
+        action : str
+            Failed action for the message.
+        filename : Path
+            Processed file.
+        part_file : Path
+            Partial local output file to remove or None.
+        error : Exception
+            Raised error.
+
+        Returns
+        -------
+        error : LoaderException
+            Exception to raise.
+        """
+        if part_file is not None and part_file.exists():
+            part_file.unlink()
+        if isinstance(error, LoaderException):
+            return error
+        message = "  ! Failed to {0} {1}: {2}".format(action, filename, error)
+        return LoaderException(ErrorCode.CODEC_FAILED, message)
+
+    def write_archive(self, fsrc, fdst, chunk_size=CHUNK_SIZE, threads=1):
+        """Compresses data into archive file object.
+
+        Parameters
+        ----------
+        fsrc : file
+            Source file object opened for reading in binary mode.
+        fdst : file
+            Archive file object opened for writing in binary mode.
+        chunk_size : int
+            Size of data chunk kept in memory. Default: CHUNK_SIZE.
+        threads : int
+            The number of threads. Default: 1.
+        """
         dcmp = get_archivator(self._arch)
-        with open(dst_file, 'wb') as fdst:
-            with open(src_file, 'rb') as fsrc:
-                message = '  * Compressing: {0} ...'.format(src_file)
-                print(message)
-                fdst.write(dcmp.compress(fsrc.read()))
+        if threads > 1 and self._arch in PARALLEL_ARCHIVES:
+            compress = partial(dcmp.compress, **archive_options(self._arch, self._level))
+            parallel_compress(fsrc, fdst, compress, threads)
+            return
+        options = archive_options(self._arch, self._level, threads)
+        with dcmp.open(fdst, 'wb', **options) as farch:
+            copy_stream(fsrc, farch, chunk_size)
 
     def clear(self):
         """Clears local data file."""
@@ -205,56 +1039,829 @@ class FileTransfer:
             message = "  * Removing {0}...".format(orig_file)
             print(message)
             orig_file.unlink()
+        orig_part = orig_file.with_name(orig_file.name + PART_SUFFIX)
+        if self._arch and orig_part.exists():
+            message = "  * Removing {0}...".format(orig_part)
+            print(message)
+            orig_part.unlink()
         if arch_file.exists():
             message = "  * Removing {0}...".format(arch_file)
             print(message)
             arch_file.unlink()
+        for suffix in (PART_SUFFIX, STAMP_SUFFIX, SEGMENT_SUFFIX):
+            part_file = arch_file.with_name(arch_file.name + suffix)
+            if part_file.exists():
+                message = "  * Removing {0}...".format(part_file)
+                print(message)
+                part_file.unlink()
 
-    def download(self, connection, skip_existing=True):
+    def download(self, connection, skip_existing=True, chunk_size=CHUNK_SIZE,
+                 segments=1, connect=None):
         """Downloads file from the FTP.
 
+        The data is written to a partial file first. If the partial file
+        is left by an interrupted download of the same remote file (the
+        size and modification time kept in the stamp file next to it are
+        the same), the transfer is resumed. Otherwise large files can be
+        split into segments which are read simultaneously over several
+        connections.
+
         Parameters
         ----------
         connection : pysftp.Connection
             Connection object.
         skip_existing : bool
             To skip already existing files. Default: True.
+        chunk_size : int
+            Size of data chunk. Default: CHUNK_SIZE.
+        segments : int
+            The maximal number of segments. Every segment is at least
+            MIN_SEGMENT_SIZE bytes. Default: 1.
+        connect : callable
+            Function which returns context manager with an extra connection
+            for a segment, e.g. ConnectionPool.connection. Default: None -
+            no segmentation.
         """
         dst_file = self._local_path / self._arch_name
         dst_file2 = self._local_path / self._name
         src_file = str(self._remote_path / self._arch_name)
+        part_file = dst_file.with_name(dst_file.name + PART_SUFFIX)
+        stamp_file = dst_file.with_name(dst_file.name + STAMP_SUFFIX)
         self.check_remote_file_exists(connection, src_file, 'Nothing to download...')
+        if self._delta and not skip_existing and dst_file.exists():
+            if self.download_delta(connection, chunk_size):
+                return
         self.check_local_or_remove(dst_file, skip_existing, "Skipping...")
         self.check_local_or_remove(dst_file2, skip_existing, "Skipping...")
         self.create_local_folder()
-        print('  * Downloading: {0} ...'.format(src_file))
-        connection.get(src_file, dst_file)
+        src_attr = connection.stat(src_file)
+        src_size = src_attr.st_size
+        ranges = split_ranges(src_size, segments if connect else 1)
+        if len(ranges) > 1 and not part_file.exists():
+            self.print_transfer('Downloading in {0} segments'.format(len(ranges)), src_file, 0)
+            seg_file = self.download_segments(connection, connect, ranges, chunk_size)
+            self.check_size(seg_file, seg_file.stat().st_size, src_size)
+            hasher = self.new_hasher()
+            if hasher:
+                with open(seg_file, 'rb') as fseg:
+                    hash_stream(fseg, hasher, chunk_size)
+            self.verify(hasher, self.remote_digest(connection), src_file, seg_file)
+            seg_file.replace(dst_file)
+            return
+        stamp = source_stamp(src_attr.st_size, src_attr.st_mtime)
+        with connection.open(src_file, 'rb') as fsrc:
+            offset = 0
+            if part_file.exists() and stamp_file.exists() and stamp_file.read_text() == stamp:
+                with open(part_file, 'rb') as fpart:
+                    offset = resume_offset(
+                        fpart, fsrc, part_file.stat().st_size, src_size
+                    )
+            if not offset:
+                stamp_file.write_text(stamp)
+            self.print_transfer('Downloading', src_file, offset)
+            hasher = self.new_hasher()
+            if hasher and offset:
+                with open(part_file, 'rb') as fpart:
+                    hash_stream(fpart, hasher, chunk_size)
+            fsrc.seek(offset)
+            if offset < src_size:
+                fsrc.prefetch(src_size)
+            with open(part_file, 'ab' if offset else 'wb') as fdst:
+                copy_stream(fsrc, HashingFile(fdst, hasher) if hasher else fdst, chunk_size)
+        self.check_size(part_file, part_file.stat().st_size, src_size)
+        stamp_file.unlink()
+        self.verify(hasher, self.remote_digest(connection), src_file, part_file)
+        part_file.replace(dst_file)
 
-    def upload(self, connection, skip_existing=True):
+    def upload(self, connection, skip_existing=True, chunk_size=CHUNK_SIZE):
         """Uploads file to FTP.
 
+        The data is written to a remote partial file first. If the partial
+        file is left by an interrupted upload of the same local file (see
+        download), the transfer is resumed.
+
         Parameters
         ----------
         connection : pysftp.Connection
             Connection object.
         skip_existing : bool
             To skip already Uploaded files. Default: True.
+        chunk_size : int
+            Size of data chunk. Default: CHUNK_SIZE.
+        """
+        dst_file = str(self._remote_path / self._arch_name)
+        src_file = self._local_path / self._arch_name
+        part_file = dst_file + PART_SUFFIX
+        self.check_local_file_exists(src_file, 'Nothing to upload...')
+        if self._delta and not skip_existing and connection.exists(dst_file):
+            if self.upload_delta(connection, chunk_size):
+                return
+        self.check_remote_or_remove(connection, dst_file, skip_existing, "Skipping...")
+        if self._delta and connection.exists(dst_file + PATCHED_SUFFIX):
+            # The file left by interrupted delta update.
+            connection.remove(dst_file + PATCHED_SUFFIX)
+        self.create_remote_folder(connection)
+        src_attr = src_file.stat()
+        src_size = src_attr.st_size
+        stamp = source_stamp(src_attr.st_size, src_attr.st_mtime)
+        stamp_file = dst_file + STAMP_SUFFIX
+        with open(src_file, 'rb') as fsrc:
+            offset = 0
+            if connection.exists(part_file):
+                if self.read_remote_text(connection, stamp_file) == stamp:
+                    with connection.open(part_file, 'rb') as fpart:
+                        offset = resume_offset(
+                            fpart, fsrc, connection.stat(part_file).st_size, src_size
+                        )
+                if not offset:
+                    connection.remove(part_file)
+            if not offset:
+                with connection.open(stamp_file, 'wb') as f:
+                    f.write(stamp.encode())
+            self.print_transfer('Uploading', src_file, offset)
+            hasher = self.new_hasher()
+            if hasher:
+                fsrc.seek(0)
+                hash_stream(fsrc, hasher, chunk_size, offset)
+                fsrc = HashingFile(fsrc, hasher)
+            fsrc.seek(offset)
+            with connection.open(part_file, 'ab' if offset else 'wb') as fdst:
+                fdst.set_pipelined(True)
+                copy_stream(fsrc, fdst, chunk_size)
+        self.check_size(part_file, connection.stat(part_file).st_size, src_size)
+        connection.remove(stamp_file)
+        try:
+            self.verify(hasher, self._digest, src_file)
+        except LoaderException:
+            connection.remove(part_file)
+            raise
+        connection.rename(part_file, dst_file)
+        self.save_remote_digest(connection)
+        self.save_remote_signature(connection)
+
+    def download_segments(self, connection, connect, ranges, chunk_size=CHUNK_SIZE):
+        """Downloads byte ranges of the file simultaneously.
+
+        Segments are written into the preallocated file with
+        SEGMENT_SUFFIX at their offsets through their own file objects.
+        Unlike the partial file, it is never resumed, because gaps of
+        unfinished segments can't be found. The file is removed if any
+        segment fails, and it is started over if the process was killed.
+        The first segment is read with the given connection, the others
+        with connections from connect function.
+
+        Parameters
+        ----------
+        connection : pysftp.Connection
+            Connection object.
+        connect : callable
+            Function which returns context manager with a connection.
+        ranges : list[tuple]
+            (offset, length) of segments.
+        chunk_size : int
+            Size of data chunk. Default: CHUNK_SIZE.
+
+        Returns
+        -------
+        seg_file : Path
+            Downloaded file with SEGMENT_SUFFIX.
+        """
+        src_file = str(self._remote_path / self._arch_name)
+        seg_file = self._local_path / (self._arch_name + SEGMENT_SUFFIX)
+        preallocate(seg_file, sum(length for _, length in ranges))
+
+        def fetch(conn, offset, length):
+            with conn.open(src_file, 'rb') as fsrc, open(seg_file, 'r+b') as fdst:
+                fsrc.seek(offset)
+                fsrc.prefetch(offset + length)
+                fdst.seek(offset)
+                while length > 0:
+                    chunk = fsrc.read(min(chunk_size, length))
+                    if not chunk:
+                        break
+                    fdst.write(chunk)
+                    length -= len(chunk)
+
+        def fetch_extra(offset, length):
+            with connect() as conn:
+                fetch(conn, offset, length)
+
+        try:
+            with ThreadPoolExecutor(len(ranges) - 1) as executor:
+                futures = [executor.submit(fetch_extra, *r) for r in ranges[1:]]
+                fetch(connection, *ranges[0])
+                for future in futures:
+                    future.result()
+        except BaseException:
+            seg_file.unlink()
+            raise
+        return seg_file
+
+    def download_delta(self, connection, chunk_size=CHUNK_SIZE):
+        """Updates existing local file downloading only changed blocks.
+
+        Blocks of the remote file are looked for in the local file by their
+        signature. Missing blocks are read from the server, and the file is
+        assembled in a partial file. The result is checked with the digest
+        of the whole file from the signature.
+
+        Parameters
+        ----------
+        connection : pysftp.Connection
+            Connection object.
+        chunk_size : int
+            Size of data chunk. Default: CHUNK_SIZE.
+
+        Returns
+        -------
+        done : bool
+            False if the remote file has no valid signature. Then the file
+            must be downloaded as a whole.
+        """
+        dst_file = self._local_path / self._arch_name
+        src_file = str(self._remote_path / self._arch_name)
+        part_file = dst_file.with_name(dst_file.name + PART_SUFFIX)
+        src_size = connection.stat(src_file).st_size
+        signature = self.remote_signature(connection, src_size)
+        if signature is None:
+            return False
+        digest = hashlib.sha256()
+        with map_file(dst_file) as data:
+            found = signature.match(data)
+            missing = [
+                signature.block_range(i) for i in range(len(signature.blocks))
+                if i not in found
+            ]
+            self.print_delta('Downloading changed blocks', src_file, missing, src_size)
+            with connection.open(src_file, 'rb') as fsrc, open(part_file, 'wb') as fdst:
+                remote_blocks = read_ranges(fsrc, missing, chunk_size)
+                for index in range(len(signature.blocks)):
+                    if index in found:
+                        offset = found[index]
+                        block = data[offset:offset + signature.block_range(index)[1]]
+                    else:
+                        block = next(remote_blocks)
+                    digest.update(block)
+                    fdst.write(block)
+        if digest.hexdigest() != signature.digest:
+            part_file.unlink()
+            print("  ! Signature of {0} is outdated. Downloading the whole file ...".format(src_file))
+            return False
+        hasher = self.new_hasher()
+        if hasher:
+            with open(part_file, 'rb') as fpart:
+                hash_stream(fpart, hasher, chunk_size)
+        self.verify(hasher, self.remote_digest(connection), src_file, part_file)
+        part_file.replace(dst_file)
+        return True
+
+    def upload_delta(self, connection, chunk_size=CHUNK_SIZE):
+        """Updates existing remote file writing only changed blocks.
+
+        SFTP can't copy data at the server, so blocks of the local file are
+        compared with the blocks at the same offsets, and changed ones are
+        written in place. The remote file is renamed to PATCHED_SUFFIX name
+        while it is updated, and its signature and digest are removed, so
+        a torn file is never taken for the uploaded one. PATCHED_SUFFIX file
+        is never resumed, an interrupted update is followed by the whole
+        upload.
+
+        Parameters
+        ----------
+        connection : pysftp.Connection
+            Connection object.
+        chunk_size : int
+            Size of data chunk. Default: CHUNK_SIZE.
+
+        Returns
+        -------
+        done : bool
+            False if the remote file has no valid signature. Then the file
+            must be uploaded as a whole.
         """
         dst_file = str(self._remote_path / self._arch_name)
         src_file = self._local_path / self._arch_name
+        dst_size = connection.stat(dst_file).st_size
+        signature = self.remote_signature(connection, dst_size)
+        if signature is None:
+            return False
+        hasher = self.new_hasher()
+        with open(src_file, 'rb') as fsrc:
+            new_signature = Signature.from_file(
+                HashingFile(fsrc, hasher) if hasher else fsrc, signature.block_size
+            )
+        self.verify(hasher, self._digest, src_file)
+        changed = [
+            new_signature.block_range(i) for i, block in enumerate(new_signature.blocks)
+            if i >= len(signature.blocks) or signature.blocks[i] != block
+        ]
+        self.print_delta('Uploading changed blocks', src_file, changed, new_signature.size)
+        connection.remove(str(self._remote_path / self.signature_name))
+        sidecar = str(self._remote_path / self.sidecar_name)
+        if self._checksum and connection.exists(sidecar):
+            connection.remove(sidecar)
+        patched_file = dst_file + PATCHED_SUFFIX
+        if connection.exists(patched_file):
+            connection.remove(patched_file)
+        connection.rename(dst_file, patched_file)
+        with open(src_file, 'rb') as fsrc, connection.open(patched_file, 'r+b') as fdst:
+            fdst.set_pipelined(True)
+            for offset, length in changed:
+                fsrc.seek(offset)
+                fdst.seek(offset)
+                fdst.write(fsrc.read(length))
+            # Size of the file doesn't reveal failed writes in place.
+            finish_writes(fdst)
+        if new_signature.size < dst_size:
+            connection.truncate(patched_file, new_signature.size)
+        self.check_size(patched_file, connection.stat(patched_file).st_size, new_signature.size)
+        connection.rename(patched_file, dst_file)
+        self.save_remote_digest(connection)
+        self.save_remote_signature(connection, new_signature)
+        return True
+
+    def download_stream(self, connection, skip_existing=True, chunk_size=CHUNK_SIZE):
+        """Downloads file from the FTP and decompresses it on the fly.
+
+        The archive is never stored at local machine. Interrupted
+        transfer can't be resumed.
+
+        Parameters
+        ----------
+        connection : pysftp.Connection
+            Connection object.
+        skip_existing : bool
+            To skip already existing files. Default: True.
+        chunk_size : int
+            Size of data chunk. Default: CHUNK_SIZE.
+        """
+        if not self._arch:
+            return self.download(connection, skip_existing, chunk_size)
+        dst_file = self._local_path / self._name
+        src_file = str(self._remote_path / self._arch_name)
+        part_file = dst_file.with_name(dst_file.name + PART_SUFFIX)
+        self.check_remote_file_exists(connection, src_file, 'Nothing to download...')
+        self.check_local_or_remove(dst_file, skip_existing, "Skipping...")
+        self.create_local_folder()
+        dcmp = get_archivator(self._arch)
+        src_size = connection.stat(src_file).st_size
+        self.print_transfer('Downloading and extracting', src_file, 0)
+        hasher = self.new_hasher()
+        try:
+            with connection.open(src_file, 'rb') as fsrc:
+                fsrc.prefetch(src_size)
+                with dcmp.open(HashingFile(fsrc, hasher) if hasher else fsrc, 'rb') as farch:
+                    with open(part_file, 'wb') as fdst:
+                        copy_stream(farch, fdst, chunk_size)
+            self.verify(hasher, self.remote_digest(connection), src_file, part_file)
+        except Exception as e:
+            error = self.codec_failed('download', src_file, part_file, e)
+            if not is_active(connection):
+                # Broken connection is not a problem of the file.
+                raise
+            raise error
+        part_file.replace(dst_file)
+
+    def upload_stream(self, connection, skip_existing=True, chunk_size=CHUNK_SIZE, threads=1):
+        """Compresses file on the fly and uploads it to FTP.
+
+        The archive is never stored at local machine. Interrupted
+        transfer can't be resumed.
+
+        Parameters
+        ----------
+        connection : pysftp.Connection
+            Connection object.
+        skip_existing : bool
+            To skip already Uploaded files. Default: True.
+        chunk_size : int
+            Size of data chunk. Default: CHUNK_SIZE.
+        threads : int
+            The number of threads if it is not specified for the file.
+            Default: 1.
+        """
+        if not self._arch:
+            return self.upload(connection, skip_existing, chunk_size)
+        dst_file = str(self._remote_path / self._arch_name)
+        src_file = self._local_path / self._name
+        part_file = dst_file + PART_SUFFIX
         self.check_local_file_exists(src_file, 'Nothing to upload...')
         self.check_remote_or_remove(connection, dst_file, skip_existing, "Skipping...")
+        get_archivator(self._arch)
         self.create_remote_folder(connection)
-        print('  * Uploading: {0} ...'.format(src_file))
-        connection.put(src_file, dst_file)        
-                
+        if connection.exists(part_file):
+            connection.remove(part_file)
+        self.print_transfer('Compressing and uploading', src_file, 0)
+        hasher = self.new_hasher()
+        try:
+            with open(src_file, 'rb') as fsrc:
+                # Archivers make many small writes, so they are buffered.
+                with connection.open(part_file, 'wb', chunk_size) as fdst:
+                    fdst.set_pipelined(True)
+                    self.write_archive(
+                        fsrc, HashingFile(fdst, hasher) if hasher else fdst,
+                        chunk_size, self._threads or threads
+                    )
+        except Exception as e:
+            error = self.codec_failed('upload', src_file, None, e)
+            if not is_active(connection):
+                raise
+            if connection.exists(part_file):
+                connection.remove(part_file)
+            raise error
+        if hasher:
+            self._digest = hasher.hexdigest()
+        connection.rename(part_file, dst_file)
+        self.save_remote_digest(connection)
+
+    def new_hasher(self):
+        """Creates hash object for the checksum algorithm or None."""
+        if not self._checksum:
+            return None
+        return get_hasher(self._checksum)()
+
+    def remote_digest(self, connection):
+        """Gets expected digest of the file.
+
+        The digest from index file is used if given. Otherwise it is read
+        from the remote sidecar file. None - if it is unknown.
+
+        Parameters
+        ----------
+        connection : pysftp.Connection
+            Connection object.
+        """
+        if not self._checksum or self._digest:
+            return self._digest
+        text = self.read_remote_text(connection, str(self._remote_path / self.sidecar_name))
+        return text.split()[0] if text and text.strip() else None
+
+    @staticmethod
+    def read_remote_text(connection, remote_file):
+        """Reads small remote text file. None if there is no file."""
+        if not connection.exists(remote_file):
+            return None
+        with connection.open(remote_file, 'rb') as f:
+            return f.read().decode()
+
+    def save_remote_digest(self, connection):
+        """Writes digest of the file to the remote sidecar file.
+
+        The format is the one of sha256sum and similar utilities.
+
+        Parameters
+        ----------
+        connection : pysftp.Connection
+            Connection object.
+        """
+        if not self._checksum or not self._digest:
+            return
+        sidecar = str(self._remote_path / self.sidecar_name)
+        if connection.exists(sidecar):
+            connection.remove(sidecar)
+        with connection.open(sidecar, 'wb') as f:
+            f.write('{0}  {1}\n'.format(self._digest, self._arch_name).encode())
+
+    def remote_signature(self, connection, size):
+        """Loads block signature of the remote file.
+
+        Parameters
+        ----------
+        connection : pysftp.Connection
+            Connection object.
+        size : int
+            Actual size of the remote file.
+
+        Returns
+        -------
+        signature : Signature
+            Signature or None if it does not exist or is made for a file of
+            other size.
+        """
+        sig_file = str(self._remote_path / self.signature_name)
+        if not connection.exists(sig_file):
+            return None
+        with connection.open(sig_file, 'rb') as f:
+            signature = Signature.loads(f.read().decode())
+        if signature is None or signature.size != size:
+            return None
+        return signature
+
+    def save_remote_signature(self, connection, signature=None):
+        """Writes block signature of transferred file to the server.
+
+        Nothing is done if delta transfer is off.
+
+        Parameters
+        ----------
+        connection : pysftp.Connection
+            Connection object.
+        signature : Signature
+            Signature of the file. Default: None - it is calculated for
+            the local file.
+        """
+        if not self._delta:
+            return
+        if signature is None:
+            with open(self._local_path / self._arch_name, 'rb') as f:
+                signature = Signature.from_file(f)
+        sig_file = str(self._remote_path / self.signature_name)
+        if connection.exists(sig_file):
+            connection.remove(sig_file)
+        with connection.open(sig_file, 'wb') as f:
+            f.write(signature.dumps().encode())
+
+    def verify(self, hasher, expected, filename, remove_file=None):
+        """Compares computed digest with the expected one.
+
+        The computed digest is kept as the expected one for the next
+        steps, e.g. decompression of downloaded archive.
+
+        Parameters
+        ----------
+        hasher : object
+            Hash object updated with the file data or None.
+        expected : str
+            Expected hex digest or None - nothing to compare with.
+        filename : str
+            Name of the file for the message.
+        remove_file : Path
+            Local file to remove if digests differ. Default: None.
+        """
+        if hasher is None:
+            return
+        digest = hasher.hexdigest()
+        if expected and digest != expected.lower():
+            if remove_file is not None and remove_file.exists():
+                remove_file.unlink()
+            message = "  ! File {0} has {1} checksum {2} but {3} is expected. File is corrupted.".format(
+                filename, self._checksum, digest, expected
+            )
+            raise LoaderException(ErrorCode.CHECKSUM_MISMATCH, message)
+        self._digest = digest
+
+    @staticmethod
+    def print_transfer(action, filename, offset):
+        if offset:
+            message = '  * {0}: {1} (resuming from byte {2}) ...'.format(
+                action, filename, offset
+            )
+        else:
+            message = '  * {0}: {1} ...'.format(action, filename)
+        print(message)
+
+    @staticmethod
+    def print_delta(action, filename, ranges, size):
+        changed = sum(length for _, length in ranges)
+        message = '  * {0}: {1} ({2} of {3} bytes) ...'.format(action, filename, changed, size)
+        print(message)
+
+    @staticmethod
+    def check_size(part_file, size, expected_size):
+        if size != expected_size:
+            message = "  ! File {0} has size {1} but {2} is expected. Transfer is incomplete.".format(
+                part_file, size, expected_size
+            )
+            raise LoaderException(ErrorCode.TRANSFER_INCOMPLETE, message)
+
+
+def resume_offset(fpart, fsrc, part_size, src_size, check_size=None):
+    """Finds the position to resume interrupted transfer from.
+
+    The tail of the partial file is compared with the same range of the
+    source file. If they differ, the source has changed since the transfer
+    was interrupted, and the transfer must start from the beginning.
+
+    Parameters
+    ----------
+    fpart : file
+        Partial file opened for reading in binary mode.
+    fsrc : file
+        Source file opened for reading in binary mode.
+    part_size : int
+        Size of partial file.
+    src_size : int
+        Size of source file.
+    check_size : int
+        The number of bytes to compare. Default: RESUME_CHECK_SIZE.
+
+    Returns
+    -------
+    offset : int
+        Position to resume from. 0 - start from the beginning.
+    """
+    check_size = check_size or RESUME_CHECK_SIZE
+    if part_size > src_size:
+        return 0
+    start = max(0, part_size - check_size)
+    fpart.seek(start)
+    fsrc.seek(start)
+    if fpart.read(part_size - start) != fsrc.read(part_size - start):
+        return 0
+    return part_size
+
+
+def source_stamp(size, mtime):
+    """Gets stamp of the source file of a partial file.
+
+    A partial file is resumed only if the stamp saved at the start of the
+    transfer is the same, so a changed source is transferred again even
+    if its tail is the same.
+
+    Parameters
+    ----------
+    size : int
+        Size of the source file.
+    mtime : float
+        Modification time of the source file.
+
+    Returns
+    -------
+    stamp : str
+        Size and modification time (whole seconds as in SFTP).
+    """
+    return '{0} {1}'.format(size, int(mtime or 0))
+
+
+def split_ranges(size, segments, min_size=None):
+    """Splits file into byte ranges of nearly equal size.
+
+    Parameters
+    ----------
+    size : int
+        File size.
+    segments : int
+        The maximal number of ranges.
+    min_size : int
+        Minimal size of a range. Default: MIN_SEGMENT_SIZE.
+
+    Returns
+    -------
+    ranges : list[tuple]
+        (offset, length) of ranges. There is at least one range.
+    """
+    min_size = min_size or MIN_SEGMENT_SIZE
+    segments = max(1, min(segments, size // min_size))
+    ranges = []
+    offset = 0
+    for i in range(segments):
+        length = (size - offset) // (segments - i)
+        ranges.append((offset, length))
+        offset += length
+    return ranges
+
+
+def finish_writes(fdst):
+    """Waits for pipelined writes to the remote file and raises their errors.
+
+    paramiko checks acknowledgements of pipelined writes only when many of
+    them are pending, and errors of the last ones are lost on close.
+
+    Parameters
+    ----------
+    fdst : paramiko.SFTPFile
+        Remote file or a wrapper of it.
+    """
+    while hasattr(fdst, '_file'):
+        fdst = fdst._file
+    fdst.flush()
+    while fdst._reqs:
+        # Raises IOError if the server reports an error.
+        fdst.sftp._read_response(fdst._reqs.popleft())
+
+
+def preallocate(filename, size):
+    """Creates file of the given size.
+
+    Disk space is reserved with posix_fallocate if it is supported, so a
+    lack of space is found before the transfer. Otherwise the file is
+    sparse.
+    """
+    with open(filename, 'wb') as f:
+        if size and hasattr(os, 'posix_fallocate'):
+            try:
+                os.posix_fallocate(f.fileno(), 0, size)
+                return
+            except OSError as e:
+                if e.errno not in (errno.EINVAL, errno.EOPNOTSUPP):
+                    raise
+        f.truncate(size)
+
+
+def read_ranges(fsrc, ranges, chunk_size=CHUNK_SIZE):
+    """Reads ranges of remote file with pipelined requests.
+
+    Ranges are requested in batches of about BLOCK_SIZE bytes, so only one
+    batch is kept in memory.
+
+    Parameters
+    ----------
+    fsrc : paramiko.SFTPFile
+        Remote file opened for reading.
+    ranges : list[tuple]
+        (offset, length) of data ranges.
+    chunk_size : int
+        Minimal size of a batch. Default: CHUNK_SIZE.
+
+    Yields
+    ------
+    data : bytes
+        Data of every range in order.
+    """
+    batch_size = max(BLOCK_SIZE, chunk_size)
+    batch = []
+    total = 0
+    for offset, length in ranges:
+        batch.append((offset, length))
+        total += length
+        if total >= batch_size:
+            yield from fsrc.readv(batch)
+            batch = []
+            total = 0
+    if batch:
+        yield from fsrc.readv(batch)
+
 
 def get_archivator(arch):
-    if arch == 'bz2':
-        return bz2
-    elif arch == 'gz':
-        return gzip
-    else:
+    """Gets archive module for archive type.
+
+    Modules for zst and lz4 types are optional dependencies.
+
+    Parameters
+    ----------
+    arch : str
+        Archive type.
+
+    Returns
+    -------
+    archivator : module
+        Module with open, compress and decompress functions.
+    """
+    if arch not in ARCHIVATORS:
         message = "  ! Unsupported archive format {0}. Skipping".format(arch)
         raise LoaderException(ErrorCode.UNSUPPORTED_ARCHIVE, message)
+    try:
+        return import_module(ARCHIVATORS[arch])
+    except ImportError:
+        message = "  ! Archive format {0} requires {1} package. Skipping".format(
+            arch, ARCHIVATORS[arch].split('.')[0]
+        )
+        raise LoaderException(ErrorCode.UNSUPPORTED_ARCHIVE, message)
+
+
+def get_hasher(algorithm):
+    """Gets hash object constructor for checksum algorithm.
+
+    Any algorithm of hashlib is supported. xxh64, xxh3_64, xxh128 and
+    blake3 require xxhash and blake3 packages.
+
+    Parameters
+    ----------
+    algorithm : str
+        Checksum algorithm.
+
+    Returns
+    -------
+    hasher : callable
+        Function which creates a new hash object.
+    """
+    if algorithm in HASHERS:
+        module, name = HASHERS[algorithm]
+        try:
+            return getattr(import_module(module), name)
+        except ImportError:
+            message = "  ! Checksum {0} requires {1} package.".format(algorithm, module)
+            raise LoaderException(ErrorCode.UNSUPPORTED_CHECKSUM, message)
+    if algorithm in hashlib.algorithms_available:
+        return partial(hashlib.new, algorithm)
+    message = "  ! Unsupported checksum algorithm {0}.".format(algorithm)
+    raise LoaderException(ErrorCode.UNSUPPORTED_CHECKSUM, message)
+
+
+def archive_options(arch, level=None, threads=1):
+    """Gets keyword arguments to open archive for writing.
+
+    Parameters
+    ----------
+    arch : str
+        Archive type.
+    level : int
+        Compression level or None for the default level.
+    threads : int
+        The number of threads. It is used by zst archives only.
+
+    Returns
+    -------
+    options : dict
+        Keyword arguments for open function of the archive module.
+    """
+    if arch == 'zst':
+        zstandard = get_archivator(arch)
+        if level is None:
+            level = 3
+        cctx = zstandard.ZstdCompressor(level=level, threads=threads if threads > 1 else 0)
+        return {'cctx': cctx}
+    if level is None:
+        return {}
+    return {LEVEL_KEYWORDS[arch]: level}
 
@@ -1,70 +1,543 @@
 # -*- coding: utf-8 -*-
 
 import argparse
+from collections.abc import Sized
+from concurrent.futures import (
+    ProcessPoolExecutor, FIRST_COMPLETED, as_completed, wait
+)
+from contextlib import contextmanager
+from functools import partial
 import getpass
-from pysftp import Connection
+import multiprocessing
+import queue
+import threading
+import time
 from pathlib import Path, PurePosixPath
 import json
 
-from . import loader
+from . import aio, loader, manifest, plan, scheduler, stats
+from .cache import LINK_MODES, LocalCache, cache_key
+from .remote import ConnectionPool, transport_options
 
 
-def read_config(config_file, hosts=None, base_path=None):
-    url, path, files = loader.load_config(config_file)
+def read_config(config_file, hosts=None, base_path=None, checksum=None,
+                cache_dir=None, delta=False, transport=None):
+    """Reads index file.
+
+    If transport dictionary is given, it is updated with raw options of
+    [transport] section.
+    """
+    url, path, files, section = loader.load_index(config_file, cache_dir)
+    if transport is not None:
+        transport.update(section)
 
     if base_path:
         path = PurePosixPath(base_path) / path
     elif hosts:
         path = PurePosixPath(hosts.get(url, '')) / path
 
-    file_trans = loader.create_file_transfers(path, files)
+    file_trans = loader.create_file_transfers(path, files, checksum, delta)
     return url, file_trans
 
-def auth():
-    print('Please, enter your login and password to access FTP server. \n')
+def auth(url=None):
+    if url:
+        print('Please, enter your login and password to access {0}. \n'.format(url))
+    else:
+        print('Please, enter your login and password to access FTP server. \n')
     user = input('Username: ')
     passwd = getpass.getpass('Password: ')
     return user, passwd
 
 
-def download_data(url, user, passwd, file_trans, skip_existing, **kwargs):
-    downloaded = []
-    with Connection(url, user, password=passwd, **kwargs) as conn:
-        for ft in file_trans:
-            try:
-                ft.download(conn, skip_existing)
-                downloaded.append(ft)
-            except loader.LoaderException as e:
-                print(e.message)
-    return downloaded
+QUEUE_SIZE = 4
 
 
-def upload_data(url, user, passwd, file_trans, skip_existing):
-    with Connection(url, user, password=passwd) as conn:
-        count = 0
-        for ft in file_trans:
-            try: 
-                ft.upload(conn, skip_existing)
-                count += 1
-            except loader.LoaderException as e:
-                print(e.message)
-    return count
+@contextmanager
+def connection_pool(url, user, passwd, pool=None, **kwargs):
+    """Gets connection pool for the host.
+
+    If pool is not given, a temporary pool with the credentials is created.
+    """
+    if pool is not None:
+        yield pool
+        return
+    with ConnectionPool(**kwargs) as pool:
+        pool.set_credentials(url, user, passwd)
+        yield pool
 
 
-def decompress_data(file_trans, skip_existing):
-    for ft in file_trans:
+def _transfer_worker(conn, tasks, action, done, errors):
+    while True:
+        item = tasks.get()
+        if item is None:
+            break
+        if errors:
+            # Drain the queue so that the feeder is never blocked.
+            continue
+        index, ft = item
         try:
-            ft.decompress(skip_existing)
+            action(ft, conn)
+            done[index] = ft
         except loader.LoaderException as e:
             print(e.message)
+        except Exception as e:
+            errors.append(e)
 
 
-def compress_data(file_trans, skip_existing):
-    for ft in file_trans:
+def _feed_tasks(file_trans, tasks, jobs, errors):
+    try:
+        for item in enumerate(file_trans):
+            if errors:
+                break
+            tasks.put(item)
+    except Exception as e:
+        errors.append(e)
+    finally:
+        for _ in range(jobs):
+            tasks.put(None)
+
+
+def run_transfers(url, user, passwd, file_trans, action, jobs=1,
+                  queue_size=None, **kwargs):
+    """Runs transfer action for every file using a pool of connections.
+
+    Parameters
+    ----------
+    url : str
+        Server's URL.
+    user, passwd : str
+        User's credentials.
+    file_trans : iterable[FileTransfer]
+        Files to be transferred. It is consumed lazily, so it can be
+        a generator producing files while the transfers go on.
+    action : callable
+        Function action(ft, connection) that performs the transfer.
+    jobs : int
+        The number of simultaneous connections. Default: 1.
+    queue_size : int
+        The number of files taken from file_trans in advance. Default: jobs.
+    kwargs : dict
+        Extra arguments for Connection or pool - ConnectionPool to take
+        connections from.
+
+    Connections share a RemoteCache, so every remote directory is listed
+    only once.
+
+    Returns
+    -------
+    done : list[FileTransfer]
+        Successfully transferred files in the order of file_trans.
+    """
+    if hasattr(file_trans, '__len__'):
+        jobs = min(jobs, len(file_trans))
+    jobs = max(1, jobs)
+    tasks = queue.Queue(queue_size or jobs)
+    done = {}
+    errors = []
+    with connection_pool(url, user, passwd, **kwargs) as pool:
+        conns = []
         try:
-            ft.compress(skip_existing)
-        except loader.LoaderException as e:
-            print(e.message)            
+            for _ in range(jobs):
+                conns.append(pool.acquire(url))
+            workers = [
+                threading.Thread(
+                    target=_transfer_worker, args=(conn, tasks, action, done, errors)
+                ) for conn in conns
+            ]
+            for w in workers:
+                w.start()
+            _feed_tasks(file_trans, tasks, jobs, errors)
+            for w in workers:
+                w.join()
+        finally:
+            for conn in conns:
+                pool.release(url, conn)
+    if errors:
+        raise errors[0]
+    return [done[i] for i in sorted(done.keys())]
+
+
+def download_data(url, user, passwd, file_trans, skip_existing, jobs=1,
+                  segments=1, **kwargs):
+    """Downloads files using a pool of connections.
+
+    Large files are split into at most segments parts which are read over
+    extra connections of the pool.
+    """
+    with connection_pool(url, user, passwd, **kwargs) as pool:
+        connect = partial(pool.connection, url)
+
+        def action(ft, conn):
+            with stats.measure(ft, 'download'):
+                ft.download(conn, skip_existing, segments=segments, connect=connect)
+
+        return run_transfers(url, user, passwd, file_trans, action, jobs, pool=pool)
+
+
+def upload_data(url, user, passwd, file_trans, skip_existing, jobs=1, **kwargs):
+    def action(ft, conn):
+        with stats.measure(ft, 'upload'):
+            ft.upload(conn, skip_existing)
+
+    uploaded = run_transfers(url, user, passwd, file_trans, action, jobs, **kwargs)
+    return len(uploaded)
+
+
+def _run_codec(method, ft, skip_existing, options):
+    start = time.time()
+    try:
+        getattr(ft, method)(skip_existing, **options)
+    except loader.LoaderException as e:
+        return e.message, start, None
+    return None, start, time.time()
+
+
+def _codec_result(method, ft, result):
+    message, start, end = result
+    # Files without archive are not processed, their time would spoil rates.
+    if message is None and ft.arch:
+        stats.record(ft, method, start, end)
+    return ft, message
+
+
+def _map_codec(method, file_trans, skip_existing, workers=1, **options):
+    """Applies compress or decompress method to every file.
+
+    If workers is greater than 1, the files are processed in a pool of
+    worker processes. Only a limited number of files is submitted in advance,
+    so file_trans can be a lazy iterator.
+
+    Yields
+    ------
+    ft : FileTransfer
+        Processed file in the order of completion.
+    message : str
+        LoaderException message or None if the file was processed.
+    """
+    if workers <= 1:
+        for ft in file_trans:
+            yield _codec_result(method, ft, _run_codec(method, ft, skip_existing, options))
+        return
+    # Child processes are spawned, because forking a process with running
+    # transfer threads can deadlock.
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(workers, mp_context=context) as pool:
+        pending = {}
+        for ft in file_trans:
+            future = pool.submit(_run_codec, method, ft, skip_existing, options)
+            pending[future] = ft
+            if len(pending) < 2 * workers:
+                continue
+            finished, _ = wait(pending.keys(), return_when=FIRST_COMPLETED)
+            for future in finished:
+                yield _codec_result(method, pending.pop(future), future.result())
+        for future in as_completed(pending.keys()):
+            yield _codec_result(method, pending[future], future.result())
+
+
+def _collect_codec(method, file_trans, skip_existing, workers, **options):
+    processed = []
+    for ft, message in _map_codec(method, file_trans, skip_existing, workers, **options):
+        if message is None:
+            processed.append(ft)
+        else:
+            print(message)
+    return processed
+
+
+def download_stream_data(url, user, passwd, file_trans, skip_existing, jobs=1,
+                         **kwargs):
+    """Downloads files decompressing them on the fly.
+
+    Returns
+    -------
+    downloaded : list[FileTransfer]
+        Successfully downloaded files.
+    """
+    def action(ft, conn):
+        with stats.measure(ft, 'download_stream'):
+            ft.download_stream(conn, skip_existing)
+
+    return run_transfers(url, user, passwd, file_trans, action, jobs, **kwargs)
+
+
+def upload_stream_data(url, user, passwd, file_trans, skip_existing, jobs=1,
+                       threads=1, **kwargs):
+    """Uploads files compressing them on the fly.
+
+    Returns
+    -------
+    uploaded : list[FileTransfer]
+        Successfully uploaded files.
+    """
+    def action(ft, conn):
+        with stats.measure(ft, 'upload_stream'):
+            ft.upload_stream(conn, skip_existing, threads=threads)
+
+    return run_transfers(url, user, passwd, file_trans, action, jobs, **kwargs)
+
+
+def _consume_codec(method, items, skip_existing, workers, errors):
+    # Consumer thread of a pipeline. If it fails, the items are still taken
+    # so that producers are not blocked on the full queue.
+    try:
+        _collect_codec(method, items, skip_existing, workers)
+    except Exception as e:
+        errors.append(e)
+        for _ in items:
+            pass
+
+
+def decompress_data(file_trans, skip_existing, workers=1):
+    """Decompresses files, possibly in several worker processes.
+
+    Returns
+    -------
+    decompressed : list[FileTransfer]
+        Files processed without errors in the order of completion.
+    """
+    return _collect_codec('decompress', file_trans, skip_existing, workers)
+
+
+def compress_data(file_trans, skip_existing, workers=1, threads=1):
+    """Compresses files, possibly in several worker processes.
+
+    Every file is compressed by threads threads.
+
+    Returns
+    -------
+    compressed : list[FileTransfer]
+        Files processed without errors in the order of completion.
+    """
+    return _collect_codec(
+        'compress', file_trans, skip_existing, workers, threads=threads
+    )
+
+
+def _iter_compressed(file_trans, skip_existing, workers=1, threads=1):
+    items = _map_codec(
+        'compress', file_trans, skip_existing, workers, threads=threads
+    )
+    for ft, message in items:
+        if message is not None:
+            print(message)
+        yield ft
+
+
+def download_and_decompress(url, user, passwd, file_trans, skip_existing,
+                            jobs=1, queue_size=QUEUE_SIZE, workers=1,
+                            segments=1, **kwargs):
+    """Downloads files and decompresses every file as soon as it is loaded.
+
+    Decompression runs in a separate thread. At most queue_size loaded
+    archives wait for decompression; downloads are paused when the queue
+    is full. Large files are split into at most segments parts.
+
+    Returns
+    -------
+    downloaded : list[FileTransfer]
+        Successfully downloaded files.
+    """
+    loaded = queue.Queue(queue_size)
+    errors = []
+    consumer = threading.Thread(
+        target=_consume_codec,
+        args=('decompress', iter(loaded.get, None), skip_existing, workers, errors)
+    )
+    consumer.start()
+
+    try:
+        with connection_pool(url, user, passwd, **kwargs) as pool:
+            connect = partial(pool.connection, url)
+
+            def action(ft, conn):
+                try:
+                    with stats.measure(ft, 'download'):
+                        ft.download(conn, skip_existing, segments=segments, connect=connect)
+                finally:
+                    # Archives loaded earlier are extracted too.
+                    loaded.put(ft)
+
+            downloaded = run_transfers(url, user, passwd, file_trans, action, jobs, pool=pool)
+    finally:
+        loaded.put(None)
+        consumer.join()
+    if errors:
+        raise errors[0]
+    return downloaded
+
+
+def compress_and_upload(url, user, passwd, file_trans, skip_existing,
+                        jobs=1, queue_size=QUEUE_SIZE, workers=1, threads=1,
+                        **kwargs):
+    """Compresses files and uploads every file as soon as it is compressed.
+
+    At most queue_size compressed files wait for upload; compression is
+    paused when the queue is full.
+
+    Returns
+    -------
+    uploaded : list[FileTransfer]
+        Successfully uploaded files.
+    """
+    def action(ft, conn):
+        with stats.measure(ft, 'upload'):
+            ft.upload(conn, skip_existing)
+
+    compressed = _iter_compressed(file_trans, skip_existing, workers, threads)
+    return run_transfers(
+        url, user, passwd, compressed, action, jobs, queue_size, **kwargs
+    )
+
+
+def expand_transfers(url, file_trans, pool, remote=True):
+    """Expands glob patterns of file_trans lazily.
+
+    Parameters
+    ----------
+    url : str
+        Server's URL.
+    file_trans : iterable[FileTransfer]
+        Files to be transferred.
+    pool : ConnectionPool
+        Connection pool to list remote directories.
+    remote : bool
+        To match patterns against remote listings (download) or against
+        the local tree (upload). Default: True.
+
+    Returns
+    -------
+    file_trans : iterable[FileTransfer]
+        file_trans itself if there are no patterns or an iterator which
+        lists directories while the files are consumed.
+    """
+    if not isinstance(file_trans, loader.FileTransferSet) or not file_trans.patterns:
+        return file_trans
+    if not remote:
+        return file_trans.expand(loader.local_listdir, False)
+
+    def listdir(path):
+        with pool.connection(url) as conn:
+            return pool.cache(url).listdir(conn, path)
+
+    return file_trans.expand(listdir, True)
+
+
+def schedule_transfers(url, file_trans, pool, order, remote=True):
+    """Orders files by priority and size, see scheduler.schedule.
+
+    Sizes of remote files are taken from listings of the remote folders,
+    which are fetched once in bulk.
+
+    Parameters
+    ----------
+    url : str
+        Server's URL.
+    file_trans : iterable[FileTransfer]
+        Files to be transferred. Iterators are consumed.
+    pool : ConnectionPool
+        Connection pool to list remote directories.
+    order : str
+        One of scheduler.ORDERS.
+    remote : bool
+        To order by sizes of remote files (download) or local files
+        (upload). Default: True.
+
+    Returns
+    -------
+    file_trans : list[FileTransfer]
+        Ordered files.
+    """
+    if order == 'index':
+        return scheduler.schedule(file_trans)
+    if not remote:
+        return scheduler.schedule(file_trans, order, scheduler.local_size)
+    file_trans = list(file_trans)
+    with pool.connection(url) as conn:
+        pool.cache(url).prefetch(conn, set(str(ft.remote_path) for ft in file_trans))
+        return scheduler.schedule(file_trans, order, partial(scheduler.remote_size, conn))
+
+
+def _remote_key(url, ft, pool):
+    remote_file = str(ft.remote_path / ft.arch_name)
+    with pool.connection(url) as conn:
+        if not conn.exists(remote_file):
+            return None
+        return cache_key(url, remote_file, conn.stat(remote_file))
+
+
+def restore_cached(url, file_trans, local_cache, pool, skip_existing, restored):
+    """Takes files from the local cache and yields the missing ones.
+
+    Remote attributes are answered from the listings of RemoteCache, so
+    the check does not cost a request per file.
+
+    Parameters
+    ----------
+    url : str
+        Server's URL.
+    file_trans : iterable[FileTransfer]
+        Files to be downloaded.
+    local_cache : LocalCache
+        Cache of downloaded files.
+    pool : ConnectionPool
+        Connection pool.
+    skip_existing : bool
+        To skip already existing files. They are passed to the download.
+    restored : list
+        Restored files are appended to it.
+    """
+    for ft in file_trans:
+        dst_file = ft.local_path / ft.name
+        key = None
+        if not (skip_existing and dst_file.exists()):
+            key = _remote_key(url, ft, pool)
+        if key is None:
+            yield ft
+            continue
+        ft.create_local_folder()
+        if local_cache.restore(key, dst_file):
+            print('  * Restoring {0} from cache ...'.format(dst_file))
+            restored.append(ft)
+        else:
+            yield ft
+
+
+def store_cached(url, file_trans, local_cache, pool):
+    """Puts downloaded and decompressed files into the local cache."""
+    for ft in file_trans:
+        dst_file = ft.local_path / ft.name
+        if not dst_file.exists():
+            continue
+        key = _remote_key(url, ft, pool)
+        if key is not None:
+            local_cache.store(key, dst_file)
+
+
+def load_manifests(url, user, passwd, file_trans, **kwargs):
+    """Loads local and remote manifests for file_trans.
+
+    If file_trans is an iterator, manifests are loaded on the first access
+    with connections from pool keyword argument.
+
+    Returns
+    -------
+    local, remote : dict
+        Local and remote manifests.
+    """
+    if not isinstance(file_trans, Sized):
+        pool = kwargs['pool']
+
+        def load_remote(path):
+            with pool.connection(url) as conn:
+                return manifest.Manifest.load_remote(conn, path)
+
+        return manifest.ManifestDict(manifest.Manifest.load), manifest.ManifestDict(load_remote)
+    local = manifest.load_local_manifests(file_trans)
+    with connection_pool(url, user, passwd, **kwargs) as pool:
+        with pool.connection(url) as conn:
+            remote = manifest.load_remote_manifests(conn, file_trans)
+    return local, remote
 
 
 def clear_data(file_trans):
@@ -80,8 +553,9 @@ def arg_parser():
     parser = argparse.ArgumentParser(prog='FTP Loader')
 
     parser.add_argument(
-        'config', type=str, nargs='?', default='ftp-config.toml',
-        help='configuration file name.'
+        'config', type=str, nargs='*', default=['ftp-config.toml'],
+        help='configuration file names. Connections to the same host are '
+             'shared by all files.'
     )
 
     parser.add_argument(
@@ -97,6 +571,145 @@ def arg_parser():
         '--base-path', type=str, nargs='?', default=None,
         help="User's base path at FTP"
     )
+    parser.add_argument(
+        '--jobs', type=int, default=None,
+        help='The number of simultaneous connections (files for async '
+             'engine). Default: 1 ({0} for async engine).'.format(aio.ASYNC_JOBS)
+    )
+    parser.add_argument(
+        '--segments', type=int, default=1,
+        help='The number of connections to download a single large file. '
+             'Every segment is at least {0}M. Works with sync engine. '
+             'Default: 1.'.format(
+                 loader.MIN_SEGMENT_SIZE // 1024 ** 2)
+    )
+    parser.add_argument(
+        '--engine', choices=['sync', 'async'], default='sync',
+        help='Transfer engine. async engine requires asyncssh package and '
+             'does not support --stream, --segments and --delta. '
+             'Default: sync.'
+    )
+    parser.add_argument(
+        '--queue-size', type=int, default=QUEUE_SIZE,
+        help='The number of files waiting between transfer and '
+             '(de)compression. Default: {0}.'.format(QUEUE_SIZE)
+    )
+    parser.add_argument(
+        '--workers', type=int, default=1,
+        help='The number of processes for (de)compression. Default: 1.'
+    )
+    parser.add_argument(
+        '--threads', type=int, default=1,
+        help='The number of threads to compress a single file. '
+             'Default: 1.'
+    )
+    parser.add_argument(
+        '--limit-rate', type=loader.parse_size, default=None,
+        help='Limit total transfer rate in bytes per second. K, M and G '
+             'suffixes are allowed, e.g. 50M. Default: unlimited.'
+    )
+    parser.add_argument(
+        '--limit-rate-per-connection', type=loader.parse_size, default=None,
+        help='Limit transfer rate of every connection in bytes per second. '
+             'Default: unlimited.'
+    )
+    parser.add_argument(
+        '--adaptive-rate', action='store_true',
+        help='Reduce the limited rates when latency of requests rises.'
+    )
+    parser.add_argument(
+        '--cache-dir', type=str, default=None,
+        help='Local cache of downloaded files shared by several working '
+             'copies. Default: no cache.'
+    )
+    parser.add_argument(
+        '--cache-size', type=loader.parse_size, default=None,
+        help='Size limit of the cache. Least recently used files are '
+             'removed. Default: unlimited.'
+    )
+    parser.add_argument(
+        '--cache-link', choices=LINK_MODES, default='auto',
+        help='How files are taken from the cache. hardlink shares the data '
+             'with the cache, so the files must not be modified in place. '
+             'Default: auto - reflink or copy.'
+    )
+    parser.add_argument(
+        '--window-size', type=loader.parse_size, default=None,
+        help='SSH channel window size, e.g. 64M. A larger window lets more '
+             'data be in flight on links with high latency. Default: '
+             'library default (2M for sync engine).'
+    )
+    parser.add_argument(
+        '--max-packet-size', type=loader.parse_size, default=None,
+        help='Maximal SSH packet size. Default: library default.'
+    )
+    parser.add_argument(
+        '--request-size', type=loader.parse_size, default=None,
+        help='Size of a single SFTP read or write request. Default: 32K.'
+    )
+    parser.add_argument(
+        '--ciphers', type=str, default=None,
+        help='Comma separated list of preferred ciphers, e.g. '
+             'aes128-gcm@openssh.com,aes128-ctr.'
+    )
+    parser.add_argument(
+        '--compression', action='store_true',
+        help='Enable SSH compression. It helps on slow links only.'
+    )
+    parser.add_argument(
+        '--no-prefetch', action='store_true',
+        help='Do not send read-ahead requests while downloading.'
+    )
+    parser.add_argument(
+        '--prefetch-requests', type=int, default=None,
+        help='The maximal number of read-ahead requests in flight. '
+             'Default: unlimited for sync engine (paramiko 3.3 or newer '
+             'is required to limit it).'
+    )
+    parser.add_argument(
+        '--stream', action='store_true',
+        help='(De)compress files on the fly without local archive files.'
+    )
+    parser.add_argument(
+        '--checksum', type=str, default=None,
+        help='Verify transferred files with checksum algorithm: sha256, '
+             'blake2b, md5, xxh64, xxh3_64, xxh128 or blake3. Default: no '
+             'verification.'
+    )
+    parser.add_argument(
+        '--delta', action='store_true',
+        help='Transfer only changed blocks of files which exist at the '
+             'destination. Works with --overwrite and sync engine without '
+             '--stream.'
+    )
+    parser.add_argument(
+        '--no-manifest', action='store_true',
+        help='Do not compare files with the manifest of content hashes.'
+    )
+    parser.add_argument(
+        '--no-index-cache', action='store_true',
+        help='Do not use the cache of parsed configuration files in '
+             '{0}.'.format(loader.INDEX_CACHE_DIR)
+    )
+    parser.add_argument(
+        '--progress', action='store_true',
+        help='Print size, time and throughput of every processed file and '
+             'bytes transferred so far every second.'
+    )
+    parser.add_argument(
+        '--order', type=str, default='index', choices=scheduler.ORDERS,
+        help='Order of files with the same priority: index - as in index '
+             'files, largest or smallest first. Default: index.'
+    )
+    parser.add_argument(
+        '--plan', action='store_true',
+        help='Print what would be transferred with estimated time and '
+             'transfer nothing.'
+    )
+    parser.add_argument(
+        '--report', type=str, default=None,
+        help='Save timing report to json or csv file.'
+    )
     parser.add_argument(
         '--check', type=str, nargs='?', default=None,
         help='Check user initial path when user logs in'
@@ -106,17 +719,36 @@ def arg_parser():
     return dict(vars(args))
 
 
+def cli_transport(args):
+    """Gets transport options given in command line."""
+    section = {
+        'window_size': args['window_size'],
+        'max_packet_size': args['max_packet_size'],
+        'request_size': args['request_size'],
+        'ciphers': args['ciphers'],
+        'prefetch_requests': args['prefetch_requests']
+    }
+    if args['compression']:
+        section['compression'] = True
+    if args['no_prefetch']:
+        section['prefetch'] = False
+    return transport_options(section)
+
+
 def main():
     args = arg_parser()
+    transport = cli_transport(args)
 
     if (args['check']):
         url = args['check']
         print('Checking access to {0}'.format(url))
-        path = check_ftp_access(url)
+        path = check_ftp_access(url, transport=transport)
         print('User login path is: {0}'.format(path))
         return
 
-    extra_kw = {}
+    extra_kw = {'checksum': args['checksum'], 'delta': args['delta']}
+    if not args['no_index_cache']:
+        extra_kw['cache_dir'] = loader.INDEX_CACHE_DIR
     if (args['base_path']):
         extra_kw['base_path'] = args['base_path']
     else:
@@ -124,46 +756,268 @@ def main():
         if hosts:
             extra_kw['hosts'] = hosts.get('hosts', None)
 
-    try:
-        url, file_trans = read_config(args['config'], **extra_kw)
-    except FileNotFoundError:
-        print('There is no configuration file {0}. Aborting...'.format(args['config']))
+    transfers = {}
+    host_transport = {}
+    for config in args['config']:
+        section = {}
+        try:
+            url, file_trans = read_config(config, transport=section, **extra_kw)
+            section = transport_options(section)
+        except FileNotFoundError:
+            print('There is no configuration file {0}. Aborting...'.format(config))
+            exit()
+        except loader.LoaderException as e:
+            print('{0} in {1}. Aborting...'.format(e.message.rstrip('.'), config))
+            exit()
+        transfers.setdefault(url, loader.FileTransferSet()).extend(file_trans)
+        host_transport.setdefault(url, {}).update(section)
+
+    if args['checksum']:
+        try:
+            loader.get_hasher(args['checksum'])
+        except loader.LoaderException as e:
+            print(e.message + ' Aborting...')
+            exit()
+
+    if args['engine'] == 'async' and aio.asyncssh is None:
+        print('Async engine requires asyncssh package. Aborting...')
         exit()
 
-    skip_existing = not args['overwrite']
+    if args['engine'] == 'async':
+        unsupported = [
+            option for option, used in (
+                ('--stream', args['stream']), ('--segments', args['segments'] > 1),
+                ('--delta', args['delta'])
+            ) if used
+        ]
+        if unsupported:
+            print('Async engine does not support {0}. Aborting...'.format(', '.join(unsupported)))
+            exit()
+
     if args['clear']:
-        clear_data(file_trans)
-    elif args['upload']:
-        print('Start compressing data ...')
-        user, passwd = auth()
-        compress_data(file_trans, skip_existing)
-        print('Start uploading project data to {0}'.format(url))
-        count = upload_data(url, user, passwd, file_trans, skip_existing)
-        print('Finished. {0} files were uploaded.\n'.format(count))
+        clear_data([
+            ft for file_trans in transfers.values()
+            for ft in file_trans.expand(loader.local_listdir, False)
+        ])
     else:
-        print('Start downloading project data from {0}'.format(url))
-        user, passwd = auth()
-        downloaded = download_data(url, user, passwd, file_trans, skip_existing)
-        print('Finished. {0} files were loaded.\n'.format(len(downloaded)))
-        decompress_data(file_trans, skip_existing)
+        limits = {
+            'limit_rate': args['limit_rate'],
+            'conn_limit_rate': args['limit_rate_per_connection'],
+            'adaptive': args['adaptive_rate']
+        }
+        with ConnectionPool(auth, transport=transport, **limits) as pool, \
+                stats.TransferStats(args['progress']) as collector:
+            for url, options in host_transport.items():
+                pool.set_transport(url, options)
+            rates = stats.load_rates()
+            for url, file_trans in transfers.items():
+                if args['plan']:
+                    run_plan(url, file_trans, pool, args, rates)
+                elif args['upload']:
+                    run_upload(url, file_trans, pool, args)
+                else:
+                    run_download(url, file_trans, pool, args)
+        if args['plan']:
+            print('Done. \n')
+            return
+        stats.save_rates(collector.totals())
+        collector.print_summary()
+        if args['report']:
+            collector.save(args['report'])
+            print('Report is saved to {0}'.format(args['report']))
     print('Done. \n')
 
 
-def check_ftp_access(url):
+def remote_archive_attr(url, pool):
+    """Creates function which gets attributes of remote archive of a file.
+
+    The attributes are taken from cached listings of the pool.
+    """
+    def remote_attr(ft):
+        remote_file = str(ft.remote_path / ft.arch_name)
+        with pool.connection(url) as conn:
+            if not conn.exists(remote_file):
+                return None
+            return conn.stat(remote_file)
+
+    return remote_attr
+
+
+def select_changed(file_trans, local, remote, remote_attr=None):
+    """Selects changed files. Iterators of files are filtered lazily."""
+    if isinstance(file_trans, Sized):
+        return manifest.select_changed(file_trans, local, remote, remote_attr)
+    return manifest.iter_changed(file_trans, local, remote, remote_attr)
+
+
+def run_upload(url, file_trans, pool, args):
+    """Compresses and uploads files to the host checking manifests."""
+    skip_existing = not args['overwrite']
+    user, passwd = pool.credentials(url)
+    use_manifest = not args['no_manifest']
+    prioritized = scheduler.is_prioritized(file_trans)
+    file_trans = expand_transfers(url, file_trans, pool, remote=False)
+    if use_manifest:
+        local, remote = load_manifests(url, user, passwd, file_trans, pool=pool)
+        file_trans = select_changed(file_trans, local, remote, remote_archive_attr(url, pool))
+    if prioritized or args['order'] != 'index':
+        file_trans = schedule_transfers(url, file_trans, pool, args['order'], remote=False)
+    print('Start compressing and uploading project data to {0}'.format(url))
+    uploaded = upload_project(url, user, passwd, file_trans, skip_existing, args, pool)
+    if use_manifest:
+        manifest.register_uploaded(uploaded, local, remote, remote_archive_attr(url, pool))
+        manifest.save_local_manifests(local)
+        with pool.connection(url) as conn:
+            manifest.save_remote_manifests(conn, remote)
+    print('Finished. {0} files were uploaded.\n'.format(len(uploaded)))
+
+
+def run_download(url, file_trans, pool, args):
+    """Downloads and decompresses files from the host checking manifests."""
+    skip_existing = not args['overwrite']
+    print('Start downloading project data from {0}'.format(url))
+    user, passwd = pool.credentials(url)
+    use_manifest = not args['no_manifest']
+    prioritized = scheduler.is_prioritized(file_trans)
+    file_trans = expand_transfers(url, file_trans, pool, remote=True)
+    if use_manifest:
+        local, remote = load_manifests(url, user, passwd, file_trans, pool=pool)
+        file_trans = select_changed(file_trans, local, remote, remote_archive_attr(url, pool))
+    if prioritized or args['order'] != 'index':
+        file_trans = schedule_transfers(url, file_trans, pool, args['order'])
+    local_cache, restored = None, []
+    if args['cache_dir']:
+        local_cache = LocalCache(args['cache_dir'], args['cache_size'], args['cache_link'])
+        file_trans = restore_cached(url, file_trans, local_cache, pool, skip_existing, restored)
+    downloaded = download_project(url, user, passwd, file_trans, skip_existing, args, pool)
+    if local_cache is not None:
+        store_cached(url, downloaded, local_cache, pool)
+    if use_manifest:
+        manifest.register_downloaded(downloaded + restored, local, remote)
+        manifest.save_local_manifests(local)
+    print('Finished. {0} files were loaded.\n'.format(len(downloaded)))
+    if restored:
+        print('{0} files were taken from the cache.\n'.format(len(restored)))
+
+
+def run_plan(url, file_trans, pool, args, rates):
+    """Prints the transfer plan for the host without transferring files.
+
+    Remote directories are listed once in bulk, and all the decisions are
+    made from the listings, local files, manifests and the local cache.
+
+    Returns
+    -------
+    entries : list[dict]
+        Plan entries, see plan.plan_download.
+    """
+    skip_existing = not args['overwrite']
+    upload = args['upload']
+    user, passwd = pool.credentials(url)
+    prioritized = scheduler.is_prioritized(file_trans)
+    file_trans = list(expand_transfers(url, file_trans, pool, remote=not upload))
+    unchanged = []
+    if not args['no_manifest']:
+        local, remote = load_manifests(url, user, passwd, file_trans, pool=pool)
+        changed = select_changed(file_trans, local, remote, remote_archive_attr(url, pool))
+        selected = set(id(ft) for ft in changed)
+        unchanged = [ft for ft in file_trans if id(ft) not in selected]
+        file_trans = changed
+    if prioritized or args['order'] != 'index':
+        file_trans = schedule_transfers(url, file_trans, pool, args['order'], not upload)
+    print('Plan of {0} project data {1} {2}'.format(
+        'uploading' if upload else 'downloading', 'to' if upload else 'from', url
+    ))
+    with pool.connection(url) as conn:
+        pool.cache(url).prefetch(conn, set(str(ft.remote_path) for ft in file_trans))
+        if upload:
+            entries = plan.plan_upload(file_trans, conn, skip_existing)
+        else:
+            local_cache = None
+            if args['cache_dir']:
+                local_cache = LocalCache(args['cache_dir'], args['cache_size'], args['cache_link'])
+            entries = plan.plan_download(url, file_trans, conn, skip_existing, local_cache)
+    entries.extend(plan.unchanged_entries(unchanged))
+    plan.print_plan(entries, rates)
+    return entries
+
+
+def download_project(url, user, passwd, file_trans, skip_existing, args, pool=None):
+    """Downloads and decompresses files in the mode selected by arguments.
+
+    Returns
+    -------
+    downloaded : list[FileTransfer]
+        Successfully downloaded files.
+    """
+    if args['engine'] == 'async':
+        downloaded = aio.download_data(
+            url, user, passwd, file_trans, skip_existing,
+            args['jobs'] or aio.ASYNC_JOBS, pool.limiter() if pool else None,
+            pool.transport(url) if pool else None
+        )
+        decompress_data(downloaded, skip_existing, args['workers'])
+        return downloaded
+    jobs = args['jobs'] or 1
+    if args['stream']:
+        return download_stream_data(
+            url, user, passwd, file_trans, skip_existing, jobs, pool=pool
+        )
+    return download_and_decompress(
+        url, user, passwd, file_trans, skip_existing, jobs,
+        args['queue_size'], args['workers'], args['segments'], pool=pool
+    )
+
+
+def upload_project(url, user, passwd, file_trans, skip_existing, args, pool=None):
+    """Compresses and uploads files in the mode selected by arguments.
+
+    Returns
+    -------
+    uploaded : list[FileTransfer]
+        Successfully uploaded files.
+    """
+    if args['engine'] == 'async':
+        file_trans = list(file_trans)
+        compress_data(file_trans, skip_existing, args['workers'], args['threads'])
+        return aio.upload_data(
+            url, user, passwd, file_trans, skip_existing,
+            args['jobs'] or aio.ASYNC_JOBS, pool.limiter() if pool else None,
+            pool.transport(url) if pool else None
+        )
+    jobs = args['jobs'] or 1
+    if args['stream']:
+        return upload_stream_data(
+            url, user, passwd, file_trans, skip_existing, jobs, args['threads'],
+            pool=pool
+        )
+    return compress_and_upload(
+        url, user, passwd, file_trans, skip_existing, jobs,
+        args['queue_size'], args['workers'], args['threads'], pool=pool
+    )
+
+
+def check_ftp_access(url, pool=None, **kwargs):
     """Checks user access to FTP server.
     
     Parameters 
     ----------
     url : str
         Server's URL.
+    pool : ConnectionPool
+        Connection pool. Default: None - a new pool is created.
+    kwargs : dict
+        Extra arguments for the new pool, e.g. transport options.
 
     Returns
     -------
     path : str
         User's login path at the server.
     """
-    user, passwd = auth()
-    with Connection(url, user, password=passwd) as conn:
+    if pool is None:
+        with ConnectionPool(auth, **kwargs) as pool:
+            return check_ftp_access(url, pool)
+    with pool.connection(url) as conn:
         path = conn.pwd
     return path
     
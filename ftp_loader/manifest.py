@@ -0,0 +1,292 @@
+# -*- coding: utf-8 -*-
+
+import hashlib
+import json
+
+from .loader import CHUNK_SIZE
+
+
+MANIFEST_NAME = '.ftp-loader-manifest.json'
+
+
+def file_hash(filename, chunk_size=CHUNK_SIZE):
+    """Calculates SHA-256 hash of file content.
+
+    Parameters
+    ----------
+    filename : Path
+        File to be hashed.
+    chunk_size : int
+        Size of data chunk. Default: CHUNK_SIZE.
+
+    Returns
+    -------
+    digest : str
+        Hex digest of file content.
+    """
+    digest = hashlib.sha256()
+    with open(filename, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class Manifest:
+    """Size, modification time and content hash of files in a folder.
+
+    Manifest is kept in MANIFEST_NAME file in the folder, both at local
+    machine and at the server. Hashes are calculated for original
+    (not compressed) files.
+
+    Parameters
+    ----------
+    entries : dict
+        A dictionary of file names and their entries. Every entry is a
+        dictionary with 'size', 'mtime' and 'hash' keys. Entries of remote
+        manifests also have 'remote_size' and 'remote_mtime' keys of the
+        uploaded archive, so the entry is not trusted once the archive is
+        changed by other means.
+    """
+    def __init__(self, entries=None):
+        self.entries = dict(entries or {})
+        self.modified = False
+
+    @classmethod
+    def load(cls, path):
+        """Loads manifest from local folder.
+
+        Parameters
+        ----------
+        path : Path
+            Local folder.
+        """
+        filename = path / MANIFEST_NAME
+        if not filename.exists():
+            return cls()
+        with open(filename) as f:
+            return cls(json.load(f))
+
+    @classmethod
+    def load_remote(cls, connection, path):
+        """Loads manifest from remote folder.
+
+        Parameters
+        ----------
+        connection : pysftp.Connection
+            Connection object.
+        path : PurePosixPath
+            Remote folder.
+        """
+        filename = str(path / MANIFEST_NAME)
+        if not connection.exists(filename):
+            return cls()
+        with connection.open(filename, 'rb') as f:
+            return cls(json.loads(f.read().decode()))
+
+    def _dumps(self):
+        return json.dumps(self.entries, indent=1, sort_keys=True)
+
+    def save(self, path):
+        """Saves manifest to local folder."""
+        with open(path / MANIFEST_NAME, 'w') as f:
+            f.write(self._dumps())
+        self.modified = False
+
+    def save_remote(self, connection, path):
+        """Saves manifest to remote folder."""
+        filename = str(path / MANIFEST_NAME)
+        if connection.exists(filename):
+            connection.remove(filename)
+        with connection.open(filename, 'wb') as f:
+            f.write(self._dumps().encode())
+        self.modified = False
+
+    def get(self, name):
+        """Gets entry for the file or None if the file is not registered."""
+        return self.entries.get(name, None)
+
+    def set(self, name, entry):
+        """Sets entry for the file."""
+        if self.entries.get(name, None) != entry:
+            self.entries[name] = entry
+            self.modified = True
+
+    def local_entry(self, path, name):
+        """Gets entry for local file.
+
+        The hash is calculated only if the file size or modification time
+        differ from the registered ones.
+
+        Parameters
+        ----------
+        path : Path
+            Local folder.
+        name : str
+            File name.
+
+        Returns
+        -------
+        entry : dict
+            Actual file entry or None if the file does not exist.
+        """
+        filename = path / name
+        if not filename.exists():
+            return None
+        stat = filename.stat()
+        entry = self.get(name)
+        if entry is None or entry['size'] != stat.st_size or entry['mtime'] != stat.st_mtime:
+            entry = {
+                'size': stat.st_size, 'mtime': stat.st_mtime,
+                'hash': file_hash(filename)
+            }
+            self.set(name, entry)
+        return entry
+
+
+class ManifestDict(dict):
+    """Dictionary of manifests keyed by folder which loads missing ones.
+
+    Parameters
+    ----------
+    load : callable
+        Function load(path) which loads manifest of the folder.
+    """
+    def __init__(self, load):
+        super().__init__()
+        self._load = load
+
+    def __missing__(self, path):
+        manifest = self[path] = self._load(path)
+        return manifest
+
+
+def load_local_manifests(file_trans):
+    """Loads manifests of all local folders of file_trans.
+
+    Returns
+    -------
+    manifests : dict
+        A dictionary of local folders and their manifests.
+    """
+    manifests = ManifestDict(Manifest.load)
+    for ft in file_trans:
+        manifests[ft.local_path]
+    return manifests
+
+
+def load_remote_manifests(connection, file_trans):
+    """Loads manifests of all remote folders of file_trans.
+
+    Returns
+    -------
+    manifests : dict
+        A dictionary of remote folders and their manifests.
+    """
+    paths = {ft.remote_path for ft in file_trans}
+    return {path: Manifest.load_remote(connection, path) for path in paths}
+
+
+def save_local_manifests(manifests):
+    """Saves modified local manifests."""
+    for path, manifest in manifests.items():
+        if manifest.modified and path.is_dir():
+            manifest.save(path)
+
+
+def save_remote_manifests(connection, manifests):
+    """Saves modified remote manifests."""
+    for path, manifest in manifests.items():
+        if manifest.modified:
+            manifest.save_remote(connection, path)
+
+
+def matches_remote(entry, attr):
+    """Checks whether remote manifest entry describes the remote archive.
+
+    Parameters
+    ----------
+    entry : dict
+        Remote manifest entry.
+    attr : paramiko.SFTPAttributes
+        Attributes of the remote archive or None if there is no archive.
+    """
+    if attr is None or 'remote_size' not in entry:
+        return False
+    return entry['remote_size'] == attr.st_size and entry['remote_mtime'] == attr.st_mtime
+
+
+def select_changed(file_trans, local, remote, remote_attr=None):
+    """Selects files which differ at local machine and the server.
+
+    Parameters
+    ----------
+    file_trans : list[FileTransfer]
+        Files to be checked.
+    local, remote : dict
+        Local and remote manifests.
+    remote_attr : callable
+        Function remote_attr(ft) which returns attributes of the remote
+        archive or None, e.g. from cached listings. If it is given, entries
+        which don't match the archive are considered changed. Default: None.
+
+    Returns
+    -------
+    changed : list[FileTransfer]
+        Files whose local hash differs from the remote one or unknown.
+    """
+    return list(iter_changed(file_trans, local, remote, remote_attr))
+
+
+def iter_changed(file_trans, local, remote, remote_attr=None):
+    """Yields files which differ at local machine and the server.
+
+    Lazy version of select_changed. Manifests must be ManifestDict if
+    file_trans is an iterator of files expanded on the fly.
+    """
+    for ft in file_trans:
+        remote_entry = remote[ft.remote_path].get(ft.name)
+        if remote_entry is not None and remote_attr is not None:
+            if not matches_remote(remote_entry, remote_attr(ft)):
+                remote_entry = None
+        local_entry = None
+        if remote_entry is not None:
+            local_entry = local[ft.local_path].local_entry(ft.local_path, ft.name)
+        if local_entry is not None and local_entry['hash'] == remote_entry['hash']:
+            print('  * File {0} is up to date. Skipping...'.format(ft.local_path / ft.name))
+        else:
+            yield ft
+
+
+def register_downloaded(file_trans, local, remote):
+    """Registers downloaded files in local manifests.
+
+    The hash is taken from the remote manifest, so the files are not read.
+    """
+    for ft in file_trans:
+        remote_entry = remote[ft.remote_path].get(ft.name)
+        filename = ft.local_path / ft.name
+        if remote_entry is None or not filename.exists():
+            continue
+        stat = filename.stat()
+        local[ft.local_path].set(ft.name, {
+            'size': stat.st_size, 'mtime': stat.st_mtime,
+            'hash': remote_entry['hash']
+        })
+
+
+def register_uploaded(file_trans, local, remote, remote_attr=None):
+    """Registers uploaded files in remote manifests.
+
+    Size and modification time of uploaded archives are taken with
+    remote_attr function if it is given, see select_changed.
+    """
+    for ft in file_trans:
+        entry = local[ft.local_path].local_entry(ft.local_path, ft.name)
+        if entry is None:
+            continue
+        entry = dict(entry)
+        attr = remote_attr(ft) if remote_attr is not None else None
+        if attr is not None:
+            entry['remote_size'] = attr.st_size
+            entry['remote_mtime'] = attr.st_mtime
+        remote[ft.remote_path].set(ft.name, entry)
@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+
+from .cache import cache_key
+
+
+ACTIONS = ('download', 'restore', 'decompress', 'compress', 'upload', 'skip', 'unchanged', 'missing')
+
+
+def _size(filename):
+    return filename.stat().st_size if filename.exists() else 0
+
+
+def _entry(ft, action, nbytes=0, phases=None):
+    return {
+        'name': str(ft.local_path / ft.name), 'action': action, 'bytes': nbytes,
+        'phases': phases or {}
+    }
+
+
+def plan_download(url, file_trans, connection, skip_existing=True, local_cache=None):
+    """Decides what a download would do with every file.
+
+    The decisions are the same as of FileTransfer.download and decompress.
+    Remote attributes are taken from RemoteCache of the connection, so
+    prefetched listings make it a pure metadata pass.
+
+    Parameters
+    ----------
+    url : str
+        Server's URL.
+    file_trans : iterable[FileTransfer]
+        Files to be downloaded.
+    connection : CachedConnection
+        Connection object.
+    skip_existing : bool
+        To skip already existing files. Default: True.
+    local_cache : LocalCache
+        Cache of downloaded files. Default: None.
+
+    Returns
+    -------
+    entries : list[dict]
+        Plan entries with 'name', 'action', 'bytes' and 'phases' keys.
+        phases is a dictionary of bytes processed by every phase.
+    """
+    entries = []
+    for ft in file_trans:
+        local_file = ft.local_path / ft.name
+        local_arch = ft.local_path / ft.arch_name
+        remote_file = str(ft.remote_path / ft.arch_name)
+        if skip_existing and local_file.exists():
+            entries.append(_entry(ft, 'skip', _size(local_file)))
+            continue
+        if skip_existing and ft.arch and local_arch.exists():
+            size = _size(local_arch)
+            entries.append(_entry(ft, 'decompress', size, {'decompress': size}))
+            continue
+        if not connection.exists(remote_file):
+            entries.append(_entry(ft, 'missing'))
+            continue
+        attr = connection.stat(remote_file)
+        size = attr.st_size or 0
+        if local_cache is not None and local_cache.contains(cache_key(url, remote_file, attr)):
+            entries.append(_entry(ft, 'restore', size))
+            continue
+        phases = {'download': size}
+        if ft.arch:
+            phases['decompress'] = size
+        entries.append(_entry(ft, 'download', size, phases))
+    return entries
+
+
+def plan_upload(file_trans, connection, skip_existing=True):
+    """Decides what an upload would do with every file.
+
+    The decisions are the same as of FileTransfer.compress and upload.
+    Size of archives which are not created yet is estimated by the size of
+    original files.
+
+    Parameters
+    ----------
+    file_trans : iterable[FileTransfer]
+        Files to be uploaded.
+    connection : CachedConnection
+        Connection object.
+    skip_existing : bool
+        To skip already uploaded files. Default: True.
+
+    Returns
+    -------
+    entries : list[dict]
+        Plan entries, see plan_download.
+    """
+    entries = []
+    for ft in file_trans:
+        local_file = ft.local_path / ft.name
+        local_arch = ft.local_path / ft.arch_name
+        remote_file = str(ft.remote_path / ft.arch_name)
+        if not local_file.exists() and not local_arch.exists():
+            entries.append(_entry(ft, 'missing'))
+            continue
+        if skip_existing and connection.exists(remote_file):
+            entries.append(_entry(ft, 'skip', _size(local_arch) or _size(local_file)))
+            continue
+        phases = {}
+        if ft.arch and not (skip_existing and local_arch.exists()):
+            phases['compress'] = _size(local_file)
+            size = _size(local_file)
+        else:
+            size = _size(local_arch)
+        phases['upload'] = size
+        entries.append(_entry(ft, 'upload', size, phases))
+    return entries
+
+
+def unchanged_entries(file_trans):
+    """Creates plan entries for files which are equal to the registered ones."""
+    return [_entry(ft, 'unchanged', _size(ft.local_path / ft.name)) for ft in file_trans]
+
+
+def summarize(entries, rates):
+    """Calculates totals of the plan.
+
+    Parameters
+    ----------
+    entries : list[dict]
+        Plan entries.
+    rates : dict
+        Measured rates of phases in MB/s.
+
+    Returns
+    -------
+    actions : dict
+        Action names and dictionaries with 'files' and 'bytes' keys.
+    phases : dict
+        Phase names and dictionaries with 'bytes', 'rate' (MB/s or None if
+        unknown) and 'seconds' (None if unknown) keys.
+    """
+    actions = {}
+    phases = {}
+    for entry in entries:
+        total = actions.setdefault(entry['action'], {'files': 0, 'bytes': 0})
+        total['files'] += 1
+        total['bytes'] += entry['bytes']
+        for phase, nbytes in entry['phases'].items():
+            total = phases.setdefault(phase, {'bytes': 0})
+            total['bytes'] += nbytes
+    for phase, total in phases.items():
+        rate = rates.get(phase, None)
+        total['rate'] = rate
+        total['seconds'] = total['bytes'] / 1.0e6 / rate if rate else None
+    return actions, phases
+
+
+def print_plan(entries, rates, verbose=True):
+    """Prints plan entries and totals with estimated time.
+
+    Parameters
+    ----------
+    entries : list[dict]
+        Plan entries.
+    rates : dict
+        Measured rates of phases in MB/s.
+    verbose : bool
+        To print every file. Default: True.
+    """
+    if verbose:
+        for entry in entries:
+            print('  * {0}: {1} ({2:.2f} MB)'.format(
+                entry['action'], entry['name'], entry['bytes'] / 1.0e6
+            ))
+    actions, phases = summarize(entries, rates)
+    for action in ACTIONS:
+        if action in actions:
+            total = actions[action]
+            print('  = {0}: {1} files, {2:.2f} MB'.format(
+                action, total['files'], total['bytes'] / 1.0e6
+            ))
+    seconds = 0.0
+    unknown = []
+    for phase, total in sorted(phases.items()):
+        if total['seconds'] is None:
+            unknown.append(phase)
+            print('  = {0}: {1:.2f} MB, rate is not measured yet'.format(
+                phase, total['bytes'] / 1.0e6
+            ))
+            continue
+        seconds += total['seconds']
+        print('  = {0}: {1:.2f} MB, about {2:.1f} s at {3:.2f} MB/s'.format(
+            phase, total['bytes'] / 1.0e6, total['seconds'], total['rate']
+        ))
+    message = '  = Estimated time: {0:.1f} s'.format(seconds)
+    if unknown:
+        message += ' without {0}'.format(', '.join(unknown))
+    print(message)
+    return seconds
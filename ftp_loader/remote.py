@@ -0,0 +1,460 @@
+# -*- coding: utf-8 -*-
+
+from contextlib import contextmanager
+import copy
+import posixpath
+import stat
+import threading
+
+from pysftp import CnOpts, Connection
+
+from . import stats
+from .loader import LoaderException, ErrorCode, is_active, parse_size
+from .throttle import RateLimiter, ThrottledFile, TokenBucket
+
+
+TRANSPORT_OPTIONS = {
+    'window_size': parse_size, 'max_packet_size': parse_size,
+    'request_size': parse_size, 'ciphers': None, 'compression': bool,
+    'prefetch': bool, 'prefetch_requests': int
+}
+
+
+def transport_options(section):
+    """Checks and converts options of [transport] section.
+
+    Parameters
+    ----------
+    section : dict
+        Raw options. Sizes can be given as numbers or strings with K, M and
+        G suffixes. ciphers can be a list or a comma separated string.
+
+    Returns
+    -------
+    options : dict
+        Options with values of proper types. None values are dropped.
+    """
+    options = {}
+    for key, value in section.items():
+        if key not in TRANSPORT_OPTIONS:
+            message = "  ! Unknown transport option {0}.".format(key)
+            raise LoaderException(ErrorCode.UNSUPPORTED_TRANSPORT, message)
+        if value is None:
+            continue
+        if key == 'ciphers':
+            value = value.split(',') if isinstance(value, str) else list(value)
+            value = [c.strip() for c in value if c.strip()]
+        elif TRANSPORT_OPTIONS[key] is parse_size:
+            value = parse_size(str(value))
+        else:
+            value = TRANSPORT_OPTIONS[key](value)
+        options[key] = value
+    return options
+
+
+def connection_kwargs(kwargs, options):
+    """Gets arguments of Connection with ciphers and compression applied.
+
+    CnOpts object is copied, so the one from kwargs is not changed.
+    """
+    if 'ciphers' not in options and 'compression' not in options:
+        return kwargs
+    kwargs = dict(kwargs)
+    cnopts = copy.copy(kwargs['cnopts']) if 'cnopts' in kwargs else CnOpts()
+    if 'ciphers' in options:
+        cnopts.ciphers = tuple(options['ciphers'])
+    if 'compression' in options:
+        cnopts.compression = options['compression']
+    kwargs['cnopts'] = cnopts
+    return kwargs
+
+
+def tune_transport(connection, options):
+    """Sets window and packet size for channels of the connection.
+
+    pysftp opens SFTP channel on the first request, so the sizes are set
+    on its transport right after the connection.
+    """
+    transport = connection._transport
+    if options.get('window_size'):
+        transport.default_window_size = options['window_size']
+    if options.get('max_packet_size'):
+        transport.default_max_packet_size = options['max_packet_size']
+
+
+class RemoteCache:
+    """Cache of remote directory listings.
+
+    Every remote directory is listed once with a single listdir_attr call.
+    Existence, size and modification time of files are then taken from
+    the listing. Files modified by the program are forgotten and checked
+    directly afterwards. Listings are fetched without holding the lock
+    of the cache, so threads wait only for the directories they need.
+    """
+    def __init__(self):
+        self._listings = {}
+        self._pending = {}
+        self._unknown = set()
+        self._lock = threading.Lock()
+
+    def _listing(self, connection, path):
+        # The listing is fetched without the lock, so lookups in other
+        # directories are not blocked by it. Lookups in the same directory
+        # wait for the fetch which has been started first.
+        while True:
+            with self._lock:
+                listing = self._listings.get(path, None)
+                if listing is not None:
+                    return listing
+                event = self._pending.get(path, None)
+                if event is None:
+                    event = self._pending[path] = threading.Event()
+                    break
+            event.wait()
+        try:
+            try:
+                attrs = connection.listdir_attr(path or '.')
+            except IOError:
+                attrs = []
+            listing = {attr.filename: attr for attr in attrs}
+            with self._lock:
+                # The directory is not published if it was forgotten meanwhile.
+                if self._pending.get(path, None) is event:
+                    self._listings[path] = listing
+        finally:
+            with self._lock:
+                if self._pending.get(path, None) is event:
+                    del self._pending[path]
+            event.set()
+        return listing
+
+    def prefetch(self, connection, paths):
+        """Fetches listings of remote directories.
+
+        Parameters
+        ----------
+        connection : pysftp.Connection
+            Connection object.
+        paths : iterable
+            Remote directories.
+        """
+        for path in paths:
+            self._listing(connection, posixpath.normpath(str(path)))
+
+    def listdir(self, connection, path):
+        """Lists remote directory using the cached listing.
+
+        Returns
+        -------
+        dirs, files : list[str]
+            Names of subdirectories and files. Both are empty if the
+            directory does not exist.
+        """
+        path = posixpath.normpath(str(path))
+        attrs = list(self._listing(connection, path).values())
+        dirs = [a.filename for a in attrs if stat.S_ISDIR(a.st_mode or 0)]
+        files = [a.filename for a in attrs if not stat.S_ISDIR(a.st_mode or 0)]
+        return dirs, files
+
+    def lookup(self, connection, path):
+        """Gets attributes of remote file.
+
+        Returns
+        -------
+        known : bool
+            Whether the file is known to the cache.
+        attr : paramiko.SFTPAttributes
+            File attributes or None if the file does not exist.
+        """
+        path = posixpath.normpath(str(path))
+        with self._lock:
+            if path in self._unknown:
+                return False, None
+        head, tail = posixpath.split(path)
+        return True, self._listing(connection, head).get(tail, None)
+
+    def forget(self, path):
+        """Marks remote file as modified, so it is checked directly."""
+        path = posixpath.normpath(str(path))
+        with self._lock:
+            self._unknown.add(path)
+            self._listings.pop(path, None)
+            self._pending.pop(path, None)
+
+
+class TunedFile:
+    """Remote file with read-ahead settings.
+
+    Parameters
+    ----------
+    file : paramiko.SFTPFile
+        Remote file object.
+    prefetch : bool
+        Whether read-ahead is allowed.
+    requests : int
+        The maximal number of read-ahead requests in flight (paramiko 3.3
+        or newer). Default: None - unlimited.
+    """
+    def __init__(self, file, prefetch=True, requests=None):
+        self._file = file
+        self._prefetch = prefetch
+        self._requests = requests
+
+    def __getattr__(self, name):
+        return getattr(self._file, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self._file.close()
+
+    def __iter__(self):
+        return iter(self._file)
+
+    def prefetch(self, file_size=None):
+        if not self._prefetch:
+            return
+        if self._requests:
+            self._file.prefetch(file_size, max_concurrent_requests=self._requests)
+        else:
+            self._file.prefetch(file_size)
+
+
+class CachedConnection:
+    """Connection which answers metadata requests from RemoteCache.
+
+    All other attributes are taken from the wrapped connection.
+
+    Parameters
+    ----------
+    connection : pysftp.Connection
+        Connection object.
+    cache : RemoteCache
+        Cache of remote listings. It can be shared by several connections.
+    limiter : RateLimiter
+        Limiter of transfer rate for opened files. Default: None.
+    transport : dict
+        Transport options. request_size, prefetch and prefetch_requests
+        are applied to opened files. Default: None.
+    """
+    def __init__(self, connection, cache=None, limiter=None, transport=None):
+        self._connection = connection
+        self._cache = cache or RemoteCache()
+        self._limiter = limiter
+        self._transport = transport or {}
+
+    def __getattr__(self, name):
+        return getattr(self._connection, name)
+
+    def exists(self, remotepath):
+        known, attr = self._cache.lookup(self._connection, remotepath)
+        if known:
+            return attr is not None
+        return self._connection.exists(remotepath)
+
+    def stat(self, remotepath):
+        known, attr = self._cache.lookup(self._connection, remotepath)
+        if known and attr is not None:
+            return attr
+        return self._connection.stat(remotepath)
+
+    def isdir(self, remotepath):
+        known, attr = self._cache.lookup(self._connection, remotepath)
+        if known:
+            return attr is not None and stat.S_ISDIR(attr.st_mode)
+        return self._connection.isdir(remotepath)
+
+    def makedirs(self, remotedir, mode=777):
+        if self.isdir(remotedir):
+            return
+        self._cache.forget(remotedir)
+        self._connection.makedirs(remotedir, mode)
+
+    def open(self, remote_file, mode='r', bufsize=-1):
+        writing = any(m in mode for m in 'wa+')
+        if writing:
+            self._cache.forget(remote_file)
+        file = self._connection.open(remote_file, mode, bufsize)
+        options = self._transport
+        if options.get('request_size'):
+            file.MAX_REQUEST_SIZE = options['request_size']
+        if not options.get('prefetch', True) or options.get('prefetch_requests'):
+            file = TunedFile(
+                file, options.get('prefetch', True), options.get('prefetch_requests')
+            )
+        if self._limiter:
+            file = ThrottledFile(
+                file, self._limiter, options.get('prefetch', True),
+                options.get('prefetch_requests')
+            )
+        return stats.track(file, remote_file, 'upload' if writing else 'download')
+
+    def remove(self, remotefile):
+        self._cache.forget(remotefile)
+        self._connection.remove(remotefile)
+
+    def rename(self, remote_src, remote_dest):
+        self._cache.forget(remote_src)
+        self._cache.forget(remote_dest)
+        self._connection.rename(remote_src, remote_dest)
+
+    def put(self, localpath, remotepath=None, *args, **kwargs):
+        if remotepath is None:
+            remotepath = posixpath.basename(str(localpath))
+        self._cache.forget(remotepath)
+        return self._connection.put(localpath, remotepath, *args, **kwargs)
+
+
+def close_quietly(connection):
+    """Closes broken connection ignoring errors."""
+    try:
+        connection.close()
+    except Exception:
+        pass
+
+
+class ConnectionPool:
+    """Pool of authenticated connections keyed by host.
+
+    Credentials are requested once per host, and released connections are
+    reused by next transfers. Connections to the same host share
+    RemoteCache. Transfer rate of all connections is limited by a shared
+    token bucket, and every connection can be limited by its own one.
+    Transport options of the host are combined with the common ones, which
+    take precedence.
+
+    Parameters
+    ----------
+    auth : callable
+        Function auth(url) which returns user name and password for the host.
+    limit_rate : int
+        Total transfer rate of all connections in bytes per second.
+        Default: None - unlimited.
+    conn_limit_rate : int
+        Transfer rate of every connection in bytes per second.
+        Default: None - unlimited.
+    adaptive : bool
+        To reduce the rates when latency of requests rises. Default: False.
+    transport : dict
+        Transport options for all hosts (see TRANSPORT_OPTIONS).
+        Default: None.
+    kwargs : dict
+        Extra arguments for Connection.
+    """
+    def __init__(self, auth=None, limit_rate=None, conn_limit_rate=None,
+                 adaptive=False, transport=None, **kwargs):
+        self._auth = auth
+        self._kwargs = kwargs
+        self._transport = dict(transport or {})
+        self._host_transport = {}
+        self._conn_limit_rate = conn_limit_rate
+        self._adaptive = adaptive
+        self._bucket = TokenBucket(limit_rate, adaptive=adaptive) if limit_rate else None
+        self._credentials = {}
+        self._idle = {}
+        self._caches = {}
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def set_credentials(self, url, user, passwd):
+        """Sets user name and password for the host."""
+        with self._lock:
+            self._credentials[url] = (user, passwd)
+
+    def credentials(self, url):
+        """Gets user name and password for the host.
+
+        They are requested with auth function when the host is met first.
+        """
+        with self._lock:
+            if url not in self._credentials:
+                self._credentials[url] = self._auth(url)
+            return self._credentials[url]
+
+    def set_transport(self, url, options):
+        """Adds transport options for the host."""
+        with self._lock:
+            self._host_transport.setdefault(url, {}).update(options)
+
+    def transport(self, url):
+        """Gets transport options for the host."""
+        with self._lock:
+            options = dict(self._host_transport.get(url, {}))
+        options.update(self._transport)
+        return options
+
+    def cache(self, url):
+        """Gets RemoteCache for the host."""
+        with self._lock:
+            return self._caches.setdefault(url, RemoteCache())
+
+    def limiter(self):
+        """Creates rate limiter for a new connection.
+
+        Returns
+        -------
+        limiter : RateLimiter
+            Limiter with the shared bucket and the connection's own one.
+        """
+        bucket = None
+        if self._conn_limit_rate:
+            bucket = TokenBucket(self._conn_limit_rate, adaptive=self._adaptive)
+        return RateLimiter(self._bucket, bucket)
+
+    def acquire(self, url):
+        """Takes idle connection to the host or opens a new one.
+
+        Returns
+        -------
+        connection : CachedConnection
+            Connection object.
+        """
+        connection = None
+        while connection is None:
+            with self._lock:
+                idle = self._idle.get(url, [])
+                if not idle:
+                    break
+                connection = idle.pop()
+            if not is_active(connection):
+                # Idle connection has been closed by the server meanwhile.
+                close_quietly(connection)
+                connection = None
+        options = self.transport(url)
+        if connection is None:
+            user, passwd = self.credentials(url)
+            kwargs = connection_kwargs(self._kwargs, options)
+            connection = Connection(url, user, password=passwd, **kwargs)
+            tune_transport(connection, options)
+        return CachedConnection(connection, self.cache(url), self.limiter(), options)
+
+    def release(self, url, connection):
+        """Returns connection to the pool. Broken connections are closed."""
+        if not is_active(connection):
+            close_quietly(connection._connection)
+            return
+        with self._lock:
+            self._idle.setdefault(url, []).append(connection._connection)
+
+    @contextmanager
+    def connection(self, url):
+        """Context manager which acquires and releases connection."""
+        connection = self.acquire(url)
+        try:
+            yield connection
+        finally:
+            self.release(url, connection)
+
+    def close(self):
+        """Closes all idle connections."""
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for connections in idle.values():
+            for connection in connections:
+                connection.close()
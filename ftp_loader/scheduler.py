@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+
+from collections.abc import Sized
+
+from .loader import FileTransferSet
+
+
+ORDERS = ('index', 'largest', 'smallest')
+
+
+def is_prioritized(file_trans):
+    """Checks whether any file has non-default priority.
+
+    Iterators are not consumed, they are considered to have no priorities.
+    """
+    if isinstance(file_trans, FileTransferSet):
+        return file_trans.prioritized
+    if isinstance(file_trans, Sized):
+        return any(ft.priority for ft in file_trans)
+    return False
+
+
+def local_size(ft):
+    """Gets size of the local file to be uploaded. 0 if there is no file."""
+    for name in (ft.name, ft.arch_name):
+        filename = ft.local_path / name
+        if filename.exists():
+            return filename.stat().st_size
+    return 0
+
+
+def remote_size(connection, ft):
+    """Gets size of the remote file to be downloaded. 0 if there is no file."""
+    remote_file = str(ft.remote_path / ft.arch_name)
+    if not connection.exists(remote_file):
+        return 0
+    return connection.stat(remote_file).st_size or 0
+
+
+def schedule(file_trans, order='index', size=None):
+    """Orders files for transfer.
+
+    Files with higher priority go first. Files of the same priority are
+    ordered by size: largest first to shorten the total time of parallel
+    transfers, smallest first to get usable files sooner, or in index order.
+    Ties keep index order.
+
+    Parameters
+    ----------
+    file_trans : iterable[FileTransfer]
+        Files to be transferred.
+    order : str
+        One of ORDERS. Default: index.
+    size : callable
+        Function size(ft) which returns size of the file. It is required
+        for largest and smallest orders, see local_size and remote_size.
+
+    Returns
+    -------
+    file_trans : list[FileTransfer]
+        Ordered files.
+    """
+    file_trans = list(file_trans)
+    if order == 'index':
+        keys = [(-ft.priority, 0) for ft in file_trans]
+    else:
+        sign = -1 if order == 'largest' else 1
+        keys = [(-ft.priority, sign * size(ft)) for ft in file_trans]
+    indices = sorted(range(len(file_trans)), key=lambda i: keys[i])
+    return [file_trans[i] for i in indices]
@@ -0,0 +1,329 @@
+# -*- coding: utf-8 -*-
+
+from contextlib import contextmanager
+import csv
+import json
+import sys
+import threading
+import time
+
+from .loader import INDEX_CACHE_DIR, PART_SUFFIX
+
+
+FIELDS = ('name', 'phase', 'bytes', 'start', 'end', 'seconds', 'rate')
+RATES_FILE = INDEX_CACHE_DIR / 'throughput.json'
+MIN_RATE_BYTES = 1024 * 1024
+RATE_WEIGHT = 0.5
+PROGRESS_INTERVAL = 1.0
+_active = None
+
+
+def phase_size(ft, phase):
+    """Gets the number of bytes processed in the phase.
+
+    Transfers are measured by the size of transferred (archive) file,
+    compression, decompression and streaming transfers - by the size of
+    original file.
+    """
+    names = [ft.name, ft.arch_name]
+    if phase in ('download', 'upload'):
+        names.reverse()
+    for name in names:
+        filename = ft.local_path / name
+        if filename.exists():
+            return filename.stat().st_size
+    return 0
+
+
+def rate(nbytes, seconds):
+    """Calculates throughput in MB/s."""
+    if seconds <= 0:
+        return 0.0
+    return nbytes / 1.0e6 / seconds
+
+
+class TransferStats:
+    """Collects sizes and durations of transfer phases.
+
+    Measurements are recorded with module-level record function and measure
+    context manager while the collector is active (within with statement).
+
+    Parameters
+    ----------
+    progress : bool
+        Print every measurement and running totals, and bytes transferred
+        so far at most every PROGRESS_INTERVAL seconds. Default: False.
+    stream : file
+        Stream for progress output. Default: sys.stderr.
+    """
+    def __init__(self, progress=False, stream=None):
+        self._progress = progress
+        self._stream = stream or sys.stderr
+        self._records = []
+        self._lock = threading.Lock()
+        self._previous = None
+        self._transferred = {}
+        self._started = None
+        self._reported = None
+
+    def __enter__(self):
+        global _active
+        self._previous = _active
+        _active = self
+        return self
+
+    def __exit__(self, *exc_info):
+        global _active
+        _active = self._previous
+
+    @property
+    def records(self):
+        """List of measurements."""
+        with self._lock:
+            return list(self._records)
+
+    def record(self, ft, phase, start, end):
+        """Records file processing.
+
+        Parameters
+        ----------
+        ft : FileTransfer
+            Processed file.
+        phase : str
+            Phase name: download, upload, compress, decompress, etc.
+        start, end : float
+            Start and end time of the processing (time.time()).
+        """
+        nbytes = phase_size(ft, phase)
+        seconds = end - start
+        entry = {
+            'name': str(ft.local_path / ft.name), 'phase': phase, 'bytes': nbytes,
+            'start': start, 'end': end, 'seconds': seconds,
+            'rate': rate(nbytes, seconds)
+        }
+        with self._lock:
+            self._records.append(entry)
+        if self._progress:
+            total = self.totals()[phase]
+            message = '  # {0}: {1} {2:.2f} MB in {3:.2f} s ({4:.2f} MB/s) | {5} files, {6:.2f} MB, {7:.2f} MB/s\n'.format(
+                phase, entry['name'], nbytes / 1.0e6, seconds, entry['rate'],
+                total['files'], total['bytes'] / 1.0e6, total['rate']
+            )
+            self._stream.write(message)
+            self._stream.flush()
+
+    def progress(self, name, phase, nbytes, size):
+        """Reports bytes of the file being transferred.
+
+        The report also shows the total number of bytes transferred in the
+        phase since the first report.
+
+        Parameters
+        ----------
+        name : str
+            Transferred file.
+        phase : str
+            Phase name: download or upload.
+        nbytes : int
+            The number of bytes transferred since the last report.
+        size : int
+            The number of bytes of the file transferred so far.
+        """
+        if not self._progress:
+            return
+        now = time.monotonic()
+        with self._lock:
+            if self._started is None:
+                self._started = self._reported = now
+            total = self._transferred[phase] = self._transferred.get(phase, 0) + nbytes
+            if now - self._reported < PROGRESS_INTERVAL:
+                return
+            self._reported = now
+        message = '  # {0}: {1} {2:.2f} MB so far | {3:.2f} MB transferred, {4:.2f} MB/s\n'.format(
+            phase, name, size / 1.0e6, total / 1.0e6, rate(total, now - self._started)
+        )
+        self._stream.write(message)
+        self._stream.flush()
+
+    def totals(self):
+        """Calculates totals per phase.
+
+        Phase rate is calculated for wall time between the start of the first
+        file and the end of the last one.
+
+        Returns
+        -------
+        totals : dict
+            Phase names and dictionaries with 'files', 'bytes', 'seconds'
+            (wall time) and 'rate' (MB/s) keys.
+        """
+        totals = {}
+        for entry in self.records:
+            total = totals.setdefault(entry['phase'], {
+                'files': 0, 'bytes': 0, 'start': entry['start'], 'end': entry['end']
+            })
+            total['files'] += 1
+            total['bytes'] += entry['bytes']
+            total['start'] = min(total['start'], entry['start'])
+            total['end'] = max(total['end'], entry['end'])
+        for total in totals.values():
+            total['seconds'] = total.pop('end') - total.pop('start')
+            total['rate'] = rate(total['bytes'], total['seconds'])
+        return totals
+
+    def print_summary(self):
+        """Prints totals per phase."""
+        for phase, total in sorted(self.totals().items()):
+            print('  * {0}: {1} files, {2:.2f} MB in {3:.2f} s ({4:.2f} MB/s)'.format(
+                phase, total['files'], total['bytes'] / 1.0e6, total['seconds'],
+                total['rate']
+            ))
+
+    def save(self, filename):
+        """Saves report.
+
+        Report format is chosen by file extension: csv file contains
+        measurements, json file contains measurements and totals.
+        """
+        filename = str(filename)
+        if filename.endswith('.csv'):
+            with open(filename, 'w', newline='') as f:
+                writer = csv.DictWriter(f, FIELDS)
+                writer.writeheader()
+                writer.writerows(self.records)
+        else:
+            with open(filename, 'w') as f:
+                json.dump({'files': self.records, 'totals': self.totals()}, f, indent=1)
+
+
+def load_rates(filename=None):
+    """Loads throughput measured in previous runs.
+
+    Parameters
+    ----------
+    filename : Path
+        File of measured rates. Default: None - RATES_FILE.
+
+    Returns
+    -------
+    rates : dict
+        Phase names and rates in MB/s. Empty if nothing was measured.
+    """
+    try:
+        with open(filename or RATES_FILE) as f:
+            rates = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return rates if isinstance(rates, dict) else {}
+
+
+def save_rates(totals, filename=None):
+    """Blends phase rates of the run into measured throughput.
+
+    Phases with less than MIN_RATE_BYTES processed are ignored. A new rate
+    is averaged with the previous one with RATE_WEIGHT.
+
+    Parameters
+    ----------
+    totals : dict
+        Phase totals, see TransferStats.totals.
+    filename : Path
+        File of measured rates. Default: None - RATES_FILE.
+    """
+    filename = filename or RATES_FILE
+    rates = load_rates(filename)
+    for phase, total in totals.items():
+        if total['bytes'] < MIN_RATE_BYTES or total['rate'] <= 0:
+            continue
+        previous = rates.get(phase, None)
+        if previous:
+            rates[phase] = RATE_WEIGHT * total['rate'] + (1 - RATE_WEIGHT) * previous
+        else:
+            rates[phase] = total['rate']
+    tmp_file = filename.with_name(filename.name + PART_SUFFIX)
+    try:
+        filename.parent.mkdir(parents=True, exist_ok=True)
+        with open(tmp_file, 'w') as f:
+            json.dump(rates, f, indent=1)
+        tmp_file.replace(filename)
+    except OSError:
+        # Measured rates are used for estimates only.
+        pass
+
+
+def record(ft, phase, start, end):
+    """Records file processing in active collector if any."""
+    if _active is not None:
+        _active.record(ft, phase, start, end)
+
+
+def progress(name, phase, nbytes, size):
+    """Reports transferred bytes to active collector if any."""
+    if _active is not None:
+        _active.progress(name, phase, nbytes, size)
+
+
+class ProgressFile:
+    """File which reports all data read or written as transferred bytes.
+
+    All other attributes are taken from the wrapped file.
+
+    Parameters
+    ----------
+    file : file
+        File object opened in binary mode.
+    name : str
+        Name of the file in reports.
+    phase : str
+        Phase name: download or upload.
+    """
+    def __init__(self, file, name, phase):
+        self._file = file
+        self._name = name
+        self._phase = phase
+        self._size = 0
+
+    def __getattr__(self, name):
+        return getattr(self._file, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self._file.close()
+
+    def _report(self, nbytes):
+        if not nbytes:
+            return
+        self._size += nbytes
+        progress(self._name, self._phase, nbytes, self._size)
+
+    def read(self, size=None):
+        data = self._file.read(size)
+        self._report(len(data))
+        return data
+
+    def readv(self, chunks):
+        for data in self._file.readv(chunks):
+            self._report(len(data))
+            yield data
+
+    def write(self, data):
+        result = self._file.write(data)
+        self._report(len(data))
+        return result
+
+
+def track(file, name, phase):
+    """Wraps the file into ProgressFile if active collector prints progress."""
+    if _active is None or not _active._progress:
+        return file
+    return ProgressFile(file, name, phase)
+
+
+@contextmanager
+def measure(ft, phase):
+    """Measures the time of successful file processing."""
+    start = time.time()
+    yield
+    record(ft, phase, start, time.time())
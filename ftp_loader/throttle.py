@@ -0,0 +1,240 @@
+# -*- coding: utf-8 -*-
+
+import threading
+import time
+
+
+REQUEST_SIZE = 32 * 1024
+READ_AHEAD_REQUESTS = 16
+BACKOFF_LATENCY = 2.0
+BACKOFF_FACTOR = 0.7
+RECOVERY_STEP = 0.05
+MIN_RATE_FRACTION = 0.1
+
+
+class TokenBucket:
+    """Token bucket limiting the transfer rate.
+
+    Every transferred byte takes one token. Tokens are refilled at the rate
+    up to the burst size. A transfer may take more tokens than available,
+    then it has to wait until the debt is refilled.
+
+    Parameters
+    ----------
+    rate : float
+        Bytes per second.
+    burst : float
+        Maximal number of accumulated tokens. Default: None - one second
+        of transfer.
+    adaptive : bool
+        To decrease the rate when request latency rises above the lowest
+        observed one and to restore it gradually otherwise. Default: False.
+    clock : callable
+        Time function. Default: time.monotonic.
+    """
+    def __init__(self, rate, burst=None, adaptive=False, clock=time.monotonic):
+        self._max_rate = float(rate)
+        self._rate = float(rate)
+        self._burst = float(burst or rate)
+        self._adaptive = adaptive
+        self._clock = clock
+        self._tokens = self._burst
+        self._time = clock()
+        self._baseline = None
+        self._lock = threading.Lock()
+
+    @property
+    def rate(self):
+        """Current rate in bytes per second."""
+        return self._rate
+
+    def reserve(self, size):
+        """Takes tokens for size bytes.
+
+        Returns
+        -------
+        delay : float
+            Time in seconds to wait before the transfer.
+        """
+        with self._lock:
+            now = self._clock()
+            self._tokens = min(self._burst, self._tokens + (now - self._time) * self._rate)
+            self._time = now
+            self._tokens -= size
+            return max(0.0, -self._tokens / self._rate)
+
+    def adapt(self, latency):
+        """Adjusts the rate to the latency of the last request.
+
+        Parameters
+        ----------
+        latency : float
+            Duration of a single request in seconds.
+        """
+        if not self._adaptive:
+            return
+        with self._lock:
+            if self._baseline is None or latency < self._baseline:
+                self._baseline = latency
+            if latency > self._baseline * BACKOFF_LATENCY:
+                rate = self._rate * BACKOFF_FACTOR
+                self._rate = max(rate, self._max_rate * MIN_RATE_FRACTION)
+            else:
+                rate = self._rate + self._max_rate * RECOVERY_STEP
+                self._rate = min(rate, self._max_rate)
+
+
+class RateLimiter:
+    """Limits transfer rate by several token buckets.
+
+    The buckets are usually the one shared by all connections and the one
+    owned by the connection.
+
+    Parameters
+    ----------
+    buckets : TokenBucket
+        Token buckets. None values are ignored.
+    """
+    def __init__(self, *buckets):
+        self._buckets = [b for b in buckets if b is not None]
+
+    def __bool__(self):
+        return bool(self._buckets)
+
+    def reserve(self, size):
+        """Takes tokens for size bytes from all buckets.
+
+        Returns
+        -------
+        delay : float
+            Time in seconds to wait before the transfer.
+        """
+        return max([b.reserve(size) for b in self._buckets], default=0.0)
+
+    def consume(self, size):
+        """Waits until size bytes can be transferred."""
+        delay = self.reserve(size)
+        if delay > 0:
+            time.sleep(delay)
+
+    def adapt(self, latency):
+        """Passes request latency to adaptive buckets."""
+        for b in self._buckets:
+            b.adapt(latency)
+
+
+class ThrottledFile:
+    """Remote file whose reads and writes are limited by RateLimiter.
+
+    Read-ahead of the whole file would transfer data at full speed. After
+    prefetch call the file is read ahead in batches of pipelined requests
+    instead, and every batch is throttled before it is requested. All other
+    attributes are taken from the wrapped file.
+
+    Parameters
+    ----------
+    file : paramiko.SFTPFile
+        Remote file object.
+    limiter : RateLimiter
+        Rate limiter.
+    prefetch : bool
+        To read ahead after prefetch call. Default: True.
+    requests : int
+        The number of requests in a batch. Default: None -
+        READ_AHEAD_REQUESTS.
+    """
+    def __init__(self, file, limiter, prefetch=True, requests=None):
+        self._file = file
+        self._limiter = limiter
+        self._prefetch = prefetch
+        self._requests = requests
+        self._end = None
+        self._buffer = b''
+
+    def __getattr__(self, name):
+        return getattr(self._file, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self._file.close()
+
+    def __iter__(self):
+        return iter(self._file)
+
+    def prefetch(self, file_size=None, max_concurrent_requests=None):
+        if not self._prefetch:
+            return
+        if file_size is None:
+            file_size = self._file.stat().st_size
+        self._requests = max_concurrent_requests or self._requests
+        self._end = file_size
+        self._buffer = b''
+
+    def _read_ahead(self):
+        position = self._file.tell()
+        request_size = getattr(self._file, 'MAX_REQUEST_SIZE', REQUEST_SIZE)
+        length = min(request_size * (self._requests or READ_AHEAD_REQUESTS), self._end - position)
+        if length <= 0:
+            return b''
+        ranges = [
+            (offset, min(request_size, position + length - offset))
+            for offset in range(position, position + length, request_size)
+        ]
+        self._limiter.consume(length)
+        start = time.monotonic()
+        data = b''.join(self._file.readv(ranges))
+        self._measure(len(data), start)
+        self._file.seek(position + len(data))
+        return data
+
+    def seek(self, offset, whence=0):
+        if whence == 1:
+            offset -= len(self._buffer)
+        self._end = None
+        self._buffer = b''
+        return self._file.seek(offset, whence)
+
+    def tell(self):
+        return self._file.tell() - len(self._buffer)
+
+    def _measure(self, size, start):
+        requests = max(1, -(-size // REQUEST_SIZE))
+        self._limiter.adapt((time.monotonic() - start) / requests)
+
+    def read(self, size=None):
+        if self._end is not None:
+            return self._read_buffered(size)
+        start = time.monotonic()
+        data = self._file.read(size)
+        self._measure(len(data), start)
+        self._limiter.consume(len(data))
+        return data
+
+    def _read_buffered(self, size=None):
+        if size is None or size < 0:
+            size = max(0, self._end - self.tell())
+        chunks = []
+        while size > 0:
+            if not self._buffer:
+                self._buffer = self._read_ahead()
+                if not self._buffer:
+                    break
+            chunk = self._buffer[:size]
+            self._buffer = self._buffer[size:]
+            chunks.append(chunk)
+            size -= len(chunk)
+        return b''.join(chunks)
+
+    def readv(self, chunks):
+        for data in self._file.readv(chunks):
+            self._limiter.consume(len(data))
+            yield data
+
+    def write(self, data):
+        self._limiter.consume(len(data))
+        start = time.monotonic()
+        result = self._file.write(data)
+        self._measure(len(data), start)
+        return result
@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+import pytest
+import bz2, gzip
+import hashlib
+
+pytest.importorskip('asyncssh')
+
+from ftp_loader import aio, loader
+from ftp_loader.main import read_config
+from tests.test_main import ftp_server1, config1, file_tree2, clear_dir
+
+
+@pytest.mark.parametrize('jobs', [1, 4])
+def test_download(ftp_server1, config1, tmp_path, jobs):
+    url, file_trans = read_config(tmp_path / 'ftp-config.toml')
+    downloads = aio.download_data(
+        url, 'user1', '1234', file_trans, True, jobs,
+        port=ftp_server1.port, known_hosts=None
+    )
+    assert downloads == file_trans
+    assert bz2.decompress((tmp_path / 'work1/file2.txt.bz2').read_bytes()) == b'File2 content'
+    assert (tmp_path / 'work2/container2.txt').read_text() == 'Container2 content'
+    downloads = aio.download_data(
+        url, 'user1', '1234', file_trans, True, jobs,
+        port=ftp_server1.port, known_hosts=None
+    )
+    assert downloads == []
+
+
+@pytest.mark.parametrize('jobs', [1, 4])
+def test_upload(sftpserver, config1, file_tree2, tmp_path, jobs):
+    url, file_trans = read_config(tmp_path / 'ftp-config.toml')
+    with sftpserver.serve_content({'project1': {}}):
+        uploads = aio.upload_data(
+            url, 'user1', '1234', file_trans, True, jobs,
+            port=sftpserver.port, known_hosts=None
+        )
+        assert len(uploads) == 4
+        data = sftpserver.content_provider.get('project1/test_data2/container/file21.csv.gz')
+        assert gzip.decompress(data) == b'File21 content'
+        assert sftpserver.content_provider.get('project1/test_data2/container/file21.csv.gz.part') is None
+
+
+def test_checksum(sftpserver, tmp_path):
+    (tmp_path / 'file1.txt').write_text('File1 content')
+    ft = loader.FileTransfer('file1.txt', tmp_path, 'project1', checksum='sha256')
+    with sftpserver.serve_content({'project1': {}}):
+        uploads = aio.upload_data(
+            'localhost', 'user1', '1234', [ft], True, port=sftpserver.port, known_hosts=None
+        )
+        assert uploads == [ft]
+        sidecar = sftpserver.content_provider.get('project1/file1.txt.sha256')
+        assert sidecar.decode().split() == [hashlib.sha256(b'File1 content').hexdigest(), 'file1.txt']
+        sftpserver.content_provider.put('project1/file1.txt.sha256', '0000  file1.txt\n')
+        ft = loader.FileTransfer('file1.txt', tmp_path / 'down', 'project1', checksum='sha256')
+        downloads = aio.download_data(
+            'localhost', 'user1', '1234', [ft], True, port=sftpserver.port, known_hosts=None
+        )
+    assert downloads == []
+    assert not (tmp_path / 'down/file1.txt').exists()
+    assert not (tmp_path / 'down/file1.txt.part').exists()
+
+
+def test_transport_options(sftpserver, tmp_path):
+    transport = {
+        'window_size': 1024 ** 2, 'max_packet_size': 16384, 'ciphers': ['aes128-ctr'],
+        'compression': False, 'request_size': 4096, 'prefetch': False
+    }
+    assert aio.connect_options(transport) == {
+        'window': 1024 ** 2, 'max_pktsize': 16384, 'encryption_algs': ['aes128-ctr'],
+        'compression_algs': ['none']
+    }
+    assert aio.file_options(transport) == {'block_size': 4096, 'max_requests': 1}
+    assert aio.file_options({'prefetch_requests': 8}) == {'max_requests': 8}
+    content = b'x' * 100000
+    ft = loader.FileTransfer('file1.txt', tmp_path, 'project1')
+    with sftpserver.serve_content({'project1': {'file1.txt': content}}):
+        downloads = aio.download_data(
+            'localhost', 'user1', '1234', [ft], True, transport=transport,
+            port=sftpserver.port, known_hosts=None
+        )
+    assert downloads == [ft]
+    assert (tmp_path / 'file1.txt').read_bytes() == content
+
+
+@pytest.mark.parametrize('stamp, resumed', [(True, True), (False, False)])
+def test_download_resume(sftpserver, tmp_path, monkeypatch, capsys, stamp, resumed):
+    monkeypatch.setattr(aio, 'source_stamp', lambda size, mtime: '{0} 1000'.format(size))
+    content = bytes(range(256)) * 4
+    (tmp_path / 'file1.txt.part').write_bytes(content[:500])
+    if stamp:
+        (tmp_path / ('file1.txt' + loader.STAMP_SUFFIX)).write_text('1024 1000')
+    ft = loader.FileTransfer('file1.txt', tmp_path, 'project1', checksum='sha256')
+    with sftpserver.serve_content({'project1': {'file1.txt': content}}):
+        downloads = aio.download_data(
+            'localhost', 'user1', '1234', [ft], True, port=sftpserver.port, known_hosts=None
+        )
+    assert downloads == [ft]
+    assert ('resuming from byte 500' in capsys.readouterr().out) == resumed
+    assert (tmp_path / 'file1.txt').read_bytes() == content
+    assert sorted(p.name for p in tmp_path.iterdir()) == ['file1.txt']
+
+
+def test_run_transfers_lazy(sftpserver, tmp_path):
+    pulled = []
+    started = []
+
+    def file_trans():
+        for i in range(10):
+            pulled.append(i)
+            yield loader.FileTransfer('file{0}.txt'.format(i), tmp_path, 'project1')
+
+    async def action(sftp, ft):
+        started.append(len(pulled))
+        await asyncio.sleep(0.01)
+        if ft.name == 'file3.txt':
+            raise loader.LoaderException(loader.ErrorCode.TRANSFER_INCOMPLETE, 'failed')
+
+    with sftpserver.serve_content({'project1': {}}):
+        done = asyncio.run(aio.run_transfers(
+            'localhost', 'user1', '1234', file_trans(), action, 2,
+            port=sftpserver.port, known_hosts=None
+        ))
+    assert [ft.name for ft in done] == ['file{0}.txt'.format(i) for i in range(10) if i != 3]
+    assert started[:2] == [1, 2]
+    assert max(n - i for i, n in enumerate(started)) <= 2
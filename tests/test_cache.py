@@ -0,0 +1,85 @@
+import os
+import pytest
+from types import SimpleNamespace
+
+from ftp_loader.cache import LocalCache, cache_key, link_file
+
+
+@pytest.mark.parametrize('mode', ['auto', 'hardlink', 'copy'])
+def test_link_file(tmp_path, mode):
+    src = tmp_path / 'src.txt'
+    src.write_text('content')
+    dst = tmp_path / 'dst.txt'
+    dst.write_text('old content')
+    link_file(src, dst, mode)
+    assert dst.read_text() == 'content'
+    assert not (tmp_path / 'dst.txt.part').exists()
+    if mode == 'hardlink':
+        assert dst.stat().st_ino == src.stat().st_ino
+    else:
+        assert dst.stat().st_ino != src.stat().st_ino
+
+
+def test_link_file_missing(tmp_path):
+    with pytest.raises(OSError):
+        link_file(tmp_path / 'src.txt', tmp_path / 'dst.txt', 'copy')
+    assert not (tmp_path / 'dst.txt.part').exists()
+
+
+def test_cache_key():
+    attr = SimpleNamespace(st_size=10, st_mtime=1000)
+    key = cache_key('localhost', 'data/file.txt.gz', attr)
+    assert key == cache_key('localhost', 'data/file.txt.gz', attr)
+    assert key != cache_key('otherhost', 'data/file.txt.gz', attr)
+    assert key != cache_key('localhost', 'data/file.txt.gz', SimpleNamespace(st_size=10, st_mtime=1001))
+
+
+@pytest.mark.parametrize('mode', ['auto', 'hardlink', 'copy'])
+def test_store_restore(tmp_path, mode):
+    cache = LocalCache(tmp_path / 'cache', mode=mode)
+    src = tmp_path / 'file.txt'
+    src.write_text('content')
+    dst = tmp_path / 'work/file.txt'
+    dst.parent.mkdir()
+    assert not cache.restore('ab12', dst)
+    assert not dst.exists()
+    cache.store('ab12', src)
+    cache.store('ab12', src)
+    assert cache.restore('ab12', dst)
+    assert dst.read_text() == 'content'
+    entries = cache.entries()
+    assert len(entries) == 1
+    assert entries[0][1] == 7
+    assert entries[0][2] == tmp_path / 'cache/objects/ab/ab12'
+
+
+def test_evict(tmp_path):
+    cache = LocalCache(tmp_path / 'cache', max_size=25, mode='copy')
+    for i, key in enumerate(['aa01', 'bb02', 'cc03']):
+        src = tmp_path / key
+        src.write_bytes(b'x' * 10)
+        cache.store(key, src)
+        os.utime(tmp_path / 'cache/objects' / key[:2] / key, (1000 + i, 1000 + i))
+    # The last stored file has made the cache exceed the limit.
+    assert len(cache.entries()) == 2
+    assert not cache.restore('aa01', tmp_path / 'out')
+    os.utime(tmp_path / 'cache/objects/bb/bb02', (2000, 2000))
+    assert cache.evict(10) == 1
+    assert [e[2].name for e in cache.entries()] == ['bb02']
+    assert cache.evict() == 0
+
+
+def test_evict_running_total(tmp_path, monkeypatch):
+    cache = LocalCache(tmp_path / 'cache', max_size=100, mode='copy')
+    scans = []
+    entries = LocalCache.entries
+    monkeypatch.setattr(LocalCache, 'entries', lambda self: scans.append(1) or entries(self))
+    for i in range(12):
+        key = '{0:02d}aa'.format(i)
+        src = tmp_path / key
+        src.write_bytes(b'x' * 10)
+        cache.store(key, src)
+        os.utime(tmp_path / 'cache/objects' / key[:2] / key, (1000 + i, 1000 + i))
+    # The first store counts the size, and the only eviction leaves 90%.
+    assert len(scans) == 2
+    assert sum(e[1] for e in entries(cache)) == 100
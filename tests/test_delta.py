@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+import io
+import os
+import zlib
+
+from ftp_loader import delta
+from ftp_loader.delta import Signature, roll_checksum, weak_checksum
+
+
+def test_roll_checksum():
+    data = os.urandom(1000)
+    block_size = 100
+    weak = weak_checksum(data[:block_size])
+    for offset in range(len(data) - block_size):
+        weak = roll_checksum(weak, data[offset], data[offset + block_size], block_size)
+        assert weak == zlib.adler32(data[offset + 1:offset + 1 + block_size])
+
+
+def test_signature_dumps():
+    sig = Signature.from_file(io.BytesIO(b'0123456789'), 4)
+    assert sig.size == 10
+    assert len(sig.blocks) == 3
+    assert sig.block_range(2) == (8, 2)
+    sig2 = Signature.loads(sig.dumps())
+    assert sig2.blocks == sig.blocks
+    assert sig2.digest == sig.digest
+    assert Signature.loads('{"version": 0}') is None
+
+
+def test_default_block_size(monkeypatch):
+    monkeypatch.setattr(delta, 'DELTA_BLOCK_SIZE', 16)
+    sig = Signature.from_file(io.BytesIO(b'x' * 40))
+    assert sig.block_size == 16
+    assert len(sig.blocks) == 3
+
+
+def _edit(data, block_size):
+    # Insertion in the second block shifts the rest of data.
+    return data[:block_size + 5] + b'inserted' + data[block_size + 5:]
+
+
+def _modify(data, block_size):
+    return data[:2 * block_size] + os.urandom(block_size) + data[3 * block_size:]
+
+
+@pytest.mark.parametrize('edit, missing', [
+    (lambda data, bs: data, []),
+    (_edit, [1]),
+    (_modify, [2]),
+    (lambda data, bs: data[bs:], []),
+    (lambda data, bs: os.urandom(bs) + data, [0]),
+    (lambda data, bs: data[:-10], []),
+    (lambda data, bs: data[:-10] + b'tail', [4]),
+    (lambda data, bs: os.urandom(5 * bs), [0, 1, 2, 3, 4]),
+])
+def test_match(edit, missing):
+    block_size = 64
+    old = os.urandom(5 * block_size - 20)
+    new = edit(old, block_size)
+    sig = Signature.from_file(io.BytesIO(new), block_size)
+    found = sig.match(old)
+    assert sorted(set(range(len(sig.blocks))) - set(found)) == missing
+    for index, offset in found.items():
+        start, length = sig.block_range(index)
+        assert old[offset:offset + length] == new[start:start + length]
+
+
+def test_match_rolled_limit(monkeypatch):
+    block_size = 64
+    old = os.urandom(5 * block_size)
+    new = old[:block_size] + os.urandom(3 * block_size) + old[4 * block_size:]
+    shifted = os.urandom(10) + old
+    sig = Signature.from_file(io.BytesIO(new), block_size)
+    assert sorted(sig.match(old, max_rolled=0)) == [0, 4]
+    assert sorted(sig.match(shifted)) == [0, 4]
+    assert sorted(sig.match(shifted, max_rolled=5)) == []
+    monkeypatch.setattr(delta, 'MAX_ROLLED_BYTES', 5)
+    assert sorted(sig.match(shifted)) == []
+
+
+def test_match_empty():
+    assert Signature.from_file(io.BytesIO(b''), 16).match(b'data') == {}
+    sig = Signature.from_file(io.BytesIO(b'data'), 16)
+    assert sig.match(b'') == {}
+    assert sig.match(b'xxdata') == {0: 2}
+
+
+def test_map_file(tmp_path):
+    (tmp_path / 'empty').write_bytes(b'')
+    (tmp_path / 'data').write_bytes(b'content')
+    with delta.map_file(tmp_path / 'empty') as data:
+        assert data == b''
+    with delta.map_file(tmp_path / 'data') as data:
+        assert data[:] == b'content'
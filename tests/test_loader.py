@@ -3,9 +3,17 @@
 import pytest
 from pathlib import Path, PurePosixPath
 import bz2, gzip
+from contextlib import contextmanager
+import hashlib
+import io
+import os
+import pickle
+from paramiko.sftp import SFTP_FAILURE, SFTP_OK
 from pysftp import Connection, CnOpts
+from pytest_sftpserver.sftp.interface import VirtualSFTPHandle
 
-from ftp_loader import loader
+from ftp_loader import delta, loader
+from ftp_loader.delta import Signature
 
 
 @pytest.mark.parametrize("filename, ans_url, ans_path, ans_files", [
@@ -73,6 +81,24 @@ def test_file_transfer_creation(path, files, answer):
         assert ft._arch == ans[3]
 
 
+def test_file_transfer_options():
+    files = [{'dst': 'work', 'src': 'storage', 'arch': 'zst', 'level': 19, 'threads': 4, 'names': ['a.txt']}]
+    ft, = loader.create_file_transfers('project', files)
+    assert ft._level == 19
+    assert ft._threads == 4
+
+
+def test_file_transfer_checksum_options():
+    files = [
+        {'dst': 'work', 'src': 'storage', 'checksum': 'md5', 'digests': {'a.txt': 'abc'}, 'names': ['a.txt', 'b.txt']},
+        {'dst': 'work', 'src': 'storage', 'names': ['c.txt']},
+    ]
+    ft_a, ft_b, ft_c = loader.create_file_transfers('project', files, 'sha256')
+    assert (ft_a.checksum, ft_a.digest, ft_a.sidecar_name) == ('md5', 'abc', 'a.txt.md5')
+    assert (ft_b.checksum, ft_b.digest) == ('md5', None)
+    assert (ft_c.checksum, ft_c.digest) == ('sha256', None)
+
+
 @pytest.fixture(scope='function')
 def ftp_server1(sftpserver):
     data = {
@@ -440,3 +466,721 @@ def test_compress_raises(file_tree3, tmp_path, local, remote, name, arch, skip):
 
 
 
+
+
+@pytest.mark.parametrize('arch, chunk_size', [
+    ('bz2', 1), ('bz2', 7), ('bz2', 4096), ('gz', 1), ('gz', 7), ('gz', 4096),
+])
+def test_compress_decompress_chunked(tmp_path, arch, chunk_size):
+    content = b''.join(bytes([i % 251]) * (i % 13) for i in range(3000))
+    create_temp_file(tmp_path, 'data.bin', content, True)
+    ft = loader.FileTransfer('data.bin', tmp_path, 'remote', arch)
+    ft.compress(True, chunk_size=chunk_size)
+    archive = (tmp_path / ft._arch_name).read_bytes()
+    assert loader.get_archivator(arch).decompress(archive) == content
+    (tmp_path / 'data.bin').unlink()
+    ft.decompress(True, chunk_size=chunk_size)
+    assert (tmp_path / 'data.bin').read_bytes() == content
+
+
+@pytest.mark.parametrize('part, check_size', [
+    (b'', 4), (b'File1 ', 4), (b'File1 ', 100), (b'Xile1 ', 100), (b'File1X', 2),
+    (b'File1 content', 4), (b'File1 content and more', 4),
+])
+def test_download_resume(sftpserver, tmp_path, monkeypatch, part, check_size):
+    monkeypatch.setattr(loader, 'RESUME_CHECK_SIZE', check_size)
+    content = b'File1 content'
+    create_temp_file(tmp_path, 'file1.txt.part', part, True)
+    cnopts = CnOpts()
+    cnopts.hostkeys = None
+    ft = loader.FileTransfer('file1.txt', tmp_path, 'project1')
+    with sftpserver.serve_content({'project1': {'file1.txt': content}}):
+        with Connection('127.0.0.1', port=sftpserver.port, username='user1', password='1234', cnopts=cnopts) as conn:
+            ft.download(conn, skip_existing=True, chunk_size=3)
+    assert (tmp_path / 'file1.txt').read_bytes() == content
+    assert not (tmp_path / 'file1.txt.part').exists()
+
+
+@pytest.mark.parametrize('part', ['File1 ', 'Xile1 ', 'File1 content and more'])
+def test_upload_resume(sftpserver, tmp_path, part):
+    content = b'File1 content'
+    create_temp_file(tmp_path, 'file1.txt', content, True)
+    cnopts = CnOpts()
+    cnopts.hostkeys = None
+    ft = loader.FileTransfer('file1.txt', tmp_path, 'project1')
+    with sftpserver.serve_content({'project1': {'file1.txt.part': part}}):
+        with Connection('127.0.0.1', port=sftpserver.port, username='user1', password='1234', cnopts=cnopts) as conn:
+            ft.upload(conn, skip_existing=True)
+        assert sftpserver.content_provider.get('project1/file1.txt') == content
+        assert sftpserver.content_provider.get('project1/file1.txt.part') is None
+
+
+class FixedMtimeConnection:
+    def __init__(self, connection, mtime):
+        self.connection = connection
+        self.mtime = mtime
+
+    def __getattr__(self, name):
+        return getattr(self.connection, name)
+
+    def stat(self, remotepath):
+        attr = self.connection.stat(remotepath)
+        attr.st_mtime = self.mtime
+        return attr
+
+
+OLD_CONTENT = bytes(range(256)) * 4
+
+
+@pytest.mark.parametrize('content, mtime, stamp, resumed', [
+    (OLD_CONTENT, 1000, True, True),
+    (b'X' + OLD_CONTENT[1:], 2000, True, False),
+    (OLD_CONTENT, 1000, False, False),
+], ids=['same', 'changed', 'no-stamp'])
+def test_download_resume_changed_source(sftpserver, tmp_path, monkeypatch, capsys,
+                                        content, mtime, stamp, resumed):
+    monkeypatch.setattr(loader, 'RESUME_CHECK_SIZE', 4)
+    create_temp_file(tmp_path, 'file1.txt.part', OLD_CONTENT[:500], True)
+    if stamp:
+        create_temp_file(tmp_path, 'file1.txt' + loader.STAMP_SUFFIX, b'1024 1000', True)
+    cnopts = CnOpts()
+    cnopts.hostkeys = None
+    ft = loader.FileTransfer('file1.txt', tmp_path, 'project1')
+    with sftpserver.serve_content({'project1': {'file1.txt': content}}):
+        with Connection('127.0.0.1', port=sftpserver.port, username='user1', password='1234', cnopts=cnopts) as conn:
+            ft.download(FixedMtimeConnection(conn, mtime), skip_existing=True)
+    assert ('resuming from byte 500' in capsys.readouterr().out) == resumed
+    assert (tmp_path / 'file1.txt').read_bytes() == content
+    assert sorted(p.name for p in tmp_path.iterdir()) == ['file1.txt']
+
+
+@pytest.mark.parametrize('content, mtime, stamp, resumed', [
+    (OLD_CONTENT, 1000, True, True),
+    (b'X' + OLD_CONTENT[1:], 2000, True, False),
+    (OLD_CONTENT, 1000, False, False),
+], ids=['same', 'changed', 'no-stamp'])
+def test_upload_resume_changed_source(sftpserver, tmp_path, monkeypatch, capsys,
+                                      content, mtime, stamp, resumed):
+    monkeypatch.setattr(VirtualSFTPHandle, 'write', _write)
+    create_temp_file(tmp_path, 'file1.txt', content, True)
+    os.utime(tmp_path / 'file1.txt', (mtime, mtime))
+    cnopts = CnOpts()
+    cnopts.hostkeys = None
+    ft = loader.FileTransfer('file1.txt', tmp_path, 'project1')
+    remote = {'file1.txt.part': OLD_CONTENT[:500]}
+    if stamp:
+        remote['file1.txt' + loader.STAMP_SUFFIX] = '1024 1000'
+    with sftpserver.serve_content({'project1': remote}):
+        with Connection('127.0.0.1', port=sftpserver.port, username='user1', password='1234', cnopts=cnopts) as conn:
+            ft.upload(conn, skip_existing=True)
+        assert sftpserver.content_provider.get('project1/file1.txt') == content
+        assert sftpserver.content_provider.get('project1/file1.txt.part') is None
+        assert sftpserver.content_provider.get('project1/file1.txt' + loader.STAMP_SUFFIX) is None
+    assert ('resuming from byte 500' in capsys.readouterr().out) == resumed
+
+
+@pytest.mark.parametrize('arch, size, threads, block_size', [
+    ('bz2', 0, 2, 16), ('bz2', 1000, 3, 64), ('bz2', 1000, 4, 5000),
+    ('gz', 0, 2, 16), ('gz', 1000, 3, 64), ('gz', 1001, 2, 1),
+])
+def test_parallel_compress(tmp_path, monkeypatch, arch, size, threads, block_size):
+    monkeypatch.setattr(loader, 'BLOCK_SIZE', block_size)
+    content = bytes(i * 7 % 256 for i in range(size))
+    create_temp_file(tmp_path, 'data.bin', content, True)
+    ft = loader.FileTransfer('data.bin', tmp_path, 'remote', arch)
+    ft.compress(True, threads=threads)
+    archive = (tmp_path / ft._arch_name).read_bytes()
+    assert loader.get_archivator(arch).decompress(archive) == content
+    (tmp_path / 'data.bin').unlink()
+    ft.decompress(True, chunk_size=10)
+    assert (tmp_path / 'data.bin').read_bytes() == content
+
+
+@pytest.mark.parametrize('arch, module, level, threads', [
+    ('xz', 'lzma', None, None), ('xz', 'lzma', 1, None), ('xz', 'lzma', 6, 3),
+    ('zst', 'zstandard', None, None), ('zst', 'zstandard', 19, None), ('zst', 'zstandard', 1, 4),
+    ('lz4', 'lz4.frame', None, None), ('lz4', 'lz4.frame', 9, 2),
+    ('gz', 'gzip', 1, None), ('bz2', 'bz2', 9, 2),
+])
+def test_archive_types(tmp_path, arch, module, level, threads):
+    pytest.importorskip(module)
+    content = b''.join(str(i).encode() for i in range(20000))
+    create_temp_file(tmp_path, 'data.bin', content, True)
+    ft = loader.FileTransfer('data.bin', tmp_path, 'remote', arch, level, threads)
+    ft.compress(True)
+    with loader.get_archivator(arch).open(tmp_path / ft._arch_name, 'rb') as f:
+        assert f.read() == content
+    (tmp_path / 'data.bin').unlink()
+    ft.decompress(True, chunk_size=1000)
+    assert (tmp_path / 'data.bin').read_bytes() == content
+
+
+@pytest.mark.parametrize('arch, module, truncated', [
+    ('gz', 'gzip', True), ('bz2', 'bz2', True), ('xz', 'lzma', True),
+    # zstandard reader stops silently at the end of truncated frame.
+    ('zst', 'zstandard', False), ('lz4', 'lz4.frame', True),
+])
+def test_decompress_corrupted(tmp_path, arch, module, truncated):
+    pytest.importorskip(module)
+    content = b''.join(str(i).encode() for i in range(20000))
+    create_temp_file(tmp_path, 'data.bin', content, True)
+    ft = loader.FileTransfer('data.bin', tmp_path, 'remote', arch)
+    ft.compress(True)
+    (tmp_path / 'data.bin').unlink()
+    archive = (tmp_path / ft._arch_name).read_bytes()
+    broken_archives = [b'not an archive' * 100]
+    if truncated:
+        broken_archives.append(archive[:len(archive) // 2])
+    for broken in broken_archives:
+        (tmp_path / ft._arch_name).write_bytes(broken)
+        with pytest.raises(loader.LoaderException) as e:
+            ft.decompress(True, chunk_size=1000)
+        assert e.value.code == loader.ErrorCode.CODEC_FAILED
+        assert not (tmp_path / 'data.bin').exists()
+        assert not (tmp_path / ('data.bin' + loader.PART_SUFFIX)).exists()
+    (tmp_path / ft._arch_name).write_bytes(archive)
+    ft.decompress(True, chunk_size=1000)
+    assert (tmp_path / 'data.bin').read_bytes() == content
+
+
+def test_missing_archivator(monkeypatch):
+    monkeypatch.setitem(loader.ARCHIVATORS, 'zst', 'not_installed_module')
+    with pytest.raises(loader.LoaderException) as e:
+        loader.get_archivator('zst')
+    assert e.value.code == loader.ErrorCode.UNSUPPORTED_ARCHIVE
+    with pytest.raises(loader.LoaderException) as e:
+        loader.get_archivator('rar')
+    assert e.value.code == loader.ErrorCode.UNSUPPORTED_ARCHIVE
+
+
+@pytest.mark.parametrize('local, remote, name, arch, content', [
+    ('loc_project1/loc_test_data1', 'project1/test_data1', 'file1.txt', 'bz2', 'File1 content'),
+    ('loc_project1/loc_test_data2/loc_container', 'project1/test_data2/container', 'file22.csv', 'gz', 'FIle22 content'),
+    ('loc_project2/loc_data3', 'project2/data3', 'file31.txt', None, 'File31 content'),
+])
+def test_download_stream(ftp_server1, tmp_path, local, remote, name, arch, content):
+    cnopts = CnOpts()
+    cnopts.hostkeys = None
+    ft = loader.FileTransfer(name, tmp_path / local, remote, arch)
+    with Connection('127.0.0.1', port=ftp_server1.port, username='user1', password='1234', cnopts=cnopts) as conn:
+        ft.download_stream(conn, skip_existing=True)
+    assert (tmp_path / local / name).read_text() == content
+    assert not (tmp_path / local / ft._arch_name).exists() or arch is None
+
+
+@pytest.mark.parametrize('local, remote, name, arch, threads, content', [
+    ('loc_project1/loc_test_data1', 'project1/test_data1', 'file1.txt', 'bz2', 1, 'File1 content'),
+    ('loc_project1/loc_test_data1', 'project1/test_data1', 'file2.txt', 'bz2', 2, 'File2 content'),
+    ('loc_project1/loc_test_data2/loc_container', 'project1/test_data2/container', 'file21.csv', 'gz', 1, 'File21 content'),
+    ('loc_project1/loc_test_data2/loc_container', 'project1/test_data2/container', 'file22.csv', 'xz', 3, 'FIle22 content'),
+])
+def test_upload_stream(ftp_server2, file_tree4, tmp_path, local, remote, name, arch, threads, content):
+    cnopts = CnOpts()
+    cnopts.hostkeys = None
+    ft = loader.FileTransfer(name, tmp_path / local, remote, arch)
+    with Connection('127.0.0.1', port=ftp_server2.port, username='user1', password='1234', cnopts=cnopts) as conn:
+        ft.upload_stream(conn, skip_existing=True, threads=threads)
+    assert not (tmp_path / local / ft._arch_name).exists()
+    data = ftp_server2.content_provider.get(remote + '/' + ft._arch_name)
+    assert loader.get_archivator(arch).decompress(data).decode() == content
+
+
+@pytest.mark.parametrize('text, answer', [
+    ('512', 512), ('64K', 65536), ('50M', 50 * 1024 ** 2), ('1.5G', 3 * 1024 ** 3 // 2), ('2mb', 2 * 1024 ** 2),
+])
+def test_parse_size(text, answer):
+    assert loader.parse_size(text) == answer
+
+
+def sha256(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+@pytest.mark.parametrize('algorithm', ['sha256', 'md5', 'blake2b'])
+def test_get_hasher(algorithm):
+    hasher = loader.get_hasher(algorithm)()
+    hasher.update(b'content')
+    assert hasher.hexdigest() == hashlib.new(algorithm, b'content').hexdigest()
+
+
+def test_unsupported_hasher(monkeypatch):
+    monkeypatch.setitem(loader.HASHERS, 'xxh64', ('not_installed_module', 'xxh64'))
+    for algorithm in ['xxh64', 'crc-unknown']:
+        with pytest.raises(loader.LoaderException) as e:
+            loader.get_hasher(algorithm)
+        assert e.value.code == loader.ErrorCode.UNSUPPORTED_CHECKSUM
+
+
+@pytest.mark.parametrize('size', [None, 0, 3, 5, 100])
+def test_hash_stream(tmp_path, size):
+    content = b'0123456789'
+    hasher = hashlib.sha256()
+    create_temp_file(tmp_path, 'data.bin', content, True)
+    with open(tmp_path / 'data.bin', 'rb') as f:
+        loader.hash_stream(f, hasher, 2, size)
+    assert hasher.hexdigest() == sha256(content[:size])
+
+
+@pytest.mark.parametrize('sidecar, digest, ok', [
+    (None, None, True),
+    ('{0}  file1.txt.bz2\n', None, True),
+    ('0000  file1.txt.bz2\n', None, False),
+    ('0000  file1.txt.bz2\n', '{0}', True),
+    (None, '0000', False),
+])
+@pytest.mark.parametrize('method', ['download', 'download_stream'])
+def test_download_checksum(sftpserver, tmp_path, sidecar, digest, ok, method):
+    archive = bz2.compress(b'File1 content')
+    files = {'file1.txt.bz2': archive}
+    if sidecar:
+        files['file1.txt.bz2.sha256'] = sidecar.format(sha256(archive))
+    if digest:
+        digest = digest.format(sha256(archive))
+    cnopts = CnOpts()
+    cnopts.hostkeys = None
+    ft = loader.FileTransfer('file1.txt', tmp_path, 'project1', 'bz2', checksum='sha256', digest=digest)
+    with sftpserver.serve_content({'project1': files}):
+        with Connection('127.0.0.1', port=sftpserver.port, username='user1', password='1234', cnopts=cnopts) as conn:
+            if ok:
+                getattr(ft, method)(conn, skip_existing=True)
+            else:
+                with pytest.raises(loader.LoaderException) as e:
+                    getattr(ft, method)(conn, skip_existing=True)
+                assert e.value.code == loader.ErrorCode.CHECKSUM_MISMATCH
+    assert not list(tmp_path.glob('*.part'))
+    if ok:
+        assert ft.digest == sha256(archive)
+    else:
+        assert not list(tmp_path.iterdir())
+
+
+@pytest.mark.parametrize('method', ['upload', 'upload_stream'])
+def test_upload_checksum(sftpserver, tmp_path, method):
+    create_temp_file(tmp_path, 'file1.txt', 'File1 content')
+    cnopts = CnOpts()
+    cnopts.hostkeys = None
+    ft = loader.FileTransfer('file1.txt', tmp_path, 'project1', 'gz', checksum='sha256')
+    if method == 'upload':
+        ft.compress()
+    with sftpserver.serve_content({'project1': {'file1.txt.gz.sha256': 'stale'}}):
+        with Connection('127.0.0.1', port=sftpserver.port, username='user1', password='1234', cnopts=cnopts) as conn:
+            getattr(ft, method)(conn, skip_existing=True)
+        archive = sftpserver.content_provider.get('project1/file1.txt.gz')
+        sidecar = sftpserver.content_provider.get('project1/file1.txt.gz.sha256')
+    assert gzip.decompress(archive) == b'File1 content'
+    assert ft.digest == sha256(archive)
+    assert sidecar.decode() == '{0}  file1.txt.gz\n'.format(sha256(archive))
+
+
+def test_upload_checksum_mismatch(sftpserver, tmp_path):
+    create_temp_file(tmp_path, 'file1.txt', 'File1 content')
+    cnopts = CnOpts()
+    cnopts.hostkeys = None
+    ft = loader.FileTransfer('file1.txt', tmp_path, 'project1', checksum='sha256', digest='0000')
+    with sftpserver.serve_content({'project1': {}}):
+        with Connection('127.0.0.1', port=sftpserver.port, username='user1', password='1234', cnopts=cnopts) as conn:
+            with pytest.raises(loader.LoaderException) as e:
+                ft.upload(conn, skip_existing=True)
+        assert e.value.code == loader.ErrorCode.CHECKSUM_MISMATCH
+        assert sftpserver.content_provider.get('project1/file1.txt') is None
+        assert sftpserver.content_provider.get('project1/file1.txt.part') is None
+
+
+@pytest.mark.parametrize('arch', ['bz2', 'gz', 'xz'])
+def test_decompress_checksum(tmp_path, arch):
+    create_temp_file(tmp_path, 'data.txt', 'Data content')
+    ft = loader.FileTransfer('data.txt', tmp_path, 'remote', arch, checksum='sha256')
+    ft.compress()
+    archive = (tmp_path / ft.arch_name).read_bytes()
+    ft.decompress(False, remove_archive=False)
+    assert ft.digest is None
+    ft = loader.FileTransfer('data.txt', tmp_path, 'remote', arch, checksum='sha256', digest=sha256(archive))
+    ft.decompress(False, remove_archive=False)
+    assert (tmp_path / 'data.txt').read_text() == 'Data content'
+    ft = loader.FileTransfer('data.txt', tmp_path, 'remote', arch, checksum='sha256', digest='0000')
+    with pytest.raises(loader.LoaderException) as e:
+        ft.decompress(False, remove_archive=False)
+    assert e.value.code == loader.ErrorCode.CHECKSUM_MISMATCH
+    assert not (tmp_path / 'data.txt').exists()
+
+
+@pytest.mark.parametrize('fast', [True, False])
+def test_parse_config(monkeypatch, fast):
+    if not fast:
+        monkeypatch.setattr(loader, 'tomllib', None)
+    elif loader.tomllib is None:
+        pytest.skip('Neither tomllib nor tomli is available')
+    text = Path('tests/ftp-config.toml').read_text() + '\n'.join([
+        '', '[[files]]', 'dst = "w"', 'src = "s"', 'level = 3', 'checksum = "md5"',
+        'digests = {"a.txt" = "abc"}', 'names = ["a.txt"]'
+    ])
+    url, path, files = loader.parse_config(text)
+    assert (url, path) == ('server.ftp.ru', 'projects/test-data')
+    assert files[-1] == {
+        'dst': 'w', 'src': 's', 'level': 3, 'checksum': 'md5',
+        'digests': {'a.txt': 'abc'}, 'names': ['a.txt']
+    }
+    assert type(files[-1]['level']) is int
+    assert type(files[0]['names'][0]) is str
+
+
+def test_parse_index_transport():
+    text = Path('tests/ftp-config.toml').read_text()
+    assert loader.parse_index(text)[3] == {}
+    text = '\n'.join([
+        text, '[transport]', 'window_size = "64M"', 'prefetch = false'
+    ])
+    url, path, files, transport = loader.parse_index(text)
+    assert transport == {'window_size': '64M', 'prefetch': False}
+    assert (url, path) == ('server.ftp.ru', 'projects/test-data')
+    assert loader.parse_config(text) == (url, path, files)
+
+
+def test_load_config_cache(tmp_path, monkeypatch):
+    config = tmp_path / 'ftp-config.toml'
+    config.write_text(Path('tests/ftp-config.toml').read_text())
+    cache_dir = tmp_path / 'cache'
+    answer = loader.load_config(config)
+    assert loader.load_config(config, cache_dir) == answer
+    cache_file, = cache_dir.iterdir()
+
+    def fail(text):
+        raise AssertionError('Configuration is parsed again')
+
+    monkeypatch.setattr(loader, 'parse_index', fail)
+    assert loader.load_config(config, cache_dir) == answer
+    st = config.stat()
+    os.utime(config, ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+    assert loader.load_config(config, cache_dir) == answer
+
+    monkeypatch.undo()
+    config.write_text(config.read_text().replace('server.ftp.ru', 'other.ftp.ru'))
+    assert loader.load_config(config, cache_dir)[0] == 'other.ftp.ru'
+    cache_file.write_text('not a json')
+    assert loader.load_config(config, cache_dir)[0] == 'other.ftp.ru'
+    assert loader.load_config(config, cache_dir)[0] == 'other.ftp.ru'
+    assert [p.name for p in cache_dir.iterdir()] == [cache_file.name]
+
+
+def test_file_transfer_set():
+    files = [
+        {'dst': 'work', 'src': 'storage', 'arch': 'bz2', 'names': ['a.txt', 'b.txt', 'c.txt']},
+        {'dst': 'empty', 'src': 'empty', 'names': []},
+        {'dst': 'exp', 'src': 'exp', 'checksum': 'md5', 'digests': {'e.txt': 'abc'}, 'names': ['d.txt', 'e.txt']},
+    ]
+    file_trans = loader.create_file_transfers('project', files)
+    assert isinstance(file_trans, loader.FileTransferSet)
+    assert len(file_trans) == 5
+    assert [ft.name for ft in file_trans] == ['a.txt', 'b.txt', 'c.txt', 'd.txt', 'e.txt']
+    assert [file_trans[i].name for i in range(-5, 5)] == [ft.name for ft in file_trans] * 2
+    assert [ft.name for ft in file_trans[1:4]] == ['b.txt', 'c.txt', 'd.txt']
+    with pytest.raises(IndexError):
+        file_trans[5]
+    assert file_trans[0]._group is file_trans[2]._group
+    assert file_trans[0].local_path is file_trans[1].local_path
+    assert file_trans[4].digest == 'abc' and file_trans[3].digest is None
+    assert file_trans[4].remote_path == PurePosixPath('project/exp')
+    assert file_trans[0] == loader.FileTransfer('a.txt', 'work', 'project/storage', 'bz2')
+    assert file_trans == list(file_trans)
+    assert list(file_trans) == file_trans
+    assert not hasattr(file_trans[0], '__dict__')
+
+    merged = loader.FileTransferSet()
+    merged.extend(file_trans)
+    merged.extend([loader.FileTransfer('f.txt', 'work', 'project/storage')])
+    assert len(merged) == 6
+    assert merged[:5] == list(file_trans)
+    assert merged[5].name == 'f.txt'
+    assert len(merged.groups) == 3
+    assert not merged.prioritized
+    assert file_trans[0].priority == 0
+
+    files[2]['priority'] = 5
+    file_trans = loader.create_file_transfers('project', files)
+    assert file_trans.prioritized
+    assert [ft.priority for ft in file_trans] == [0, 0, 0, 5, 5]
+    assert pickle.loads(pickle.dumps(file_trans[3])).priority == 5
+
+
+def test_file_transfer_pickle():
+    ft = loader.FileTransfer('a.txt', 'work', 'storage', 'gz', 3, 2, 'sha256', 'abc')
+    ft2 = pickle.loads(pickle.dumps(ft))
+    assert ft2 == ft
+    assert (ft2._level, ft2._threads, ft2.checksum, ft2.digest) == (3, 2, 'sha256', 'abc')
+
+
+@pytest.fixture
+def pattern_tree(tmp_path):
+    for name in ['a.txt', 'b.csv', 'a.txt.bz2', 'c.txt.part', '.hidden.txt', 'sub/d.txt', 'sub/deep/e.txt', '.git/f.txt']:
+        path = tmp_path / 'local' / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(name)
+    return tmp_path / 'local'
+
+
+@pytest.mark.parametrize('patterns, recursive, arch, answer', [
+    (['*.txt'], False, None, ['a.txt']),
+    (['*.txt'], False, 'bz2', ['a.txt']),
+    (['*'], False, 'bz2', ['a.txt', 'b.csv']),
+    (['*'], False, None, ['a.txt', 'a.txt.bz2', 'b.csv']),
+    (['.h*'], False, None, ['.hidden.txt']),
+    (['*.txt'], True, None, ['a.txt', 'sub/d.txt', 'sub/deep/e.txt']),
+    (['?.csv', 'e*'], True, None, ['b.csv', 'sub/deep/e.txt']),
+])
+def test_expand_local_patterns(pattern_tree, patterns, recursive, arch, answer):
+    group = loader.FileGroup(pattern_tree, 'remote', arch)
+    file_trans = list(loader.expand_patterns(group, patterns, recursive, loader.local_listdir, False))
+    names = [str((ft.local_path / ft.name).relative_to(pattern_tree).as_posix()) for ft in file_trans]
+    assert names == answer
+    for ft in file_trans:
+        rel = ft.local_path.relative_to(pattern_tree).as_posix()
+        assert ft.remote_path == PurePosixPath('remote', rel)
+        assert ft.arch == arch
+
+
+def test_expand_remote_patterns():
+    listings = {
+        'remote': (['sub'], ['a.txt.gz', 'b.txt', 'c.csv.gz', 'd.txt.gz.sha256', 'e.txt.gz.part']),
+        'remote/sub': ([], ['f.txt.gz']),
+    }
+    calls = []
+
+    def listdir(path):
+        calls.append(str(path))
+        return listings.get(str(path), ([], []))
+
+    files = [{'dst': 'local', 'src': 'remote', 'arch': 'gz', 'checksum': 'sha256', 'recursive': True,
+              'names': ['x.bin', '*.txt']}]
+    file_trans = loader.create_file_transfers('', files)
+    assert len(file_trans) == 1
+    expanded = file_trans.expand(listdir, True)
+    assert next(expanded).name == 'x.bin'
+    assert calls == []
+    rest = list(expanded)
+    assert [(str(ft.remote_path), ft.name) for ft in rest] == [('remote', 'a.txt'), ('remote/sub', 'f.txt')]
+    assert rest[1].local_path == Path('local/sub')
+    assert calls == ['remote', 'remote/sub']
+
+
+def _write(self, offset, data):
+    # The test server refuses to write into bytes content more than once.
+    content = self.content_provider.get(self.path)
+    if content is None:
+        return SFTP_OK if self.content_provider.put(self.path, data) else SFTP_FAILURE
+    if isinstance(content, str):
+        content = content.encode()
+    content = content[:offset] + data + content[offset + len(data):]
+    return SFTP_OK if self.content_provider.put(self.path, content) else SFTP_FAILURE
+
+
+def delta_files(block_size):
+    old = os.urandom(5 * block_size - 20)
+    new = old[:block_size + 5] + b'inserted' + old[block_size + 5:]
+    return old, new
+
+
+@pytest.mark.parametrize('checksum', [None, 'sha256'])
+def test_download_delta(sftpserver, tmp_path, monkeypatch, capsys, checksum):
+    monkeypatch.setattr(delta, 'DELTA_BLOCK_SIZE', 1024)
+    old, new = delta_files(1024)
+    create_temp_file(tmp_path, 'file1.txt', old, True)
+    files = {
+        'file1.txt': new,
+        'file1.txt.sig': Signature.from_file(io.BytesIO(new)).dumps(),
+        'file1.txt.sha256': sha256(new)
+    }
+    cnopts = CnOpts()
+    cnopts.hostkeys = None
+    ft = loader.FileTransfer('file1.txt', tmp_path, 'project1', checksum=checksum, delta=True)
+    with sftpserver.serve_content({'project1': files}):
+        with Connection('127.0.0.1', port=sftpserver.port, username='user1', password='1234', cnopts=cnopts) as conn:
+            ft.download(conn, skip_existing=False)
+    assert (tmp_path / 'file1.txt').read_bytes() == new
+    assert not (tmp_path / 'file1.txt.part').exists()
+    assert '(1024 of {0} bytes)'.format(len(new)) in capsys.readouterr().out
+
+
+@pytest.mark.parametrize('sig', [None, 'outdated'])
+def test_download_delta_fallback(sftpserver, tmp_path, monkeypatch, capsys, sig):
+    monkeypatch.setattr(delta, 'DELTA_BLOCK_SIZE', 1024)
+    old, new = delta_files(1024)
+    create_temp_file(tmp_path, 'file1.txt', old, True)
+    files = {'file1.txt': new}
+    if sig:
+        # Signature of other content of the same size.
+        other = new[:-1] + bytes([new[-1] ^ 1])
+        files['file1.txt.sig'] = Signature.from_file(io.BytesIO(other)).dumps()
+    cnopts = CnOpts()
+    cnopts.hostkeys = None
+    ft = loader.FileTransfer('file1.txt', tmp_path, 'project1', delta=True)
+    with sftpserver.serve_content({'project1': files}):
+        with Connection('127.0.0.1', port=sftpserver.port, username='user1', password='1234', cnopts=cnopts) as conn:
+            ft.download(conn, skip_existing=False)
+    assert (tmp_path / 'file1.txt').read_bytes() == new
+    assert ('outdated' in capsys.readouterr().out) == bool(sig)
+
+
+def test_upload_delta(sftpserver, tmp_path, monkeypatch, capsys):
+    monkeypatch.setattr(delta, 'DELTA_BLOCK_SIZE', 1024)
+    monkeypatch.setattr(VirtualSFTPHandle, 'write', _write)
+    old = os.urandom(5 * 1024)
+    new = old[:2048] + os.urandom(1024) + old[3072:] + b'more data'
+    create_temp_file(tmp_path, 'file1.txt', new, True)
+    files = {
+        'file1.txt': old,
+        'file1.txt.sig': Signature.from_file(io.BytesIO(old)).dumps()
+    }
+    cnopts = CnOpts()
+    cnopts.hostkeys = None
+    ft = loader.FileTransfer('file1.txt', tmp_path, 'project1', checksum='sha256', delta=True)
+    with sftpserver.serve_content({'project1': files}):
+        with Connection('127.0.0.1', port=sftpserver.port, username='user1', password='1234', cnopts=cnopts) as conn:
+            ft.upload(conn, skip_existing=False)
+        assert sftpserver.content_provider.get('project1/file1.txt') == new
+        sig = Signature.loads(sftpserver.content_provider.get('project1/file1.txt.sig').decode())
+        assert sig.digest == sha256(new)
+        assert sftpserver.content_provider.get('project1/file1.txt.sha256').decode().split()[0] == sha256(new)
+    assert '(1033 of {0} bytes)'.format(len(new)) in capsys.readouterr().out
+
+
+@pytest.mark.parametrize('arch, threads, answer', [
+    (None, None, True), ('gz', None, False), ('bz2', 4, True), ('zst', 4, False)
+])
+def test_delta_archives(arch, threads, answer):
+    ft = loader.FileTransfer('file1.txt', 'work', 'project1', arch, threads=threads, delta=True)
+    assert ft.delta == answer
+    assert not loader.FileTransfer('file1.txt', 'work', 'project1', arch, threads=threads).delta
+
+
+def test_upload_delta_interrupted(sftpserver, tmp_path, monkeypatch):
+    monkeypatch.setattr(delta, 'DELTA_BLOCK_SIZE', 1024)
+    failing = [True]
+
+    def write(self, offset, data):
+        if failing[0]:
+            return SFTP_FAILURE
+        return _write(self, offset, data)
+
+    monkeypatch.setattr(VirtualSFTPHandle, 'write', write)
+    old = os.urandom(5 * 1024)
+    new = old[:2048] + os.urandom(1024) + old[3072:]
+    create_temp_file(tmp_path, 'file1.txt', new, True)
+    files = {
+        'file1.txt': old,
+        'file1.txt.sig': Signature.from_file(io.BytesIO(old)).dumps(),
+        'file1.txt.sha256': sha256(old)
+    }
+    cnopts = CnOpts()
+    cnopts.hostkeys = None
+    ft = loader.FileTransfer('file1.txt', tmp_path, 'project1', checksum='sha256', delta=True)
+    with sftpserver.serve_content({'project1': files}):
+        with Connection('127.0.0.1', port=sftpserver.port, username='user1', password='1234', cnopts=cnopts) as conn:
+            with pytest.raises(IOError):
+                ft.upload(conn, skip_existing=False)
+            # The torn file is neither taken for the uploaded one nor resumed.
+            for name in ['file1.txt', 'file1.txt.sig', 'file1.txt.sha256', 'file1.txt.part']:
+                assert not conn.exists('project1/' + name)
+            assert conn.exists('project1/file1.txt.delta')
+            failing[0] = False
+            ft.upload(conn, skip_existing=True)
+            assert not conn.exists('project1/file1.txt.delta')
+        assert sftpserver.content_provider.get('project1/file1.txt') == new
+
+
+def test_upload_delta_without_signature(sftpserver, tmp_path, monkeypatch):
+    monkeypatch.setattr(delta, 'DELTA_BLOCK_SIZE', 1024)
+    create_temp_file(tmp_path, 'file1.txt', b'File1 content', True)
+    cnopts = CnOpts()
+    cnopts.hostkeys = None
+    ft = loader.FileTransfer('file1.txt', tmp_path, 'project1', delta=True)
+    with sftpserver.serve_content({'project1': {'file1.txt': 'Old content'}}):
+        with Connection('127.0.0.1', port=sftpserver.port, username='user1', password='1234', cnopts=cnopts) as conn:
+            ft.upload(conn, skip_existing=False)
+        assert sftpserver.content_provider.get('project1/file1.txt') == b'File1 content'
+        sig = Signature.loads(sftpserver.content_provider.get('project1/file1.txt.sig').decode())
+        assert sig.size == 13
+
+
+@pytest.mark.parametrize('size, segments, min_size, answer', [
+    (10, 3, 2, [(0, 3), (3, 3), (6, 4)]),
+    (10, 3, 6, [(0, 10)]),
+    (12, 3, 4, [(0, 4), (4, 4), (8, 4)]),
+    (0, 3, 2, [(0, 0)]),
+])
+def test_split_ranges(size, segments, min_size, answer):
+    assert loader.split_ranges(size, segments, min_size) == answer
+
+
+def test_preallocate(tmp_path):
+    loader.preallocate(tmp_path / 'file.part', 1000)
+    assert (tmp_path / 'file.part').stat().st_size == 1000
+    loader.preallocate(tmp_path / 'file.part', 0)
+    assert (tmp_path / 'file.part').stat().st_size == 0
+
+
+@pytest.mark.parametrize('segments, checksum', [(1, None), (3, None), (4, 'sha256')])
+def test_download_segments(sftpserver, tmp_path, monkeypatch, capsys, segments, checksum):
+    monkeypatch.setattr(loader, 'MIN_SEGMENT_SIZE', 40000)
+    content = os.urandom(200000)
+    cnopts = CnOpts()
+    cnopts.hostkeys = None
+    opened = []
+
+    @contextmanager
+    def connect():
+        with Connection('127.0.0.1', port=sftpserver.port, username='user1', password='1234', cnopts=cnopts) as conn:
+            opened.append(conn)
+            yield conn
+
+    files = {'file1.txt': content, 'file1.txt.sha256': sha256(content)}
+    ft = loader.FileTransfer('file1.txt', tmp_path, 'project1', checksum=checksum)
+    with sftpserver.serve_content({'project1': files}):
+        with connect() as conn:
+            ft.download(conn, skip_existing=True, segments=segments, connect=connect)
+    assert (tmp_path / 'file1.txt').read_bytes() == content
+    assert not (tmp_path / 'file1.txt.part').exists()
+    assert not (tmp_path / 'file1.txt.seg').exists()
+    assert len(opened) == segments
+    assert ('in {0} segments'.format(segments) in capsys.readouterr().out) == (segments > 1)
+    if checksum:
+        assert ft.digest == sha256(content)
+
+
+def test_download_segments_killed(sftpserver, tmp_path, monkeypatch):
+    # A killed segmented download leaves a file with gaps which must not be
+    # resumed.
+    monkeypatch.setattr(loader, 'MIN_SEGMENT_SIZE', 40000)
+    content = os.urandom(200000)
+    stale = bytearray(content)
+    stale[50000:150000] = bytes(100000)
+    (tmp_path / 'file1.txt.seg').write_bytes(bytes(stale))
+    cnopts = CnOpts()
+    cnopts.hostkeys = None
+
+    @contextmanager
+    def connect():
+        with Connection('127.0.0.1', port=sftpserver.port, username='user1', password='1234', cnopts=cnopts) as conn:
+            yield conn
+
+    ft = loader.FileTransfer('file1.txt', tmp_path, 'project1')
+    with sftpserver.serve_content({'project1': {'file1.txt': content}}):
+        with connect() as conn:
+            ft.download(conn, skip_existing=True, segments=4, connect=connect)
+    assert (tmp_path / 'file1.txt').read_bytes() == content
+    assert not (tmp_path / 'file1.txt.seg').exists()
+
+
+def test_download_segments_error(sftpserver, tmp_path, monkeypatch):
+    monkeypatch.setattr(loader, 'MIN_SEGMENT_SIZE', 40000)
+    cnopts = CnOpts()
+    cnopts.hostkeys = None
+
+    def connect():
+        raise ConnectionError('No more connections')
+
+    ft = loader.FileTransfer('file1.txt', tmp_path, 'project1')
+    with sftpserver.serve_content({'project1': {'file1.txt': os.urandom(100000)}}):
+        with Connection('127.0.0.1', port=sftpserver.port, username='user1', password='1234', cnopts=cnopts) as conn:
+            with pytest.raises(ConnectionError):
+                ft.download(conn, skip_existing=True, segments=2, connect=connect)
+    assert not list(tmp_path.iterdir())
@@ -1,10 +1,18 @@
+import importlib
 import pytest
+import sys
 from pathlib import Path, PurePosixPath
 import bz2, gzip
 from pysftp import Connection, CnOpts
+from pytest_sftpserver.sftp.content_provider import ContentProvider
 
 from ftp_loader import loader
-from ftp_loader.main import read_config, download_data
+from ftp_loader.main import read_config, download_data, upload_data
+from ftp_loader.main import download_and_decompress, compress_and_upload
+from ftp_loader.main import compress_data, decompress_data
+from ftp_loader.main import download_stream_data, upload_stream_data
+from ftp_loader.main import arg_parser, run_download, run_upload
+from ftp_loader.remote import ConnectionPool
 from tests.test_loader import create_temp_file
 
 
@@ -72,14 +80,15 @@ def config1(tmp_path):
     clear_dir(tmp_path)
 
 
-@pytest.mark.parametrize('download_cnt', [5])
-def test_download(ftp_server1, config1, tmp_path, download_cnt):
+@pytest.mark.parametrize('download_cnt, jobs', [(5, 1), (5, 3), (5, 8)])
+def test_download(ftp_server1, config1, tmp_path, download_cnt, jobs):
     url, file_trans = read_config(tmp_path / 'ftp-config.toml')
     port = ftp_server1.port
     cnopts = CnOpts()
     cnopts.hostkeys = None
-    downloads = download_data(url, 'user1', '1234', file_trans, False, port=port, cnopts=cnopts)
+    downloads = download_data(url, 'user1', '1234', file_trans, False, jobs, port=port, cnopts=cnopts)
     assert len(downloads) == download_cnt
+    assert downloads == file_trans
 
 
 @pytest.fixture(scope='function')
@@ -101,3 +110,301 @@ def test_download2(ftp_server1, config1, file_tree1, tmp_path, download_cnt, ski
     downloads = download_data(url, 'user1', '1234', file_trans, skip, port=port, cnopts=cnopts)
     assert len(downloads) == download_cnt
 
+
+
+@pytest.fixture(scope='function')
+def file_tree2(tmp_path):
+    create_temp_file(tmp_path / "work1", 'file1.txt.bz2', bz2.compress(b'File1 content'), True)
+    create_temp_file(tmp_path / "work1", 'file2.txt.bz2', bz2.compress(b'File2 content'), True)
+    create_temp_file(tmp_path / "work2/cont2", 'file21.csv.gz', gzip.compress(b'File21 content'), True)
+    create_temp_file(tmp_path / "work2", 'container2.txt', 'Container2 content', False)
+    yield
+    clear_dir(tmp_path)
+
+
+@pytest.mark.parametrize('upload_cnt, jobs', [(4, 1), (4, 4)])
+def test_upload(sftpserver, config1, file_tree2, tmp_path, upload_cnt, jobs):
+    url, file_trans = read_config(tmp_path / 'ftp-config.toml')
+    cnopts = CnOpts()
+    cnopts.hostkeys = None
+    with sftpserver.serve_content({'project1': {}}):
+        count = upload_data(url, 'user1', '1234', file_trans, True, jobs, port=sftpserver.port, cnopts=cnopts)
+        assert count == upload_cnt
+        data = sftpserver.content_provider.get('project1/test_data1/file2.txt.bz2')
+        assert bz2.decompress(data) == b'File2 content'
+
+
+@pytest.mark.parametrize('jobs, queue_size', [(1, 1), (3, 2)])
+def test_download_and_decompress(ftp_server1, config1, tmp_path, jobs, queue_size):
+    url, file_trans = read_config(tmp_path / 'ftp-config.toml')
+    cnopts = CnOpts()
+    cnopts.hostkeys = None
+    downloads = download_and_decompress(
+        url, 'user1', '1234', file_trans, True, jobs, queue_size,
+        port=ftp_server1.port, cnopts=cnopts
+    )
+    assert len(downloads) == 5
+    assert (tmp_path / 'work1/file2.txt').read_text() == 'File2 content'
+    assert (tmp_path / 'work2/cont2/file22.csv').read_text() == 'FIle22 content'
+    assert (tmp_path / 'work2/container2.txt').read_text() == 'Container2 content'
+
+
+def test_decompress_corrupted(sftpserver, tmp_path, capsys, monkeypatch):
+    data = {'project1': {
+        'a.txt.gz': b'not a gzip archive',
+        'b.txt.gz': gzip.compress(b'b' * 100),
+        'c.txt.gz': gzip.compress(b'c' * 100),
+    }}
+    file_trans = [
+        loader.FileTransfer(name, tmp_path, 'project1', 'gz') for name in ['a.txt', 'b.txt', 'c.txt']
+    ]
+    cnopts = CnOpts()
+    cnopts.hostkeys = None
+    with sftpserver.serve_content(data):
+        downloads = download_and_decompress(
+            'localhost', 'user1', '1234', file_trans, True, 1, 1,
+            port=sftpserver.port, cnopts=cnopts
+        )
+        assert len(downloads) == 3
+        assert 'Failed to decompress {0}'.format(tmp_path / 'a.txt') in capsys.readouterr().out
+        assert not (tmp_path / 'a.txt').exists()
+        assert (tmp_path / 'c.txt').read_text() == 'c' * 100
+
+        def fail(*args, **kwargs):
+            raise RuntimeError('consumer failed')
+
+        # ftp_loader.main attribute is the main function.
+        main_module = importlib.import_module('ftp_loader.main')
+        monkeypatch.setattr(main_module, '_collect_codec', fail)
+        with pytest.raises(RuntimeError):
+            download_and_decompress(
+                'localhost', 'user1', '1234', file_trans, False, 1, 1,
+                port=sftpserver.port, cnopts=cnopts
+            )
+
+
+@pytest.fixture(scope='function')
+def file_tree3(tmp_path):
+    create_temp_file(tmp_path / "work1", 'file1.txt', 'File1 content', False)
+    create_temp_file(tmp_path / "work1", 'file2.txt', 'File2 content', False)
+    create_temp_file(tmp_path / "work2/cont2", 'file22.csv', 'FIle22 content', False)
+    create_temp_file(tmp_path / "work2", 'container2.txt', 'Container2 content', False)
+    yield
+    clear_dir(tmp_path)
+
+
+@pytest.mark.parametrize('jobs, queue_size', [(1, 1), (2, 3)])
+def test_compress_and_upload(sftpserver, config1, file_tree3, tmp_path, jobs, queue_size):
+    url, file_trans = read_config(tmp_path / 'ftp-config.toml')
+    cnopts = CnOpts()
+    cnopts.hostkeys = None
+    with sftpserver.serve_content({'project1': {}}):
+        uploaded = compress_and_upload(
+            url, 'user1', '1234', file_trans, True, jobs, queue_size,
+            port=sftpserver.port, cnopts=cnopts
+        )
+        assert len(uploaded) == 4
+        data = sftpserver.content_provider.get('project1/test_data2/container/file22.csv.gz')
+        assert gzip.decompress(data) == b'FIle22 content'
+
+
+@pytest.mark.parametrize('workers', [1, 3])
+def test_compress_decompress_data(config1, file_tree3, tmp_path, capsys, workers):
+    url, file_trans = read_config(tmp_path / 'ftp-config.toml')
+    compressed = compress_data(file_trans, True, workers)
+    assert len(compressed) == 4
+    assert 'file21.csv does not exists' in capsys.readouterr().out
+    data = (tmp_path / 'work1/file1.txt.bz2').read_bytes()
+    assert bz2.decompress(data) == b'File1 content'
+    (tmp_path / 'work2/cont2/file22.csv').unlink()
+    decompressed = decompress_data(file_trans, False, workers)
+    assert len(decompressed) == 4
+    assert (tmp_path / 'work2/cont2/file22.csv').read_text() == 'FIle22 content'
+
+
+def test_stream_data(ftp_server1, config1, tmp_path):
+    url, file_trans = read_config(tmp_path / 'ftp-config.toml')
+    cnopts = CnOpts()
+    cnopts.hostkeys = None
+    downloads = download_stream_data(url, 'user1', '1234', file_trans, True, 2, port=ftp_server1.port, cnopts=cnopts)
+    assert len(downloads) == 5
+    assert (tmp_path / 'work1/file1.txt').read_text() == 'File1 content'
+    assert not (tmp_path / 'work1/file1.txt.bz2').exists()
+    uploads = upload_stream_data(url, 'user1', '1234', file_trans, True, 2, port=ftp_server1.port, cnopts=cnopts)
+    assert len(uploads) == 0
+
+
+def test_stream_corrupted(sftpserver, tmp_path, capsys):
+    data = {'project1': {
+        'a.txt.gz': gzip.compress(b'a' * 1000)[:-8],
+        'b.txt.gz': b'not a gzip archive',
+        'c.txt.gz': gzip.compress(b'c' * 100),
+    }}
+    file_trans = [
+        loader.FileTransfer(name, tmp_path, 'project1', 'gz') for name in ['a.txt', 'b.txt', 'c.txt']
+    ]
+    cnopts = CnOpts()
+    cnopts.hostkeys = None
+    with sftpserver.serve_content(data):
+        downloads = download_stream_data(
+            'localhost', 'user1', '1234', file_trans, True, 1, port=sftpserver.port, cnopts=cnopts
+        )
+    assert [ft.name for ft in downloads] == ['c.txt']
+    out = capsys.readouterr().out
+    assert 'Failed to download project1/a.txt.gz' in out
+    assert 'Failed to download project1/b.txt.gz' in out
+    assert (tmp_path / 'c.txt').read_text() == 'c' * 100
+    assert sorted(p.name for p in tmp_path.iterdir()) == ['c.txt']
+
+
+@pytest.fixture(scope='function')
+def config2(tmp_path):
+    f = tmp_path / 'ftp-config2.toml'
+    f.write_text('\n'.join([
+        'url = "localhost"',
+        'path = "project2"',
+        '[[files]]',
+        'dst = ' + '"{0}"'.format(str(tmp_path / "work3")).replace('\\', '\\\\'),
+        'src = "data3"',
+        'names = ["file31.txt", "file32.txt"]',
+    ]))
+    yield
+
+
+def test_connection_pool(ftp_server1, config1, config2, tmp_path, monkeypatch):
+    cnopts = CnOpts()
+    cnopts.hostkeys = None
+    calls = []
+
+    def auth(url):
+        calls.append(url)
+        return 'user1', '1234'
+
+    monkeypatch.setattr(sys, 'argv', [
+        'ftp-loader', str(tmp_path / 'ftp-config.toml'), str(tmp_path / 'ftp-config2.toml'),
+        '--jobs', '2'
+    ])
+    args = arg_parser()
+    transfers = {}
+    for config in args['config']:
+        url, file_trans = read_config(config)
+        transfers.setdefault(url, []).extend(file_trans)
+    assert len(transfers['localhost']) == 7
+    with ConnectionPool(auth, port=ftp_server1.port, cnopts=cnopts) as pool:
+        for url, file_trans in transfers.items():
+            run_download(url, file_trans, pool, args)
+        run_download('localhost', transfers['localhost'], pool, args)
+        assert calls == ['localhost']
+        assert len(pool._idle['localhost']) == 2
+    assert (tmp_path / 'work1/file1.txt').read_text() == 'File1 content'
+    assert (tmp_path / 'work3/file32.txt').read_text() == 'File32 content'
+
+
+def test_patterns(ftp_server1, tmp_path, monkeypatch):
+    # The test server reports bytes content as a directory.
+    monkeypatch.setattr(
+        ContentProvider, 'is_dir', lambda self, path: isinstance(self.get(path), dict)
+    )
+    cnopts = CnOpts()
+    cnopts.hostkeys = None
+    config = tmp_path / 'ftp-config.toml'
+    config.write_text('\n'.join([
+        'url = "localhost"',
+        'path = "project1"',
+        '[[files]]',
+        'dst = ' + '"{0}"'.format(str(tmp_path / "work")).replace('\\', '\\\\'),
+        'src = "test_data2"',
+        'arch = "gz"',
+        'recursive = true',
+        'names = ["*.csv"]',
+        '[[files]]',
+        'dst = ' + '"{0}"'.format(str(tmp_path / "work1")).replace('\\', '\\\\'),
+        'src = "test_data1"',
+        'arch = "bz2"',
+        'names = ["file1.txt", "file[2-9].txt"]',
+    ]))
+    monkeypatch.setattr(sys, 'argv', ['ftp-loader', str(config), '--jobs', '2'])
+    args = arg_parser()
+    url, file_trans = read_config(config)
+    assert len(file_trans) == 1
+    with ConnectionPool(lambda url: ('user1', '1234'), port=ftp_server1.port, cnopts=cnopts) as pool:
+        run_download(url, file_trans, pool, args)
+        assert (tmp_path / 'work/container/file21.csv').read_text() == 'File21 content'
+        assert (tmp_path / 'work/container/file22.csv').read_text() == 'FIle22 content'
+        assert (tmp_path / 'work1/file1.txt').read_text() == 'File1 content'
+        assert (tmp_path / 'work1/file2.txt').read_text() == 'File2 content'
+        assert not (tmp_path / 'work/container2.txt').exists()
+
+        (tmp_path / 'work/container/new').mkdir()
+        (tmp_path / 'work/container/new/file23.csv').write_text('File23 content')
+        monkeypatch.setattr(sys, 'argv', ['ftp-loader', str(config), '--upload'])
+        args = arg_parser()
+        run_upload(url, file_trans, pool, args)
+    data = ftp_server1.content_provider.get('project1/test_data2/container/new/file23.csv.gz')
+    assert gzip.decompress(data) == b'File23 content'
+    assert ftp_server1.content_provider.get('project1/test_data2/container/new/.ftp-loader-manifest.json') is not None
+
+
+def test_local_cache(ftp_server1, config1, tmp_path, monkeypatch, capsys):
+    cnopts = CnOpts()
+    cnopts.hostkeys = None
+    cache_dir = tmp_path / 'cache'
+    monkeypatch.setattr(sys, 'argv', [
+        'ftp-loader', str(tmp_path / 'ftp-config.toml'), '--no-manifest',
+        '--cache-dir', str(cache_dir), '--cache-link', 'copy'
+    ])
+    args = arg_parser()
+    url, file_trans = read_config(tmp_path / 'ftp-config.toml')
+    with ConnectionPool(lambda url: ('user1', '1234'), port=ftp_server1.port, cnopts=cnopts) as pool:
+        run_download(url, file_trans, pool, args)
+        assert len(list(cache_dir.glob('objects/*/*/data'))) == 5
+        (tmp_path / 'work1/file1.txt').unlink()
+        (tmp_path / 'work2/cont2/file21.csv').unlink()
+        capsys.readouterr()
+        run_download(url, file_trans, pool, args)
+    out = capsys.readouterr().out
+    assert 'Restoring {0}'.format(tmp_path / 'work1/file1.txt') in out
+    assert 'Restoring {0}'.format(tmp_path / 'work2/cont2/file21.csv') in out
+    assert '2 files were taken from the cache' in out
+    assert (tmp_path / 'work1/file1.txt').read_text() == 'File1 content'
+    assert (tmp_path / 'work2/cont2/file21.csv').read_text() == 'File21 content'
+
+
+def test_order(ftp_server1, config1, tmp_path, monkeypatch, capsys):
+    cnopts = CnOpts()
+    cnopts.hostkeys = None
+    config = tmp_path / 'ftp-config.toml'
+    config.write_text(config.read_text() + '\npriority = 1')
+    monkeypatch.setattr(sys, 'argv', [
+        'ftp-loader', str(config), '--no-manifest', '--order', 'largest'
+    ])
+    args = arg_parser()
+    url, file_trans = read_config(config)
+    with ConnectionPool(lambda url: ('user1', '1234'), port=ftp_server1.port, cnopts=cnopts) as pool:
+        run_download(url, file_trans, pool, args)
+    lines = [
+        line for line in capsys.readouterr().out.splitlines()
+        if line.startswith('  * Downloading:')
+    ]
+    sizes = [
+        ftp_server1.content_provider.get(line.split()[2]) for line in lines
+    ]
+    assert lines[0].split()[2] == 'project1/test_data2/container2.txt'
+    assert [len(s) for s in sizes[1:]] == sorted((len(s) for s in sizes[1:]), reverse=True)
+    assert len(lines) == 5
+
+
+@pytest.mark.parametrize('options, message', [
+    (['--stream'], '--stream'),
+    (['--segments', '4'], '--segments'),
+    (['--delta', '--stream'], '--stream, --delta'),
+])
+def test_async_unsupported_options(config1, tmp_path, monkeypatch, capsys, options, message):
+    main_module = importlib.import_module('ftp_loader.main')
+    monkeypatch.setattr(main_module.aio, 'asyncssh', object())
+    monkeypatch.setattr(sys, 'argv', [
+        'ftp-loader', str(tmp_path / 'ftp-config.toml'), '--engine', 'async'
+    ] + options)
+    with pytest.raises(SystemExit):
+        main_module.main()
+    assert 'Async engine does not support {0}. Aborting...'.format(message) in capsys.readouterr().out
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+import hashlib
+from paramiko import SFTPAttributes
+from pysftp import Connection, CnOpts
+
+from ftp_loader import loader, manifest
+from tests.test_loader import create_temp_file
+
+
+def sha(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def test_local_entry(tmp_path, monkeypatch):
+    create_temp_file(tmp_path, 'data.txt', 'content')
+    man = manifest.Manifest()
+    entry = man.local_entry(tmp_path, 'data.txt')
+    assert entry['hash'] == sha(b'content')
+    assert entry['size'] == 7
+    assert man.modified
+    man.save(tmp_path)
+    assert not man.modified
+
+    man = manifest.Manifest.load(tmp_path)
+    monkeypatch.setattr(manifest, 'file_hash', lambda filename: 'not called')
+    assert man.local_entry(tmp_path, 'data.txt') == entry
+    assert not man.modified
+    assert man.local_entry(tmp_path, 'missing.txt') is None
+
+
+@pytest.mark.parametrize('remote_entries, answer', [
+    ({}, ['a.txt', 'b.txt', 'c.txt']),
+    ({'a.txt': {'hash': sha(b'a')}, 'b.txt': {'hash': sha(b'B')}}, ['b.txt', 'c.txt']),
+    ({'a.txt': {'hash': sha(b'a')}, 'c.txt': {'hash': sha(b'c')}}, ['b.txt', 'c.txt']),
+])
+def test_select_changed(tmp_path, remote_entries, answer):
+    create_temp_file(tmp_path, 'a.txt', 'a')
+    create_temp_file(tmp_path, 'b.txt', 'b')
+    file_trans = [loader.FileTransfer(n, tmp_path, 'remote', 'gz') for n in ['a.txt', 'b.txt', 'c.txt']]
+    local = manifest.load_local_manifests(file_trans)
+    remote = {ft.remote_path: manifest.Manifest(remote_entries) for ft in file_trans}
+    changed = manifest.select_changed(file_trans, local, remote)
+    assert [ft.name for ft in changed] == answer
+
+
+def archive_attr(size, mtime):
+    attr = SFTPAttributes()
+    attr.st_size = size
+    attr.st_mtime = mtime
+    return attr
+
+
+@pytest.mark.parametrize('entry, attr, changed', [
+    ({'remote_size': 10, 'remote_mtime': 1000}, archive_attr(10, 1000), False),
+    ({'remote_size': 10, 'remote_mtime': 1000}, archive_attr(10, 2000), True),
+    ({'remote_size': 10, 'remote_mtime': 1000}, archive_attr(12, 1000), True),
+    ({'remote_size': 10, 'remote_mtime': 1000}, None, True),
+    ({}, archive_attr(10, 1000), True),
+])
+def test_select_changed_remote_archive(tmp_path, entry, attr, changed):
+    create_temp_file(tmp_path, 'a.txt', 'a')
+    file_trans = [loader.FileTransfer('a.txt', tmp_path, 'remote', 'gz')]
+    local = manifest.load_local_manifests(file_trans)
+    entry = dict(entry, hash=sha(b'a'))
+    remote = {file_trans[0].remote_path: manifest.Manifest({'a.txt': entry})}
+    assert manifest.select_changed(file_trans, local, remote) == []
+    result = manifest.select_changed(file_trans, local, remote, lambda ft: attr)
+    assert (result == file_trans) == changed
+
+
+def test_register_uploaded_archive(tmp_path):
+    create_temp_file(tmp_path, 'a.txt', 'a')
+    file_trans = [loader.FileTransfer('a.txt', tmp_path, 'remote', 'gz')]
+    local = manifest.load_local_manifests(file_trans)
+    remote = {file_trans[0].remote_path: manifest.Manifest()}
+    manifest.register_uploaded(file_trans, local, remote, lambda ft: archive_attr(21, 1000))
+    entry = remote[file_trans[0].remote_path].get('a.txt')
+    assert (entry['hash'], entry['remote_size'], entry['remote_mtime']) == (sha(b'a'), 21, 1000)
+    assert 'remote_size' not in local[tmp_path].get('a.txt')
+    assert manifest.select_changed(file_trans, local, remote, lambda ft: archive_attr(21, 1000)) == []
+
+
+def test_iter_changed(tmp_path):
+    create_temp_file(tmp_path, 'a.txt', 'a')
+    loaded = []
+
+    def load(path):
+        loaded.append(path)
+        return manifest.Manifest({'a.txt': {'hash': sha(b'a')}})
+
+    local = manifest.ManifestDict(manifest.Manifest.load)
+    remote = manifest.ManifestDict(load)
+    file_trans = (loader.FileTransfer(n, tmp_path, 'remote') for n in ['a.txt', 'b.txt'])
+    changed = manifest.iter_changed(file_trans, local, remote)
+    assert loaded == []
+    assert [ft.name for ft in changed] == ['b.txt']
+    assert list(remote.keys()) == loaded
+    assert list(local.keys()) == [tmp_path]
+
+
+def test_remote_manifest(sftpserver, tmp_path):
+    create_temp_file(tmp_path, 'a.txt', 'a')
+    file_trans = [loader.FileTransfer('a.txt', tmp_path, 'project1/data')]
+    cnopts = CnOpts()
+    cnopts.hostkeys = None
+    with sftpserver.serve_content({'project1': {'data': {manifest.MANIFEST_NAME: '{}'}}}):
+        with Connection('127.0.0.1', port=sftpserver.port, username='user1', password='1234', cnopts=cnopts) as conn:
+            local = manifest.load_local_manifests(file_trans)
+            remote = manifest.load_remote_manifests(conn, file_trans)
+            assert manifest.select_changed(file_trans, local, remote) == file_trans
+            manifest.register_uploaded(file_trans, local, remote)
+            manifest.save_remote_manifests(conn, remote)
+            remote = manifest.load_remote_manifests(conn, file_trans)
+            assert manifest.select_changed(file_trans, local, remote) == []
+            assert remote[file_trans[0].remote_path].get('a.txt')['hash'] == sha(b'a')
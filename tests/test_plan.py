@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+import sys
+import bz2
+from pysftp import CnOpts
+
+from ftp_loader import loader, plan
+from ftp_loader.cache import LocalCache, cache_key
+from ftp_loader.main import arg_parser, read_config, run_plan
+from ftp_loader.remote import ConnectionPool
+from tests.test_loader import create_temp_file
+
+
+@pytest.fixture(scope='function')
+def pool(sftpserver):
+    data = {
+        'project1': {
+            'data': {
+                'a.txt.bz2': bz2.compress(b'a' * 1000),
+                'b.txt.bz2': bz2.compress(b'b' * 2000),
+                'c.txt': 'c' * 300,
+            }
+        }
+    }
+    cnopts = CnOpts()
+    cnopts.hostkeys = None
+    with sftpserver.serve_content(data):
+        with ConnectionPool(lambda url: ('user1', '1234'), port=sftpserver.port, cnopts=cnopts) as pool:
+            yield pool
+
+
+def actions(entries):
+    return {e['name'].rsplit('/', 1)[-1]: e['action'] for e in entries}
+
+
+def test_plan_download(pool, tmp_path):
+    file_trans = [
+        loader.FileTransfer('a.txt', tmp_path, 'project1/data', 'bz2'),
+        loader.FileTransfer('b.txt', tmp_path, 'project1/data', 'bz2'),
+        loader.FileTransfer('c.txt', tmp_path, 'project1/data'),
+        loader.FileTransfer('d.txt', tmp_path, 'project1/data'),
+        loader.FileTransfer('e.txt', tmp_path, 'project1/data', 'gz'),
+        loader.FileTransfer('f.txt', tmp_path, 'project1/data', 'gz'),
+    ]
+    create_temp_file(tmp_path, 'c.txt', 'old')
+    create_temp_file(tmp_path, 'e.txt.gz', 'archive')
+    create_temp_file(tmp_path, 'f.txt', 'f')
+    cache = LocalCache(tmp_path / 'cache')
+    with pool.connection('localhost') as conn:
+        attr = conn.stat('project1/data/b.txt.bz2')
+        cache.store(cache_key('localhost', 'project1/data/b.txt.bz2', attr), tmp_path / 'f.txt')
+        entries = plan.plan_download('localhost', file_trans, conn, True, cache)
+        assert actions(entries) == {
+            'a.txt': 'download', 'b.txt': 'restore', 'c.txt': 'skip',
+            'd.txt': 'missing', 'e.txt': 'decompress', 'f.txt': 'skip'
+        }
+        size = len(bz2.compress(b'a' * 1000))
+        assert entries[0]['phases'] == {'download': size, 'decompress': size}
+        assert entries[4]['phases'] == {'decompress': 7}
+        entries = plan.plan_download('localhost', file_trans[2:3], conn, False)
+        assert entries[0]['action'] == 'download'
+        assert entries[0]['phases'] == {'download': 300}
+    assert not (tmp_path / 'a.txt.bz2').exists()
+    assert not (tmp_path / 'a.txt').exists()
+
+
+def test_plan_upload(pool, tmp_path):
+    create_temp_file(tmp_path, 'a.txt', 'a' * 100)
+    create_temp_file(tmp_path, 'c.txt', 'c' * 10)
+    create_temp_file(tmp_path, 'n.txt', 'n' * 20)
+    create_temp_file(tmp_path, 'z.txt', 'z' * 40)
+    create_temp_file(tmp_path, 'z.txt.gz', 'z' * 5)
+    file_trans = [
+        loader.FileTransfer('a.txt', tmp_path, 'project1/data', 'bz2'),
+        loader.FileTransfer('c.txt', tmp_path, 'project1/data'),
+        loader.FileTransfer('n.txt', tmp_path, 'project1/new', 'gz'),
+        loader.FileTransfer('z.txt', tmp_path, 'project1/new', 'gz'),
+        loader.FileTransfer('m.txt', tmp_path, 'project1/new'),
+    ]
+    with pool.connection('localhost') as conn:
+        entries = plan.plan_upload(file_trans, conn, True)
+        assert actions(entries) == {
+            'a.txt': 'skip', 'c.txt': 'skip', 'n.txt': 'upload',
+            'z.txt': 'upload', 'm.txt': 'missing'
+        }
+        assert entries[2]['phases'] == {'compress': 20, 'upload': 20}
+        assert entries[3]['phases'] == {'upload': 5}
+        entries = plan.plan_upload(file_trans[:2], conn, False)
+        assert [e['phases'] for e in entries] == [
+            {'compress': 100, 'upload': 100}, {'upload': 10}
+        ]
+    assert not (tmp_path / 'n.txt.gz').exists()
+
+
+def test_summarize(capsys):
+    entries = [
+        {'name': 'a', 'action': 'download', 'bytes': 2 * 10 ** 6,
+         'phases': {'download': 2 * 10 ** 6, 'decompress': 2 * 10 ** 6}},
+        {'name': 'b', 'action': 'download', 'bytes': 10 ** 6, 'phases': {'download': 10 ** 6}},
+        {'name': 'c', 'action': 'skip', 'bytes': 10, 'phases': {}},
+    ]
+    actions, phases = plan.summarize(entries, {'download': 1.5})
+    assert actions == {
+        'download': {'files': 2, 'bytes': 3 * 10 ** 6}, 'skip': {'files': 1, 'bytes': 10}
+    }
+    assert phases['download'] == {'bytes': 3 * 10 ** 6, 'rate': 1.5, 'seconds': 2.0}
+    assert phases['decompress']['seconds'] is None
+    assert plan.print_plan(entries, {'download': 1.5}, verbose=False) == 2.0
+    out = capsys.readouterr().out
+    assert 'download: 2 files, 3.00 MB' in out
+    assert 'decompress: 2.00 MB, rate is not measured yet' in out
+    assert 'Estimated time: 2.0 s without decompress' in out
+
+
+def test_run_plan(pool, tmp_path, monkeypatch, capsys):
+    config = tmp_path / 'ftp-config.toml'
+    config.write_text('\n'.join([
+        'url = "localhost"',
+        'path = "project1"',
+        '[[files]]',
+        'dst = ' + '"{0}"'.format(str(tmp_path / "work")).replace('\\', '\\\\'),
+        'src = "data"',
+        'arch = "bz2"',
+        'names = ["a.txt", "b.txt"]',
+    ]))
+    monkeypatch.setattr(sys, 'argv', ['ftp-loader', str(config), '--plan'])
+    args = arg_parser()
+    url, file_trans = read_config(config)
+    entries = run_plan(url, file_trans, pool, args, {})
+    assert [e['action'] for e in entries] == ['download', 'download']
+    assert not (tmp_path / 'work').exists()
+    assert 'Plan of downloading project data from localhost' in capsys.readouterr().out
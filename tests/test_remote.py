@@ -0,0 +1,228 @@
+# -*- coding: utf-8 -*-
+
+import io
+import threading
+import pytest
+from paramiko import SFTPAttributes
+from pysftp import Connection, CnOpts
+
+from ftp_loader import loader, stats
+from ftp_loader.remote import RemoteCache, CachedConnection, ConnectionPool, TunedFile
+from ftp_loader.remote import connection_kwargs, transport_options
+from tests.test_loader import create_temp_file
+
+
+class CountingConnection:
+    def __init__(self, connection):
+        self.connection = connection
+        self.calls = []
+
+    def __getattr__(self, name):
+        self.calls.append(name)
+        return getattr(self.connection, name)
+
+
+@pytest.fixture(scope='function')
+def connection(sftpserver):
+    data = {
+        'project1': {
+            'data': {'a.txt': 'a', 'b.txt': 'bb', 'c.txt.gz': 'ccc'},
+            'empty': {}
+        }
+    }
+    cnopts = CnOpts()
+    cnopts.hostkeys = None
+    with sftpserver.serve_content(data):
+        with Connection('127.0.0.1', port=sftpserver.port, username='user1', password='1234', cnopts=cnopts) as conn:
+            yield CountingConnection(conn)
+
+
+def test_lookup(connection):
+    conn = CachedConnection(connection)
+    assert conn.exists('project1/data/a.txt')
+    assert conn.exists('project1/data/c.txt.gz')
+    assert not conn.exists('project1/data/d.txt')
+    assert not conn.exists('project1/missing/d.txt')
+    assert conn.stat('project1/data/b.txt').st_size == 2
+    assert conn.isdir('project1/data')
+    assert not conn.isdir('project1/data/a.txt')
+    assert connection.calls.count('listdir_attr') == 3
+    assert 'exists' not in connection.calls
+    assert 'stat' not in connection.calls
+
+
+def test_listdir(connection):
+    cache = RemoteCache()
+    dirs, files = cache.listdir(connection, 'project1')
+    assert sorted(dirs) == ['data', 'empty']
+    assert files == []
+    assert sorted(cache.listdir(connection, 'project1/data')[1]) == ['a.txt', 'b.txt', 'c.txt.gz']
+    assert cache.listdir(connection, 'project1/missing') == ([], [])
+    CachedConnection(connection, cache).exists('project1/data/a.txt')
+    assert connection.calls.count('listdir_attr') == 3
+
+
+def test_shared_cache(connection):
+    cache = RemoteCache()
+    cache.prefetch(connection, ['project1/data', 'project1/empty'])
+    conn1 = CachedConnection(connection, cache)
+    conn2 = CachedConnection(connection, cache)
+    assert conn1.exists('project1/data/a.txt')
+    assert not conn2.exists('project1/empty/a.txt')
+    assert connection.calls == ['listdir_attr', 'listdir_attr']
+
+
+def test_upload_updates_cache(connection, tmp_path):
+    create_temp_file(tmp_path, 'new.txt', 'new content')
+    conn = CachedConnection(connection)
+    ft = loader.FileTransfer('new.txt', tmp_path, 'project1/data')
+    assert not conn.exists('project1/data/new.txt')
+    ft.upload(conn)
+    assert conn.exists('project1/data/new.txt')
+    assert conn.stat('project1/data/new.txt').st_size == 11
+    with pytest.raises(loader.LoaderException):
+        ft.upload(conn)
+
+
+@pytest.mark.parametrize('section, answer', [
+    ({}, {}),
+    (
+        {'window_size': '64M', 'max_packet_size': 32768, 'request_size': '64K'},
+        {'window_size': 64 * 1024 ** 2, 'max_packet_size': 32768, 'request_size': 65536}
+    ),
+    (
+        {'ciphers': 'aes128-ctr, aes256-ctr', 'compression': True, 'prefetch': False},
+        {'ciphers': ['aes128-ctr', 'aes256-ctr'], 'compression': True, 'prefetch': False}
+    ),
+    ({'ciphers': ['aes128-ctr'], 'prefetch_requests': 16, 'window_size': None},
+     {'ciphers': ['aes128-ctr'], 'prefetch_requests': 16}),
+])
+def test_transport_options(section, answer):
+    assert transport_options(section) == answer
+
+
+def test_unknown_transport_option():
+    with pytest.raises(loader.LoaderException) as e:
+        transport_options({'window': 10})
+    assert e.value.code == loader.ErrorCode.UNSUPPORTED_TRANSPORT
+
+
+def test_connection_kwargs():
+    cnopts = CnOpts()
+    cnopts.hostkeys = None
+    kwargs = {'cnopts': cnopts, 'port': 22}
+    assert connection_kwargs(kwargs, {'window_size': 10}) is kwargs
+    tuned = connection_kwargs(kwargs, {'ciphers': ['aes128-ctr'], 'compression': True})
+    assert tuned['port'] == 22
+    assert tuned['cnopts'].ciphers == ('aes128-ctr',)
+    assert tuned['cnopts'].compression
+    assert tuned['cnopts'].hostkeys is None
+    assert cnopts.ciphers is None and not cnopts.compression
+
+
+def test_pool_transport(sftpserver):
+    cnopts = CnOpts()
+    cnopts.hostkeys = None
+    pool = ConnectionPool(
+        lambda url: ('user1', '1234'), transport={'window_size': 4 * 1024 ** 2},
+        port=sftpserver.port, cnopts=cnopts
+    )
+    pool.set_transport('127.0.0.1', {'window_size': 1024 ** 2, 'request_size': 16384})
+    pool.set_transport('127.0.0.1', {'prefetch': False})
+    assert pool.transport('127.0.0.1') == {
+        'window_size': 4 * 1024 ** 2, 'request_size': 16384, 'prefetch': False
+    }
+    assert pool.transport('other') == {'window_size': 4 * 1024 ** 2}
+    with sftpserver.serve_content({'project1': {'a.txt': 'a' * 100000}}):
+        with pool, pool.connection('127.0.0.1') as conn:
+            assert conn._connection._transport.default_window_size == 4 * 1024 ** 2
+            with conn.open('project1/a.txt', 'rb') as f:
+                assert isinstance(f, TunedFile)
+                assert f.MAX_REQUEST_SIZE == 16384
+                f.prefetch()
+                assert f.read() == b'a' * 100000
+
+
+def test_pool_drops_broken_connections(sftpserver):
+    cnopts = CnOpts()
+    cnopts.hostkeys = None
+    pool = ConnectionPool(lambda url: ('user1', '1234'), port=sftpserver.port, cnopts=cnopts)
+    with sftpserver.serve_content({'project1': {'a.txt': 'a'}}):
+        with pool:
+            conn1 = pool.acquire('127.0.0.1')
+            conn2 = pool.acquire('127.0.0.1')
+            conn1._connection._transport.close()
+            pool.release('127.0.0.1', conn1)
+            assert pool._idle.get('127.0.0.1', []) == []
+            pool.release('127.0.0.1', conn2)
+            conn2._connection._transport.close()
+            with pool.connection('127.0.0.1') as conn:
+                assert conn._connection is not conn2._connection
+                assert conn.exists('project1/a.txt')
+            assert len(pool._idle['127.0.0.1']) == 1
+
+
+def test_progress_of_remote_files(connection, tmp_path, monkeypatch):
+    monkeypatch.setattr(stats, 'PROGRESS_INTERVAL', 0.0)
+    create_temp_file(tmp_path, 'new.txt', 'new content')
+    conn = CachedConnection(connection)
+    stream = io.StringIO()
+    with stats.TransferStats(progress=True, stream=stream):
+        loader.FileTransfer('b.txt', tmp_path, 'project1/data').download(conn)
+        loader.FileTransfer('new.txt', tmp_path, 'project1/data').upload(conn)
+    output = stream.getvalue()
+    assert '# download: project1/data/b.txt' in output
+    assert '# upload: project1/data/new.txt' in output
+    assert (tmp_path / 'b.txt').read_text() == 'bb'
+
+
+class SlowListing:
+    def __init__(self):
+        self.calls = []
+        self.release = threading.Event()
+        self.started = threading.Event()
+
+    def listdir_attr(self, path):
+        self.calls.append(path)
+        if path == 'slow':
+            self.started.set()
+            assert self.release.wait(5)
+        attr = SFTPAttributes()
+        attr.filename = 'a.txt'
+        attr.st_size = len(path)
+        return [attr]
+
+
+def test_listing_outside_lock():
+    cache = RemoteCache()
+    connection = SlowListing()
+    cache.prefetch(connection, ['fast'])
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(cache.lookup(connection, 'slow/a.txt')))
+        for _ in range(3)
+    ]
+    for thread in threads:
+        thread.start()
+    assert connection.started.wait(5)
+    # Cached and other directories are not blocked by the slow listing.
+    assert cache.lookup(connection, 'fast/a.txt')[1].st_size == 4
+    assert cache.lookup(connection, 'other/b.txt') == (True, None)
+    connection.release.set()
+    for thread in threads:
+        thread.join(5)
+    assert [attr.st_size for _, attr in results] == [4, 4, 4]
+    assert sorted(connection.calls) == ['fast', 'other', 'slow']
+
+
+def test_forget_during_listing():
+    cache = RemoteCache()
+    connection = SlowListing()
+    thread = threading.Thread(target=cache.listdir, args=(connection, 'slow'))
+    thread.start()
+    assert connection.started.wait(5)
+    cache.forget('slow')
+    connection.release.set()
+    thread.join(5)
+    cache.listdir(connection, 'slow')
+    assert connection.calls == ['slow', 'slow']
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+from pysftp import CnOpts
+
+from ftp_loader import loader, scheduler
+from ftp_loader.main import schedule_transfers
+from ftp_loader.remote import ConnectionPool
+from tests.test_loader import create_temp_file
+
+
+@pytest.fixture(scope='function')
+def file_trans(tmp_path):
+    sizes = {'a.txt': 30, 'b.txt': 10, 'c.txt': 20, 'd.txt': 10, 'e.txt': 5}
+    for name, size in sizes.items():
+        create_temp_file(tmp_path, name, 'x' * size)
+    yield [
+        loader.FileTransfer('a.txt', tmp_path, 'project1'),
+        loader.FileTransfer('b.txt', tmp_path, 'project1'),
+        loader.FileTransfer('c.txt', tmp_path, 'project1'),
+        loader.FileTransfer('d.txt', tmp_path, 'project1'),
+        loader.FileTransfer('e.txt', tmp_path, 'project1', priority=1),
+        loader.FileTransfer('f.txt', tmp_path, 'project1'),
+    ]
+
+
+def names(file_trans):
+    return [ft.name for ft in file_trans]
+
+
+@pytest.mark.parametrize('order, answer', [
+    ('index', ['e.txt', 'a.txt', 'b.txt', 'c.txt', 'd.txt', 'f.txt']),
+    ('largest', ['e.txt', 'a.txt', 'c.txt', 'b.txt', 'd.txt', 'f.txt']),
+    ('smallest', ['e.txt', 'f.txt', 'b.txt', 'd.txt', 'c.txt', 'a.txt']),
+])
+def test_schedule(file_trans, order, answer):
+    ordered = scheduler.schedule(iter(file_trans), order, scheduler.local_size)
+    assert names(ordered) == answer
+
+
+def test_is_prioritized(file_trans):
+    assert scheduler.is_prioritized(file_trans)
+    assert not scheduler.is_prioritized(file_trans[:4])
+    assert not scheduler.is_prioritized(iter(file_trans))
+
+
+@pytest.mark.parametrize('order, answer', [
+    ('largest', ['a.txt', 'c.txt', 'b.txt', 'd.txt']),
+    ('smallest', ['d.txt', 'b.txt', 'c.txt', 'a.txt']),
+])
+def test_remote_sizes(sftpserver, tmp_path, order, answer):
+    data = {'project1': {'a.txt.gz': 'a' * 300, 'b.txt.gz': 'b' * 20, 'c.txt': 'c' * 100}}
+    file_trans = [
+        loader.FileTransfer('a.txt', tmp_path, 'project1', 'gz'),
+        loader.FileTransfer('b.txt', tmp_path, 'project1', 'gz'),
+        loader.FileTransfer('c.txt', tmp_path, 'project1'),
+        loader.FileTransfer('d.txt', tmp_path, 'project1'),
+    ]
+    cnopts = CnOpts()
+    cnopts.hostkeys = None
+    with sftpserver.serve_content(data):
+        with ConnectionPool(lambda url: ('user1', '1234'), port=sftpserver.port, cnopts=cnopts) as pool:
+            ordered = schedule_transfers('localhost', iter(file_trans), pool, order)
+            assert names(ordered) == answer
+            assert len(pool.cache('localhost')._listings) == 1
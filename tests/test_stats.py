@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+import csv
+import io
+import json
+
+from ftp_loader import loader, stats
+from ftp_loader.main import compress_data
+from tests.test_loader import create_temp_file
+
+
+@pytest.fixture(scope='function')
+def file_trans(tmp_path):
+    create_temp_file(tmp_path, 'a.txt', 'a' * 1000)
+    create_temp_file(tmp_path, 'b.txt', 'b' * 3000)
+    yield [
+        loader.FileTransfer('a.txt', tmp_path, 'remote', 'gz'),
+        loader.FileTransfer('b.txt', tmp_path, 'remote', 'bz2'),
+        loader.FileTransfer('c.txt', tmp_path, 'remote', 'bz2'),
+    ]
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_codec_stats(file_trans, workers):
+    stream = io.StringIO()
+    with stats.TransferStats(progress=True, stream=stream) as collector:
+        compress_data(file_trans, True, workers)
+    records = sorted(collector.records, key=lambda r: r['name'])
+    assert [(r['phase'], r['bytes']) for r in records] == [('compress', 1000), ('compress', 3000)]
+    assert all(r['end'] >= r['start'] for r in records)
+    totals = collector.totals()
+    assert totals['compress']['files'] == 2
+    assert totals['compress']['bytes'] == 4000
+    assert stream.getvalue().count('# compress') == 2
+
+
+def test_codec_stats_without_archive(tmp_path):
+    create_temp_file(tmp_path, 'd.txt', 'd' * 1000)
+    with stats.TransferStats() as collector:
+        compress_data([loader.FileTransfer('d.txt', tmp_path, 'remote')], True)
+    assert collector.records == []
+
+
+def test_phase_size(file_trans):
+    ft = file_trans[0]
+    assert stats.phase_size(ft, 'compress') == 1000
+    assert stats.phase_size(ft, 'download') == 1000
+    ft.compress()
+    assert stats.phase_size(ft, 'download') == (ft.local_path / ft.arch_name).stat().st_size
+
+
+def test_measure_and_report(file_trans, tmp_path):
+    with stats.TransferStats() as collector:
+        with stats.measure(file_trans[0], 'upload'):
+            pass
+        with pytest.raises(loader.LoaderException):
+            with stats.measure(file_trans[2], 'upload'):
+                file_trans[2].compress()
+    stats.record(file_trans[1], 'upload', 0, 1)
+    assert len(collector.records) == 1
+    collector.save(tmp_path / 'report.json')
+    report = json.loads((tmp_path / 'report.json').read_text())
+    assert report['totals']['upload']['bytes'] == 1000
+    collector.save(tmp_path / 'report.csv')
+    with open(tmp_path / 'report.csv') as f:
+        rows = list(csv.DictReader(f))
+    assert rows[0]['phase'] == 'upload'
+    assert rows[0]['bytes'] == '1000'
+
+
+def test_save_rates(tmp_path):
+    filename = tmp_path / 'rates' / 'throughput.json'
+    assert stats.load_rates(filename) == {}
+    stats.save_rates({
+        'download': {'files': 2, 'bytes': 4 * 10 ** 6, 'seconds': 2.0, 'rate': 2.0},
+        'compress': {'files': 1, 'bytes': 1000, 'seconds': 0.1, 'rate': 0.01},
+    }, filename)
+    assert stats.load_rates(filename) == {'download': 2.0}
+    stats.save_rates({
+        'download': {'files': 1, 'bytes': 4 * 10 ** 6, 'seconds': 1.0, 'rate': 4.0},
+    }, filename)
+    assert stats.load_rates(filename) == {'download': 3.0}
+    filename.write_text('broken')
+    assert stats.load_rates(filename) == {}
+
+
+def test_progress_in_flight(monkeypatch):
+    stream = io.StringIO()
+    monkeypatch.setattr(stats, 'PROGRESS_INTERVAL', 0.0)
+    with stats.TransferStats(progress=True, stream=stream):
+        fsrc = stats.track(io.BytesIO(b'a' * 3 * 10 ** 6), 'a.bin', 'download')
+        assert isinstance(fsrc, stats.ProgressFile)
+        while fsrc.read(10 ** 6):
+            pass
+        fdst = stats.track(io.BytesIO(), 'b.bin', 'upload')
+        fdst.write(b'b' * 10 ** 6)
+    lines = stream.getvalue().splitlines()
+    assert [line.split(',')[0] for line in lines] == [
+        '  # download: a.bin 1.00 MB so far | 1.00 MB transferred',
+        '  # download: a.bin 2.00 MB so far | 2.00 MB transferred',
+        '  # download: a.bin 3.00 MB so far | 3.00 MB transferred',
+        '  # upload: b.bin 1.00 MB so far | 1.00 MB transferred',
+    ]
+    monkeypatch.setattr(stats, 'PROGRESS_INTERVAL', 3600.0)
+    stream = io.StringIO()
+    with stats.TransferStats(progress=True, stream=stream) as collector:
+        fdst = stats.track(io.BytesIO(), 'b.bin', 'upload')
+        fdst.write(b'b' * 10)
+        fdst.write(b'b' * 20)
+        assert collector._transferred == {'upload': 30}
+    assert stream.getvalue() == ''
+    with stats.TransferStats():
+        f = io.BytesIO()
+        assert stats.track(f, 'c.bin', 'upload') is f
@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+import io
+from pysftp import CnOpts
+
+from ftp_loader import throttle
+from ftp_loader.throttle import TokenBucket, RateLimiter, ThrottledFile
+from ftp_loader.main import read_config, download_data, download_stream_data
+from ftp_loader.remote import ConnectionPool
+from tests.test_main import ftp_server1, config1
+
+
+class Clock:
+    def __init__(self):
+        self.time = 0.0
+
+    def __call__(self):
+        return self.time
+
+
+@pytest.mark.parametrize('rate, burst, sizes, delays', [
+    (100, None, [50, 50, 50], [0, 0, 0.5]),
+    (100, 200, [150, 100], [0, 0.5]),
+    (100, None, [300], [2.0]),
+])
+def test_token_bucket(rate, burst, sizes, delays):
+    bucket = TokenBucket(rate, burst, clock=Clock())
+    assert [bucket.reserve(s) for s in sizes] == pytest.approx(delays)
+
+
+def test_token_bucket_refill():
+    clock = Clock()
+    bucket = TokenBucket(100, clock=clock)
+    assert bucket.reserve(150) == pytest.approx(0.5)
+    clock.time = 0.5
+    assert bucket.reserve(50) == pytest.approx(0.5)
+    clock.time = 10
+    assert bucket.reserve(100) == 0
+
+
+@pytest.mark.parametrize('adaptive, latencies, rate', [
+    (False, [1, 5, 5], 1000),
+    (True, [1, 5], 700),
+    (True, [1, 5, 5], 490),
+    (True, [1, 5, 1, 1], 800),
+    (True, [1] + [5] * 20, 100),
+])
+def test_token_bucket_adapt(adaptive, latencies, rate):
+    bucket = TokenBucket(1000, adaptive=adaptive, clock=Clock())
+    for latency in latencies:
+        bucket.adapt(latency)
+    assert bucket.rate == pytest.approx(rate)
+
+
+def test_rate_limiter():
+    clock = Clock()
+    limiter = RateLimiter(TokenBucket(100, clock=clock), None, TokenBucket(50, clock=clock))
+    assert limiter
+    assert limiter.reserve(100) == pytest.approx(1.0)
+    assert not RateLimiter(None)
+    assert RateLimiter().reserve(100) == 0
+
+
+class FakeLimiter:
+    def __init__(self):
+        self.consumed = []
+
+    def consume(self, size):
+        self.consumed.append(size)
+
+    def adapt(self, latency):
+        pass
+
+
+class FakeFile(io.BytesIO):
+    MAX_REQUEST_SIZE = 3
+
+    def __init__(self, data):
+        super().__init__(data)
+        self.batches = []
+
+    def readv(self, chunks):
+        self.batches.append(chunks)
+        for offset, length in chunks:
+            yield self.getvalue()[offset:offset + length]
+
+
+def test_throttled_file():
+    limiter = FakeLimiter()
+    f = ThrottledFile(FakeFile(b'0123456789'), limiter, prefetch=False)
+    f.prefetch(10)
+    assert f.read(4) == b'0123'
+    assert f.read() == b'456789'
+    assert f.tell() == 10
+    f.write(b'abc')
+    assert limiter.consumed == [4, 6, 3]
+    with f:
+        pass
+    assert f.closed
+
+
+def test_throttled_read_ahead():
+    limiter = FakeLimiter()
+    raw = FakeFile(b'0123456789')
+    f = ThrottledFile(raw, limiter, requests=2)
+    f.seek(1)
+    f.prefetch(10)
+    assert f.read(4) == b'1234'
+    assert f.tell() == 5
+    assert f.read() == b'56789'
+    assert f.read(1) == b''
+    assert limiter.consumed == [6, 3]
+    assert raw.batches == [[(1, 3), (4, 3)], [(7, 3)]]
+    f.seek(2)
+    assert f.read(3) == b'234'
+    assert limiter.consumed == [6, 3, 3]
+
+
+@pytest.mark.parametrize('limit_rate, conn_limit_rate', [(10, None), (None, 10), (1000, 10)])
+@pytest.mark.parametrize('transfer', [download_data, download_stream_data])
+def test_limited_download(ftp_server1, config1, tmp_path, monkeypatch, limit_rate,
+                          conn_limit_rate, transfer):
+    delays = []
+    monkeypatch.setattr(throttle.time, 'sleep', delays.append)
+    cnopts = CnOpts()
+    cnopts.hostkeys = None
+    url, file_trans = read_config(tmp_path / 'ftp-config.toml')
+    with ConnectionPool(
+            limit_rate=limit_rate, conn_limit_rate=conn_limit_rate,
+            port=ftp_server1.port, cnopts=cnopts
+    ) as pool:
+        pool.set_credentials(url, 'user1', '1234')
+        done = transfer(url, 'user1', '1234', file_trans, True, 2, pool=pool)
+    assert done == file_trans
+    assert delays
+    name = 'file21.csv' if transfer is download_stream_data else 'file21.csv.gz'
+    assert (tmp_path / 'work2/cont2' / name).exists()
+    assert (tmp_path / 'work2/container2.txt').read_text() == 'Container2 content'